@@ -1,106 +1,291 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
-from scipy.interpolate import interp1d
-
-# Import functions from other modules
-from data_loader import load_data, preprocess_data_for_viz
-from bp_visualization import plot_bp_visualization
-from cholesterol_visualization import plot_cholesterol_visualization
-from angina_visualization import plot_angina_visualization
-from ecg_visualization import plot_ecg_visualization
+import os
+import json
+
+# Import functions from other modules; chart modules are imported by the registry on first use
+from data_loader import load_data, preprocess_data_for_viz, shared_dataset, source_signature
+from streaming import load_streamed_cohorts
+from live_data import live_dataset, live_status
+from comparison import COMPARE_PATHS, build_difference_figure, dataset_labels, load_comparison
+from partitions import AGE_RANGE, dataset_filters, load_partitioned_cohorts, partitioned_dataset
+from schema import CATEGORICAL_COLUMNS
+from render_cache import PREVIEW_PNG_OPTIONS, chart_to_json, figure_to_png, get_render_cache, render_key
+from precompute import get_scheduler
+from visualizations import VISUALIZATIONS, start_warm_up
+from thresholds import DEFAULT_THRESHOLDS, with_thresholds
+import profiling
+from profiling import span
 
 # --- Page Configuration ---
 st.set_page_config(layout="wide", page_title="Heart Failure Analysis")
 st.title("Heart Failure Analysis Dashboard")
 
+# The toggle only shows this session's spans (recording for the whole process is set up with
+# HEART_PROFILE); it is drawn at the bottom of the sidebar but read first, so the whole run is collected
+profiling.begin_run(st.session_state.get("profile_stages", profiling.is_enabled()))
+
 # --- Load and Prepare Data ---
-# Attempt to load data using the loader function
-# Provide a default path or let the user upload
-df_raw = load_data() # You might need to adjust the default path inside load_data
-
-if df_raw is not None:
-    # Preprocess data once and reuse
-    (df, diseased_data, healthy_data,
-     abnormal_bp_healthy, abnormal_bp_diseased,
-     normal_bp_healthy, normal_bp_diseased,
-     abnormal_cls_healthy, abnormal_cls_diseased,
-     normal_cls_healthy, normal_cls_diseased,
-     male_abnormal_cls_healthy_pct, female_abnormal_cls_healthy_pct,
-     male_abnormal_cls_diseased_pct, female_abnormal_cls_diseased_pct,
-     resting_ecg_normal_bp_dis, resting_ecg_st_bp_dis, resting_ecg_lvh_bp_dis,
-     male_normal_ecg_pct, female_normal_ecg_pct,
-     male_st_ecg_pct, female_st_ecg_pct,
-     male_lvh_ecg_pct, female_lvh_ecg_pct
-     ) = preprocess_data_for_viz(df_raw)
-
-    if df is not None:
-        # --- Sidebar Controls ---
-        st.sidebar.header("Visualization Options")
-        viz_choice = st.sidebar.selectbox(
-            "Choose Visualization:",
-            ["Blood Pressure vs Age", "Cholesterol vs Age", "Angina vs Max HR", "Resting ECG vs BP"]
+# A heart.csv file, or a directory of (optionally hive-partitioned) Parquet or CSV files
+DATA_PATH = os.environ.get("HEART_DATA_PATH", "input/heart.csv")
+st.sidebar.header("Data Options")
+data_mode = st.sidebar.radio(
+    "Data Loading Mode",
+    ["In-memory", "Streaming (aggregates only)"],
+    help="Streaming reads the CSV in chunks and keeps only binned aggregates, for files too large to hold in memory."
+)
+compare = len(COMPARE_PATHS) > 1 and st.sidebar.checkbox(
+    "Compare datasets",
+    help="Loads the datasets listed in HEART_COMPARE_PATHS side by side, in parallel worker processes."
+)
+watch = not compare and os.path.isfile(DATA_PATH) and st.sidebar.checkbox(
+    "Watch for appended rows",
+    help="Folds rows appended to the file into the loaded data as they arrive and refreshes the charts."
+)
+
+# Where background workers can load the same dataset from (None for uploads)
+data_source = None
+comparison = None
+if compare:
+    # Every dataset is loaded and preprocessed in its own worker; the first one chosen is the
+    # reference of the difference maps and of the sidebar summaries
+    labels = dataset_labels(COMPARE_PATHS)
+    chosen = st.sidebar.multiselect("Datasets", list(labels), default=list(labels))
+    comparison_view = st.sidebar.radio(
+        "Comparison View", ["Aligned panels", "Difference maps"],
+        help="Difference maps subtract the reference dataset's densities from each other dataset's, cell by cell."
+    )
+    cohorts = None
+    if chosen:
+        with span("load_data"):
+            comparison = load_comparison({label: labels[label] for label in chosen},
+                                         streamed=data_mode == "Streaming (aggregates only)")
+        cohorts = comparison.datasets[0].cohorts
+        st.sidebar.caption(f"{len(comparison.datasets)} datasets loaded in {comparison.seconds:.1f} s "
+                           f"({comparison.worker_seconds:.1f} s of loading and preprocessing in workers)")
+elif os.path.isdir(DATA_PATH):
+    # Filters are pushed down into the scan, so files, row groups and rows that do not match
+    # are never read
+    dataset = partitioned_dataset(DATA_PATH)
+    st.sidebar.subheader("Dataset Filters")
+    age_range = st.sidebar.slider("Age Range", *AGE_RANGE, AGE_RANGE)
+    sexes = st.sidebar.multiselect("Sex", CATEGORICAL_COLUMNS["Sex"], default=CATEGORICAL_COLUMNS["Sex"])
+    partitions = {key: st.sidebar.multiselect(key.replace("_", " ").title(), values, default=values)
+                  for key, values in dataset.partitions.items()}
+    filters = dataset_filters(age_range, sexes, partitions, available=dataset.partitions)
+    streamed = data_mode == "Streaming (aggregates only)"
+    with span("load_data"):
+        cohorts = load_partitioned_cohorts(dataset, filters, streamed)
+    data_source = ("partitioned", DATA_PATH, filters, streamed)
+    matched = cohorts.n_rows
+    st.sidebar.caption(f"Partitioned dataset: {dataset.file_count(filters)} of {len(dataset.dataset.files)} "
+                       f"files scanned, {matched:,} rows matched")
+    if not matched:
+        st.warning("No rows match the dataset filters.")
+elif watch:
+    # Appended rows are parsed and folded into the cached cohorts by the watcher. Charts are
+    # rendered here, as background workers would have to re-read the whole file per version.
+    live = live_dataset(DATA_PATH)
+    with span("load_data"):
+        version, cohorts = live.current(streamed=data_mode == "Streaming (aggregates only)")
+    with st.sidebar:
+        live_status(live, version)
+elif data_mode == "Streaming (aggregates only)" and os.path.exists(DATA_PATH):
+    with span("load_data"):
+        cohorts = load_streamed_cohorts(DATA_PATH)
+    data_source = ("streamed", DATA_PATH)
+else:
+    # Attempt to load data using the loader function
+    # Provide a default path or let the user upload
+    with span("load_data"):
+        df_raw = load_data(DATA_PATH)
+    # Cohort subsets and percentages are computed lazily, only for the chart shown
+    if os.path.exists(DATA_PATH):
+        fingerprint = f"{DATA_PATH}:{source_signature(DATA_PATH)}"
+    else:
+        # Uploads are identified by their content hash
+        fingerprint = df_raw.attrs.get("fingerprint") if df_raw is not None else None
+    with span("preprocess"):
+        cohorts = preprocess_data_for_viz(df_raw, fingerprint=fingerprint)
+    if os.path.exists(DATA_PATH):
+        data_source = ("typed", DATA_PATH)
+        dataset = shared_dataset(DATA_PATH)
+        st.sidebar.caption(f"Shared dataset: {len(dataset.df):,} rows, {dataset.nbytes / 2**20:.2f} MB "
+                           f"{'memory-mapped' if dataset.mapped else 'in memory'}, "
+                           f"{dataset.session_count()} session(s) attached")
+
+if cohorts is not None:
+    # --- Sidebar Controls ---
+    st.sidebar.header("Visualization Options")
+    viz_choice = st.sidebar.selectbox(
+        "Choose Visualization:",
+        list(VISUALIZATIONS)
+    )
+    visualization = VISUALIZATIONS[viz_choice]
+
+    st.sidebar.markdown("---")
+    st.sidebar.header("Plot Parameters")
+
+    # Common parameters
+    kde_shade = st.sidebar.checkbox("Shade KDE Plots", value=True)
+    scatter_alpha = st.sidebar.slider("Scatter Point Alpha", 0.1, 1.0, 0.4, 0.05)
+    kde_bw = st.sidebar.slider("KDE Bandwidth Adjustment", 0.1, 5.0, 1.0, 0.1) # General KDE BW Adjust
+
+    # Specific parameters if needed (e.g., Angina interpolation)
+    interpolation_kind = 'cubic'
+    if "interpolation_kind" in visualization.params:
+        interpolation_kind = st.sidebar.selectbox(
+            "Interpolation Method (Angina Plot)",
+            ['linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic'],
+            index=5 # Default to cubic
         )
+    confidence_bands = False
+    if "confidence_bands" in visualization.params:
+        confidence_bands = st.sidebar.checkbox(
+            "Bootstrap Confidence Bands (Angina Plot)", value=False,
+            help="Shades 95% bootstrap confidence bands around the mean Max HR lines."
+        )
+    renderer = st.sidebar.radio(
+        "Rendering",
+        ["Server (matplotlib)", "Browser (Vega-Lite)"],
+        help="Browser rendering sends binned aggregates and draws them client-side, with pan/zoom and a live scatter alpha slider."
+    )
+    browser_rendering = renderer == "Browser (Vega-Lite)"
+    precompute = st.sidebar.checkbox("Precompute other charts in background", value=True, disabled=browser_rendering)
+    progressive = st.sidebar.checkbox("Progressive rendering", value=True, disabled=browser_rendering,
+                                      help="Shows a quick low-resolution preview while the full-quality chart renders.")
+
+    # --- Clinical Thresholds ---
+    st.sidebar.markdown("---")
+    st.sidebar.header("Clinical Thresholds")
+    bp_low, bp_high = st.sidebar.slider("Normal BP Range (mmHg)", 80, 210,
+                                        (DEFAULT_THRESHOLDS["bp_low"], DEFAULT_THRESHOLDS["bp_high"]))
+    cholesterol_high = st.sidebar.slider("High Cholesterol Above (mg/dL)", 100, 400, DEFAULT_THRESHOLDS["cholesterol_high"])
+    bp_thresholds = dict(bp_low=bp_low, bp_high=bp_high)
+    cholesterol_thresholds = dict(cholesterol_high=cholesterol_high)
+    # Threshold splits are binary searches on per-cohort indexes, so these counts stay
+    # interactive while a slider is dragged
+    compared = comparison.datasets if comparison is not None else [None]
+    for dataset in compared:
+        with span("thresholds"):
+            split = with_thresholds(cohorts if dataset is None else dataset.cohorts,
+                                    {**bp_thresholds, **cholesterol_thresholds})
+            split_lines = [f"{label}: {split.size(name):,} ({split.sex_pct(name, 'M'):.1f}% male)"
+                           for label, name in [("Normal BP, healthy", "normal_bp_healthy"),
+                                               ("Normal BP, diseased", "normal_bp_diseased"),
+                                               ("High cholesterol, healthy", "abnormal_cls_healthy"),
+                                               ("High cholesterol, diseased", "abnormal_cls_diseased")]]
+        st.sidebar.caption("  \n".join(split_lines if dataset is None else [f"**{dataset.label}**", *split_lines]))
+
+    # Parameters each chart uses; they also make up the chart's render cache key
+    controls = dict(kde_bw_adjust=kde_bw, scatter_alpha=scatter_alpha, kde_shade=kde_shade,
+                    interpolation_kind=interpolation_kind, confidence_bands=confidence_bands,
+                    thresholds={**bp_thresholds, **cholesterol_thresholds})
+    chart_params = {viz: VISUALIZATIONS[viz].chart_params(controls) for viz in VISUALIZATIONS}
+
+    # --- Display Selected Visualization ---
+    st.header(viz_choice)
+    st.markdown(visualization.describe(controls["thresholds"]))
+
+    # Rendered charts are cached per process. When the dataset can be reloaded from disk, all
+    # charts for the current parameters are rendered in a background process pool,
+    # the selected one first; otherwise the selected chart is rendered here. Browser-rendered
+    # charts are cached as their Vega-Lite spec and built here, as they only need aggregates.
+    # Uncached server-rendered charts show a low-resolution preview until the full render is ready.
+    render_cache = get_render_cache()
+    scheduler = get_scheduler()
+    params = chart_params[viz_choice]
 
-        st.sidebar.markdown("---")
-        st.sidebar.header("Plot Parameters")
-
-        # Common parameters
-        kde_shade = st.sidebar.checkbox("Shade KDE Plots", value=True)
-        scatter_alpha = st.sidebar.slider("Scatter Point Alpha", 0.1, 1.0, 0.4, 0.05)
-        kde_bw = st.sidebar.slider("KDE Bandwidth Adjustment", 0.1, 5.0, 1.0, 0.1) # General KDE BW Adjust
-
-        # Specific parameters if needed (e.g., Angina interpolation)
-        interpolation_kind = 'cubic'
-        if viz_choice == "Angina vs Max HR":
-            interpolation_kind = st.sidebar.selectbox(
-                "Interpolation Method (Angina Plot)",
-                ['linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic'],
-                index=5 # Default to cubic
-            )
-
-
-        # --- Display Selected Visualization ---
-        st.header(viz_choice)
-
-        if viz_choice == "Blood Pressure vs Age":
-            st.markdown("Comparing Resting Blood Pressure against Age for Healthy and Diseased individuals. The dashed lines indicate a 'normal' BP range (115-155 mmHg).")
-            plot_bp_visualization(healthy_data, diseased_data,
-                                  abnormal_bp_healthy, abnormal_bp_diseased,
-                                  normal_bp_healthy, normal_bp_diseased,
-                                  kde_bw_adjust=kde_bw, scatter_alpha=scatter_alpha, kde_shade=kde_shade)
-
-        elif viz_choice == "Cholesterol vs Age":
-            st.markdown("Comparing Cholesterol levels against Age for Healthy and Diseased individuals, broken down by sex in the top plots. The dashed line indicates the threshold for 'high' cholesterol (> 200 mg/dL). Note: Cholesterol values of 0 are plotted but excluded from KDE calculations.")
-            plot_cholesterol_visualization(healthy_data, diseased_data,
-                                           abnormal_cls_healthy, abnormal_cls_diseased,
-                                           normal_cls_healthy, normal_cls_diseased,
-                                           male_abnormal_cls_healthy_pct, female_abnormal_cls_healthy_pct,
-                                           male_abnormal_cls_diseased_pct, female_abnormal_cls_diseased_pct,
-                                           kde_bw_adjust=kde_bw, scatter_alpha=scatter_alpha, kde_shade=kde_shade)
-
-        elif viz_choice == "Angina vs Max HR":
-            st.markdown("Analyzing the relationship between Maximum Heart Rate (MaxHR) and Age for Diseased patients, comparing those with and without Exercise-Induced Angina. Smaller plots show trends broken down by Chest Pain Type (TA, ATA, NAP, ASY).")
-            plot_angina_visualization(diseased_data, interpolation_kind=interpolation_kind)
-
-        elif viz_choice == "Resting ECG vs BP":
-            st.markdown("Comparing Resting Blood Pressure against Age for Diseased individuals, categorized by their Resting ECG results (Normal, ST, LVH). Top plots show age distribution by sex for each ECG category.")
-            plot_ecg_visualization(diseased_data,
-                                   resting_ecg_normal_bp_dis, resting_ecg_st_bp_dis, resting_ecg_lvh_bp_dis,
-                                   male_normal_ecg_pct, female_normal_ecg_pct,
-                                   male_st_ecg_pct, female_st_ecg_pct,
-                                   male_lvh_ecg_pct, female_lvh_ecg_pct,
-                                   kde_bw_adjust=kde_bw, scatter_alpha=scatter_alpha, kde_shade=kde_shade)
-
-        # --- Optional: Display Raw Data ---
-        if st.sidebar.checkbox("Show Raw Data Sample"):
-            st.subheader("Raw Data Sample")
-            st.dataframe(df.head())
+    def show_chart(cohorts, keys):
+        """Shows the selected chart of ``cohorts``, whose render cache keys per chart are ``keys``."""
+        if browser_rendering:
+            spec_key = ("vega-lite",) + keys[viz_choice]
+            with span("render"):
+                spec = render_cache.get(spec_key)
+                if spec is None:
+                    with span("figure.build"):
+                        chart = visualization.build_chart(cohorts, **params)
+                    if chart is not None:
+                        spec = chart_to_json(chart)
+                        render_cache.put(spec_key, spec)
+            if spec is not None:
+                st.vega_lite_chart(json.loads(spec), use_container_width=True)
+            else:
+                st.warning(f"No diseased data available for the {viz_choice} visualization.")
+            return
+        placeholder = st.empty()
+        if progressive and not render_cache.peek(keys[viz_choice]):
+            with span("preview"):
+                preview = visualization.build_figure(cohorts, preview=True, **params)
+                if preview is not None:
+                    placeholder.image(figure_to_png(preview, PREVIEW_PNG_OPTIONS), width="stretch")
+        with span("render"):
+            png = scheduler.result(keys[viz_choice], lambda: visualization.build_figure(cohorts, **params))
+        if png is not None:
+            placeholder.image(png, width="stretch")
+        else:
+            placeholder.warning(f"No diseased data available for the {viz_choice} visualization.")
 
+    if comparison is None:
+        keys = {viz: render_key(viz, cohorts.fingerprint, **params) for viz, params in chart_params.items()}
+        if data_source is not None and precompute and not browser_rendering:
+            jobs = {viz: (keys[viz], chart_params[viz]) for viz in keys}
+            scheduler.schedule(data_source, cohorts.fingerprint, jobs, foreground=viz_choice)
+        show_chart(cohorts, keys)
+    elif comparison_view == "Difference maps":
+        # Densities of every dataset share one grid and one bandwidth per panel, so they are subtracted cell by cell
+        key = render_key(f"Difference: {viz_choice}", comparison.fingerprint, kde_bw_adjust=kde_bw,
+                         thresholds=params.get("thresholds"))
+        with span("render"):
+            png = render_cache.get_or_render(key, lambda: build_difference_figure(
+                comparison, visualization, kde_bw, params.get("thresholds")))
+        if png is not None:
+            st.image(png, width="stretch")
+        else:
+            st.info("Choose at least two datasets for difference maps.")
     else:
-        st.error("Failed to preprocess data. Cannot display visualizations.")
+        # Each dataset's chart is drawn with the same parameters on the same fixed axes, so
+        # the panels line up; all of them are rendered in the background pool at once
+        dataset_keys = [{viz: render_key(viz, dataset.cohorts.fingerprint, **params) for viz, params in chart_params.items()}
+                        for dataset in comparison.datasets]
+        if precompute and not browser_rendering:
+            scheduler.schedule_sources([(dataset.source, dataset.cohorts.fingerprint,
+                                         {viz: (keys[viz], chart_params[viz]) for viz in keys})
+                                        for dataset, keys in zip(comparison.datasets, dataset_keys)],
+                                       foreground=viz_choice)
+        for dataset, keys in zip(comparison.datasets, dataset_keys):
+            st.subheader(f"{dataset.label} ({dataset.n_rows:,} rows)")
+            show_chart(dataset.cohorts, keys)
+    # With the selected chart on screen, import the other charts' modules in the background
+    start_warm_up(browser_rendering)
+
+    stats = render_cache.stats()
+    st.sidebar.caption(f"Render cache: {stats['hits']} hits, {stats['misses']} misses, "
+                       f"{stats['entries']} charts ({stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MB), "
+                       f"{scheduler.pending()} queued")
+
+    # --- Optional: Display Raw Data ---
+    if st.sidebar.checkbox("Show Raw Data Sample"):
+        st.subheader("Raw Data Sample")
+        st.dataframe(cohorts.head())
 
 else:
     # This message is shown if load_data returns None (e.g., file not found and not uploaded)
     st.info("Please upload the 'heart.csv' dataset using the file uploader above to view the visualizations.")
+
+# --- Stage Profiling ---
+st.sidebar.markdown("---")
+st.sidebar.checkbox("Profile stages", key="profile_stages", value=profiling.is_enabled(),
+                    help="Shows this session's per-stage wall/CPU time (and allocations, with "
+                         "HEART_PROFILE_ALLOCATIONS=1). Start with HEART_PROFILE=1 to log every session's spans to "
+                         f"{profiling.LOG_PATH} and write a Prometheus snapshot to {profiling.METRICS_PATH}.")
+stage_spans = profiling.end_run()
+if stage_spans:
+    with st.sidebar.expander("Stage breakdown (this run)", expanded=True):
+        st.dataframe(
+            [{"stage": "\u2003" * s["depth"] + s["stage"], "wall ms": round(s["wall_s"] * 1000, 1),
+              "cpu ms": round(s["cpu_s"] * 1000, 1),
+              "alloc KB": None if s["alloc_bytes"] is None else round(s["alloc_bytes"] / 1024, 1)}
+             # Spans are recorded as they finish; start order nests them under their parents
+             for s in sorted(stage_spans, key=lambda s: s["ts"])],
+            hide_index=True,
+        )
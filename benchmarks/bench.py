@@ -0,0 +1,219 @@
+"""Scaling benchmarks for loading, preprocessing and chart rendering.
+
+Each dataset size runs in a fresh subprocess so that peak RSS figures are not polluted by
+earlier sizes. Results are written as JSON and can be compared against stored baselines.
+
+Examples:
+    python -m benchmarks.bench --sizes 1k 10k 100k
+    python -m benchmarks.bench --sizes 1k 10k 100k --compare benchmarks/baselines.json
+    python -m benchmarks.bench --sizes 1k 10k 100k --output benchmarks/baselines.json
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+DEFAULT_SIZES = ["1k", "10k", "100k", "1m"]
+
+# Comparisons flag a stage when it is slower/larger than baseline by more than the
+# relative tolerance *and* by more than the absolute floor (which absorbs timer noise).
+TIME_TOLERANCE, TIME_FLOOR_S = 1.5, 0.05
+MEMORY_TOLERANCE, MEMORY_FLOOR_MB = 1.25, 20
+
+CHART_PARAMS = {
+    "bp": dict(kde_bw_adjust=1.0, scatter_alpha=0.4, kde_shade=True),
+    "cholesterol": dict(kde_bw_adjust=1.0, scatter_alpha=0.4, kde_shade=True),
+    "angina": dict(interpolation_kind="cubic"),
+    "ecg": dict(kde_bw_adjust=1.0, scatter_alpha=0.4, kde_shade=True),
+}
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1m' -> 1000000."""
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    suffix = text[-1].lower()
+    if suffix in multipliers:
+        return int(float(text[:-1]) * multipliers[suffix])
+    return int(text)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def dataset_path(n_rows, seed):
+    from benchmarks.synthetic import write_csv
+    path = os.path.join(DATA_DIR, f"heart_{n_rows}_{seed}.csv")
+    if not os.path.exists(path):
+        write_csv(n_rows, path, seed=seed)
+    return path
+
+
+# --- Worker (one dataset size per process) ---
+def warm_up_matplotlib(figure_to_png):
+    """Renders a throwaway figure so font, colormap and backend setup is not billed to the first chart."""
+    import numpy as np
+    from matplotlib.figure import Figure
+    fig = Figure()
+    ax = fig.subplots()
+    grid = np.outer(np.linspace(0, 1, 8), np.linspace(0, 1, 8))
+    ax.imshow(grid)
+    ax.contourf(grid)
+    ax.scatter([0, 1], [0, 1])
+    ax.set_title("warm-up")
+    ax.legend(["warm-up"])
+    figure_to_png(fig)
+
+
+def run_stages(csv_path):
+    """Times each pipeline stage on one file; returns {"stages": ..., "objects": ...}."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from data_loader import COHORTS, CohortBundle, load_typed, sidecar_path
+    from bootstrap import BAND_PARTS
+    from render_cache import figure_to_png
+    from streaming import stream_cohorts
+    from bp_visualization import build_bp_figure
+    from cholesterol_visualization import build_cholesterol_figure
+    from angina_visualization import build_angina_figure
+    from ecg_visualization import build_ecg_figure
+
+    warm_up_matplotlib(figure_to_png)
+    stages = {}
+
+    def stage(name, func):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        result = func()
+        stages[name] = {"seconds": time.perf_counter() - start_wall, "cpu_seconds": time.process_time() - start_cpu,
+                        "peak_rss_mb": peak_rss_mb()}
+        return result
+
+    if os.path.exists(sidecar_path(csv_path)):
+        os.remove(sidecar_path(csv_path))
+    stage("load_csv", lambda: load_typed(csv_path))
+    df = stage("load_sidecar", lambda: load_typed(csv_path))
+
+    def preprocess():
+        bundle = CohortBundle(df)
+        for name in COHORTS:
+            bundle.rows(name)
+            bundle.sex_pct(name, "M")
+        return bundle
+    cohorts = stage("preprocess", preprocess)
+    stage("bootstrap_bands", lambda: [cohorts.maxhr_band(name, "cubic") for name in BAND_PARTS])
+
+    builders = {"bp": build_bp_figure, "cholesterol": build_cholesterol_figure,
+                "angina": build_angina_figure, "ecg": build_ecg_figure}
+    for chart, build in builders.items():
+        stage(f"plot_{chart}", lambda: figure_to_png(build(cohorts, **CHART_PARAMS[chart])))
+
+    streamed = stage("stream", lambda: stream_cohorts(csv_path))
+    objects = {
+        "rows": len(df),
+        "frame_mb": df.memory_usage(deep=True).sum() / 2**20,
+        "frame_pickle_mb": len(pickle.dumps(df)) / 2**20, # What st.cache_data stores per entry
+        "streamed_pickle_mb": len(pickle.dumps(streamed)) / 2**20,
+    }
+    return {"stages": stages, "objects": objects}
+
+
+# --- Driver ---
+def run(sizes, seed=0):
+    results = {}
+    for size in sizes:
+        n_rows = parse_size(size)
+        csv_path = dataset_path(n_rows, seed)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            out_path = tmp.name
+        try:
+            subprocess.run([sys.executable, "-m", "benchmarks.bench", "--worker", csv_path, "--worker-output", out_path],
+                           check=True, cwd=os.path.dirname(BENCH_DIR))
+            with open(out_path) as f:
+                results[str(n_rows)] = json.load(f)
+        finally:
+            os.remove(out_path)
+        print(format_size_result(n_rows, results[str(n_rows)]))
+    return {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpu_count": os.cpu_count(), "seed": seed},
+        "results": results,
+    }
+
+
+def format_size_result(n_rows, result):
+    lines = [f"{n_rows:,} rows"]
+    for name, metrics in result["stages"].items():
+        lines.append(f"  {name:<16} {metrics['seconds']:8.3f}s  peak {metrics['peak_rss_mb']:8.1f} MB")
+    objects = result["objects"]
+    lines.append(f"  frame {objects['frame_mb']:.1f} MB in memory, {objects['frame_pickle_mb']:.1f} MB pickled; "
+                 f"streamed aggregates {objects['streamed_pickle_mb']:.1f} MB")
+    return "\n".join(lines)
+
+
+def compare(current, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """Returns a list of regression messages for sizes present in both result sets."""
+    regressions = []
+    for size, result in current["results"].items():
+        base = baseline["results"].get(size)
+        if base is None:
+            continue
+        for name, metrics in result["stages"].items():
+            base_metrics = base["stages"].get(name)
+            if base_metrics is None:
+                continue
+            seconds, base_seconds = metrics["seconds"], base_metrics["seconds"]
+            if seconds > base_seconds * time_tolerance and seconds - base_seconds > TIME_FLOOR_S:
+                regressions.append(f"{size} rows / {name}: {seconds:.3f}s vs baseline {base_seconds:.3f}s")
+            rss, base_rss = metrics["peak_rss_mb"], base_metrics["peak_rss_mb"]
+            if rss > base_rss * memory_tolerance and rss - base_rss > MEMORY_FLOOR_MB:
+                regressions.append(f"{size} rows / {name}: peak {rss:.1f} MB vs baseline {base_rss:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark how the dashboard pipeline scales with row count.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Row counts, e.g. 1k 100k 10m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "latest.json"))
+    parser.add_argument("--compare", help="Baseline JSON to check the results against")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        with open(args.worker_output, "w") as f:
+            json.dump(run_stages(args.worker), f)
+        return 0
+
+    current = run(args.sizes, seed=args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.time_tolerance, args.memory_tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""Concurrent-session load test for the dashboard.
+
+Drives app.py headlessly with Streamlit's AppTest: every simulated session is a thread with
+its own AppTest (its own session state), while caches, the render cache and the background
+render pool are shared process-wide, as they are between the sessions of one Streamlit
+server. After a first (cold) run, each session reruns the app through a seeded script of
+chart switches and slider moves. Each concurrency level runs in a fresh subprocess, so caches
+and peak RSS start from scratch. Reported per level: rerun latency percentiles, throughput,
+errors, server and render-worker memory and, with --stages, where concurrent sessions wait
+(stage wall time not spent on the session's own CPU, e.g. on locks or the GIL).
+
+Examples:
+    python -m benchmarks.loadtest --sessions 1 4 8 --rows 100k
+    python -m benchmarks.loadtest --sessions 8 --reruns 50 --mode streaming --stages
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench import BENCH_DIR, dataset_path, parse_size, peak_rss_mb
+
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_SESSIONS = [1, 4, 8]
+PERCENTILES = (50, 95, 99)
+MEMORY_SAMPLE_S = 0.1
+
+DATA_MODES = {"in-memory": "In-memory", "streaming": "Streaming (aggregates only)"}
+
+# Scripted actions and how often each is picked
+ACTIONS = {"chart": 4, "alpha": 2, "bandwidth": 2, "bp_range": 1, "cholesterol": 1}
+
+
+# --- Memory ---
+def rss_mb(pid="self"):
+    """Current resident set size of a process in MB (None where /proc is unavailable)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of this process and of its render workers while sessions run."""
+
+    def __init__(self, interval=MEMORY_SAMPLE_S):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.server = []
+        self.workers = []
+        self._done = threading.Event()
+
+    def run(self):
+        import multiprocessing
+        while not self._done.wait(self.interval):
+            server = rss_mb()
+            if server is None:
+                return
+            self.server.append(server)
+            self.workers.append(sum(rss_mb(child.pid) or 0 for child in multiprocessing.active_children()))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# --- Sessions (one concurrency level per process) ---
+def share_test_runtime():
+    """Installs one mock Streamlit runtime for all sessions of this process.
+
+    AppTest installs a fresh one for every run and removes it when the run ends, which would
+    pull it from under other sessions' runs still in progress; it is given a stand-in Runtime
+    class to do that on instead.
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    app_test.Runtime = type("Runtime", (), {"_instance": runtime})
+
+
+def widget(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def apply_action(at, rng, action):
+    """Makes one scripted change to a session's controls; returns a short description."""
+    sidebar = at.sidebar
+    if action == "chart":
+        select = widget(sidebar.selectbox, "Choose Visualization:")
+        value = rng.choice([option for option in select.options if option != select.value])
+        select.set_value(value)
+    elif action == "alpha":
+        value = round(rng.uniform(0.1, 1.0), 2)
+        widget(sidebar.slider, "Scatter Point Alpha").set_value(value)
+    elif action == "bandwidth":
+        value = round(rng.uniform(0.1, 5.0), 1)
+        widget(sidebar.slider, "KDE Bandwidth Adjustment").set_value(value)
+    elif action == "bp_range":
+        low = rng.randrange(80, 140)
+        value = (low, rng.randrange(low + 10, 211))
+        widget(sidebar.slider, "Normal BP Range (mmHg)").set_value(value)
+    else:
+        value = rng.randrange(100, 401)
+        widget(sidebar.slider, "High Cholesterol Above (mg/dL)").set_value(value)
+    return f"{action}={value}"
+
+
+def run_session(index, options, start, results):
+    from streamlit.testing.v1 import AppTest
+    rng = random.Random(options["seed"] * 1_000 + index)
+    record = results[index] = {"cold_s": None, "reruns": [], "errors": []}
+    start.wait()
+    try:
+        at = AppTest.from_file(os.path.join(REPO_DIR, "app.py"), default_timeout=options["timeout"])
+        began = time.perf_counter()
+        at.run()
+        # Controls the session keeps are set on its first run, before the scripted reruns
+        if options["mode"] != "in-memory" or not options["precompute"]:
+            widget(at.sidebar.radio, "Data Loading Mode").set_value(DATA_MODES[options["mode"]])
+            if not options["precompute"]:
+                widget(at.sidebar.checkbox, "Precompute other charts in background").uncheck()
+            at.run()
+        record["cold_s"] = time.perf_counter() - began
+        actions, weights = zip(*ACTIONS.items())
+        for _ in range(options["reruns"]):
+            if options["think_s"]:
+                time.sleep(rng.uniform(0, 2 * options["think_s"]))
+            step = apply_action(at, rng, rng.choices(actions, weights)[0])
+            began = time.perf_counter()
+            at.run()
+            record["reruns"].append(time.perf_counter() - began)
+            record["errors"] += [f"{step}: {e.value}" for e in at.exception]
+    except Exception as e:
+        record["errors"].append(f"{type(e).__name__}: {e}")
+
+
+def percentile(values, q):
+    """The ``q``-th percentile of ``values`` (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)), 1) - 1]
+
+
+def run_level(options):
+    """Runs ``options["sessions"]`` concurrent sessions in this process; returns the level's metrics."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import profiling
+    from precompute import get_scheduler
+    from render_cache import get_render_cache
+    if options["stages"]:
+        profiling.enable()
+    share_test_runtime()
+
+    results = [None] * options["sessions"]
+    start = threading.Event()
+    threads = [threading.Thread(target=run_session, args=(i, options, start, results), daemon=True)
+               for i in range(options["sessions"])]
+    sampler = MemorySampler()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+    sampler.stop()
+
+    reruns = [seconds for record in results for seconds in record["reruns"]]
+    colds = [record["cold_s"] for record in results if record["cold_s"] is not None]
+    errors = [error for record in results for error in record["errors"]]
+    level = {
+        "sessions": options["sessions"],
+        "reruns": len(reruns),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_s": wall,
+        "throughput_rps": (len(reruns) + len(colds)) / wall,
+        "latency_s": {f"p{q}": percentile(reruns, q) for q in PERCENTILES},
+        "latency_max_s": max(reruns, default=None),
+        "cold_s": {"p50": percentile(colds, 50), "max": max(colds, default=None)},
+        "memory_mb": {
+            "server_peak": peak_rss_mb(),
+            "server_mean": sum(sampler.server) / len(sampler.server) if sampler.server else None,
+            "workers_peak": max(sampler.workers, default=None),
+        },
+        "render_cache": get_render_cache().stats(),
+    }
+    if options["stages"]:
+        # Wall time a stage spent beyond its own thread's CPU time was spent waiting
+        level["stages"] = {stage: {"calls": calls, "wall_s": wall_s, "cpu_s": cpu_s, "wait_s": max(wall_s - cpu_s, 0.0)}
+                           for stage, (calls, wall_s, cpu_s, _) in sorted(profiling.stage_totals().items())}
+    get_scheduler().shutdown()
+    return level
+
+
+# --- Driver ---
+def run(sessions, rows="10k", seed=0, **options):
+    csv_path = dataset_path(parse_size(rows), seed)
+    # Spans and metrics are only collected in memory; the dashboard's log files are left alone
+    env = {**os.environ, "HEART_DATA_PATH": csv_path, "HEART_PROFILE_LOG": "", "HEART_PROFILE_METRICS": ""}
+    levels = []
+    for count in sessions:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            out_path = tmp.name
+        try:
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as tmp:
+                json.dump({**options, "sessions": count, "seed": seed}, tmp)
+                options_path = tmp.name
+            subprocess.run([sys.executable, "-m", "benchmarks.loadtest", "--worker", options_path,
+                            "--worker-output", out_path], check=True, cwd=REPO_DIR, env=env)
+            with open(out_path) as f:
+                levels.append(json.load(f))
+        finally:
+            os.remove(out_path)
+            os.remove(options_path)
+        print(format_level(levels[-1]))
+    return {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpu_count": os.cpu_count(), "seed": seed,
+                 "rows": parse_size(rows), **options},
+        "levels": levels,
+    }
+
+
+def format_level(level):
+    latency = "  ".join(f"{name} {seconds * 1000:7.0f} ms" for name, seconds in level["latency_s"].items()
+                        if seconds is not None)
+    memory = level["memory_mb"]
+    lines = [
+        f"{level['sessions']} session(s): {level['reruns']} reruns in {level['wall_s']:.1f}s, "
+        f"{level['throughput_rps']:.2f} runs/s, {level['errors']} error(s)",
+        f"  rerun latency  {latency}  max {(level['latency_max_s'] or 0) * 1000:7.0f} ms",
+        f"  cold run       p50 {(level['cold_s']['p50'] or 0) * 1000:7.0f} ms  max {(level['cold_s']['max'] or 0) * 1000:7.0f} ms",
+        f"  memory         server peak {memory['server_peak']:.1f} MB"
+        + (f", render workers peak {memory['workers_peak']:.1f} MB" if memory["workers_peak"] is not None else ""),
+    ]
+    lines += [f"  error          {error}" for error in level["error_samples"]]
+    stages = level.get("stages", {})
+    for stage, totals in sorted(stages.items(), key=lambda item: -item[1]["wait_s"])[:5]:
+        lines.append(f"  wait {stage:<18} {totals['wait_s']:7.2f}s of {totals['wall_s']:7.2f}s wall over {totals['calls']} calls")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with concurrent headless sessions.")
+    parser.add_argument("--sessions", nargs="+", type=int, default=DEFAULT_SESSIONS,
+                        help="Concurrency levels to run, e.g. 1 4 16")
+    parser.add_argument("--rows", default="10k", help="Synthetic dataset size, e.g. 1k 100k 1m")
+    parser.add_argument("--reruns", type=int, default=20, help="Scripted reruns per session after the first run")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between a session's reruns, in seconds")
+    parser.add_argument("--mode", choices=DATA_MODES, default="in-memory")
+    parser.add_argument("--no-precompute", dest="precompute", action="store_false",
+                        help="Render only the selected chart, in the session")
+    parser.add_argument("--stages", action="store_true",
+                        help="Record stage spans to report waiting per stage (adds tracing overhead)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds one run may take before it fails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "loadtest.json"))
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        with open(args.worker) as f:
+            options = json.load(f)
+        with open(args.worker_output, "w") as f:
+            json.dump(run_level(options), f)
+        return 0
+
+    results = run(args.sessions, rows=args.rows, seed=args.seed, reruns=args.reruns, think_s=args.think,
+                  mode=args.mode, precompute=args.precompute, stages=args.stages, timeout=args.timeout)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Seeded synthetic heart.csv generator.
+
+Rows keep the heart.csv column schema. Each column is drawn conditionally on HeartDisease
+using marginals measured on the original 918-row dataset, so cohort sizes, sex shares and
+the Age/RestingBP/Cholesterol/MaxHR ranges behave like the real data at any size.
+
+Example:
+    python -m benchmarks.synthetic 1000000 benchmarks/data/heart_1m.csv --seed 7
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["Age", "Sex", "ChestPainType", "RestingBP", "Cholesterol", "FastingBS", "RestingECG",
+           "MaxHR", "ExerciseAngina", "Oldpeak", "ST_Slope", "HeartDisease"]
+
+DISEASE_RATE = 0.553
+
+# Per-class (healthy, diseased) marginals from input/heart.csv
+NORMAL_COLUMNS = {
+    # column: ((mean, std) healthy, (mean, std) diseased, clip range)
+    "Age": ((50.6, 9.4), (55.9, 8.7), (28, 77)),
+    "RestingBP": ((130.2, 16.5), (134.2, 19.8), (80, 200)),
+    "MaxHR": ((148.2, 23.3), (127.7, 23.4), (60, 202)),
+}
+CHOLESTEROL = {"zero_share": (0.049, 0.299), "normal": ((238.8, 55.4), (251.1, 62.5)), "clip": (85, 603)}
+OLDPEAK = {"zero_share": (0.60, 0.24), "normal": ((0.41, 0.7), (1.27, 1.15)), "clip": (-2.6, 6.2)}
+FASTING_BS_RATE = (0.107, 0.335)
+CATEGORICAL_COLUMNS = {
+    "Sex": ({"M": 0.651, "F": 0.349}, {"M": 0.902, "F": 0.098}),
+    "ChestPainType": ({"ATA": 0.363, "NAP": 0.32, "ASY": 0.254, "TA": 0.063},
+                      {"ASY": 0.772, "NAP": 0.142, "ATA": 0.047, "TA": 0.039}),
+    "RestingECG": ({"Normal": 0.651, "LVH": 0.2, "ST": 0.149}, {"Normal": 0.561, "ST": 0.23, "LVH": 0.209}),
+    "ExerciseAngina": ({"N": 0.866, "Y": 0.134}, {"Y": 0.622, "N": 0.378}),
+    "ST_Slope": ({"Up": 0.773, "Flat": 0.193, "Down": 0.034}, {"Flat": 0.75, "Up": 0.154, "Down": 0.096}),
+}
+
+
+def _by_class(rng, disease, draw):
+    """Fills an array by calling ``draw(rng, n, cls)`` separately for each HeartDisease class."""
+    out = None
+    for cls in (0, 1):
+        mask = disease == cls
+        values = draw(rng, mask.sum(), cls)
+        if out is None:
+            out = np.empty(len(disease), dtype=values.dtype)
+        out[mask] = values
+    return out
+
+
+def _choice(probabilities):
+    labels = np.array(list(probabilities))
+    weights = np.array(list(probabilities.values()))
+    return lambda rng, n: labels[rng.choice(len(labels), size=n, p=weights / weights.sum())]
+
+
+def _normal_with_zeros(spec, integer):
+    def draw(rng, n, cls):
+        mean, std = spec["normal"][cls]
+        values = np.clip(rng.normal(mean, std, n), *spec["clip"])
+        values[rng.random(n) < spec["zero_share"][cls]] = 0
+        return np.rint(values).astype(np.int64) if integer else np.round(values, 1)
+    return draw
+
+
+def generate(n_rows, seed=0):
+    """Returns a DataFrame of ``n_rows`` synthetic patients with the heart.csv columns."""
+    rng = np.random.default_rng(seed)
+    disease = (rng.random(n_rows) < DISEASE_RATE).astype(np.int64)
+    data = {"HeartDisease": disease}
+    for column, (healthy, diseased, clip) in NORMAL_COLUMNS.items():
+        params = (healthy, diseased)
+        data[column] = _by_class(rng, disease, lambda rng, n, cls, p=params, c=clip:
+                                 np.rint(np.clip(rng.normal(*p[cls], n), *c)).astype(np.int64))
+    data["Cholesterol"] = _by_class(rng, disease, _normal_with_zeros(CHOLESTEROL, integer=True))
+    data["Oldpeak"] = _by_class(rng, disease, _normal_with_zeros(OLDPEAK, integer=False))
+    data["FastingBS"] = _by_class(rng, disease, lambda rng, n, cls: (rng.random(n) < FASTING_BS_RATE[cls]).astype(np.int64))
+    for column, per_class in CATEGORICAL_COLUMNS.items():
+        data[column] = _by_class(rng, disease, lambda rng, n, cls, p=per_class: _choice(p[cls])(rng, n))
+    return pd.DataFrame(data)[COLUMNS]
+
+
+def write_csv(n_rows, path, seed=0, chunk_rows=1_000_000):
+    """Writes ``n_rows`` synthetic rows to ``path`` in chunks, so memory stays bounded at any size."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        for i, start in enumerate(range(0, n_rows, chunk_rows)):
+            chunk = generate(min(chunk_rows, n_rows - start), seed=(seed, i))
+            chunk.to_csv(f, header=(i == 0), index=False)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic heart.csv-schema file.")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_csv(args.rows, args.path, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+
+# --- Shared grids ---
+# One-unit bins centred on the integer values the dataset records, covering the axis
+# limits used by the visualizations. Binning integer data on these grids loses no
+# positional information, so counts on them can stand in for the raw points.
+AGE_EDGES = np.arange(24.5, 86.5)
+VALUE_EDGES = {
+    "RestingBP": np.arange(79.5, 211.5),
+    "Cholesterol": np.arange(-5.5, 651.5),
+    "MaxHR": np.arange(59.5, 211.5),
+}
+
+
+def centers(edges):
+    return (edges[:-1] + edges[1:]) / 2
+
+
+def bin_index(values, edges):
+    """Maps values onto bin indices of a uniform grid; -1 for values outside it."""
+    values = np.asarray(values, dtype=np.float64)
+    idx = np.floor((values - edges[0]) / (edges[1] - edges[0])).astype(np.intp)
+    idx[(idx < 0) | (idx >= len(edges) - 1)] = -1
+    return idx
+
+
+def hist1d(values, edges, weights=None):
+    """Counts (or sums ``weights``) per bin; values outside the grid are dropped."""
+    idx = bin_index(values, edges)
+    keep = idx >= 0
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)[keep]
+    return np.bincount(idx[keep], weights=weights, minlength=len(edges) - 1)
+
+
+def hist2d(x, y, x_edges, y_edges):
+    """Counts per (x, y) cell as an array of shape (len(x_edges) - 1, len(y_edges) - 1)."""
+    ix = bin_index(x, x_edges)
+    iy = bin_index(y, y_edges)
+    keep = (ix >= 0) & (iy >= 0)
+    nx, ny = len(x_edges) - 1, len(y_edges) - 1
+    flat = np.bincount(ix[keep] * ny + iy[keep], minlength=nx * ny)
+    return flat.reshape(nx, ny)
@@ -0,0 +1,139 @@
+import numpy as np
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from binning import AGE_EDGES, VALUE_EDGES, centers
+from schema import CATEGORICAL_COLUMNS
+from profiling import span
+
+# --- Bootstrap confidence bands ---
+# The angina chart's mean-MaxHR-by-age lines get percentile bootstrap bands. Resamples follow
+# the Poisson bootstrap: every row appears a Poisson(1) number of times, so a cell of a
+# cohort's Age x MaxHR histogram holding c rows holds Poisson(c) rows in a resample. The
+# histogram is the per-age index: a batch of resamples is one vectorized Poisson draw per
+# occupied cell, and its per-age means are sums over each age's cells, so the cost depends on
+# the number of occupied cells rather than rows. Resamples of disjoint cohorts add up, so the
+# main lines' resamples are the sums of their chest pain type parts' and every row is drawn
+# once per resample. Batches have their own seeded streams and run on a thread pool (NumPy
+# releases the GIL while drawing); the result does not depend on the number of workers.
+N_RESAMPLES = int(os.environ.get("HEART_BOOTSTRAP_RESAMPLES", 1_000))
+BOOTSTRAP_WORKERS = int(os.environ.get("HEART_BOOTSTRAP_WORKERS", min(4, os.cpu_count() or 1)))
+BATCH_RESAMPLES = 100
+BOOTSTRAP_SEED = 0
+CONFIDENCE = 0.95
+
+# Cohorts with bands -> the disjoint cohorts their rows are resampled in
+BAND_PARTS = {}
+for _induced in ("induced", "not_induced"):
+    _parts = [f"angina_{_induced}_{pain.lower()}_dis" for pain in CATEGORICAL_COLUMNS["ChestPainType"]]
+    BAND_PARTS[f"angina_{_induced}_dis"] = _parts
+    BAND_PARTS.update({part: [part] for part in _parts})
+
+
+def resample_batch(counts, values, n, seed):
+    """Per-age row counts and value sums of ``n`` Poisson bootstrap resamples of a histogram.
+
+    ``counts`` is an Age x value histogram and ``values`` the value of each of its columns;
+    returns two (n, ages) arrays.
+    """
+    totals = np.zeros((n, counts.shape[0]))
+    sums = np.zeros((n, counts.shape[0]))
+    ages, columns = np.nonzero(counts)
+    if len(ages):
+        draws = np.random.default_rng(seed).poisson(counts[ages, columns], size=(n, len(ages))).astype(np.float64)
+        # Occupied cells come in age order, so each age's cells are one contiguous run
+        starts = np.flatnonzero(np.diff(ages, prepend=-1))
+        totals[:, ages[starts]] = np.add.reduceat(draws, starts, axis=1)
+        sums[:, ages[starts]] = np.add.reduceat(draws * values[columns], starts, axis=1)
+    return totals, sums
+
+
+def bootstrap(histograms, values, n_resamples=N_RESAMPLES, workers=BOOTSTRAP_WORKERS, seed=BOOTSTRAP_SEED):
+    """Poisson bootstrap resamples of each histogram ({key: counts}), as {key: (totals, sums)}.
+
+    Each key's batches are seeded from the key, so a histogram's resamples do not depend on
+    which others are resampled with it.
+    """
+    batches = [(key, start) for key in histograms for start in range(0, n_resamples, BATCH_RESAMPLES)]
+
+    def run(batch):
+        key, start = batch
+        entropy = [seed, zlib.crc32(key.encode()), start // BATCH_RESAMPLES]
+        return resample_batch(histograms[key], values, min(BATCH_RESAMPLES, n_resamples - start), entropy)
+
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(run, batches))
+    else:
+        results = list(map(run, batches))
+    resamples = {}
+    for (key, _), (totals, sums) in zip(batches, results):
+        resamples.setdefault(key, []).append((totals, sums))
+    return {key: (np.concatenate([t for t, _ in parts]), np.concatenate([s for _, s in parts]))
+            for key, parts in resamples.items()}
+
+
+def percentile_band(totals, sums, confidence=CONFIDENCE):
+    """(ages, lower, upper) percentile bounds of the resampled means at every age with rows."""
+    ages = np.flatnonzero(totals.any(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums[:, ages] / totals[:, ages]
+    # Resamples that leave an age empty have no mean there
+    tail = (1 - confidence) / 2 * 100
+    lower, upper = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+    return ages, lower, upper
+
+
+def interpolate_band(band, kind):
+    """Interpolates a band's bounds onto the ages its mean line is interpolated onto."""
+    import pandas as pd
+    from angina_visualization import interpolate_means # The bounds follow the line they surround
+    ages, lower, upper = band
+    index = pd.Index(ages, name="Age")
+    new_ages, lower = interpolate_means(pd.DataFrame({"MaxHR": lower}, index=index), kind)
+    _, upper = interpolate_means(pd.DataFrame({"MaxHR": upper}, index=index), kind)
+    return np.asarray(new_ages), np.asarray(lower), np.asarray(upper)
+
+
+class BootstrapCohortsMixin:
+    """Memoized bootstrap bands of mean MaxHR by age, for containers with ``hist2d`` and a ``_bands`` dict."""
+    __slots__ = ()
+
+    def _maxhr_resamples(self):
+        resamples = self._bands.get("resamples")
+        if resamples is None:
+            histograms = {}
+            for name, parts in BAND_PARTS.items():
+                if len(parts) > 1:
+                    # Rows of the cohort outside its parts (unknown chest pain types) are resampled on their own
+                    other = self.hist2d(name, "MaxHR") - sum(self.hist2d(part, "MaxHR") for part in parts)
+                    if other.any():
+                        histograms[f"{name}:other"] = other
+                else:
+                    histograms[name] = self.hist2d(name, "MaxHR")
+            with span("bootstrap"):
+                resamples = bootstrap(histograms, centers(VALUE_EDGES["MaxHR"]))
+            self._bands["resamples"] = resamples
+        return resamples
+
+    def maxhr_band(self, name, kind=None):
+        """(ages, lower, upper) of a CONFIDENCE bootstrap band around a cohort's mean MaxHR by age.
+
+        With an interpolation ``kind`` the bounds are interpolated like the mean line
+        (angina_visualization.interpolate_means). None with fewer than two ages.
+        """
+        key = (name, kind)
+        if key not in self._bands:
+            resamples = self._maxhr_resamples()
+            parts = [part for part in [*BAND_PARTS[name], f"{name}:other"] if part in resamples]
+            totals = sum(resamples[part][0] for part in parts)
+            sums = sum(resamples[part][1] for part in parts)
+            ages, lower, upper = percentile_band(totals, sums)
+            band = None
+            if len(ages) >= 2:
+                band = (centers(AGE_EDGES)[ages].astype(int), lower, upper)
+                if kind is not None:
+                    band = interpolate_band(band, kind)
+            self._bands[key] = band
+        return self._bands[key]
@@ -1,14 +1,22 @@
-import streamlit as st
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-def plot_bp_visualization(healthy_data, diseased_data,
-                          abnormal_bp_healthy, abnormal_bp_diseased,
-                          normal_bp_healthy, normal_bp_diseased,
-                          kde_bw_adjust=2.0, scatter_alpha=0.5, kde_shade=True):
-    """Generates the Blood Pressure vs. Age visualization."""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(20, 9), gridspec_kw={'height_ratios': [0.7, 3]})
-    plt.subplots_adjust(hspace=0.1)
+from matplotlib.figure import Figure
+
+from figure_templates import GUIDE_ZORDER, TemplatePool
+from plot_layers import draw_density_1d, draw_density_2d, draw_scatter_panel
+from thresholds import with_thresholds
+
+def _draw_bp_panel(ax, cohorts, group, cmap, abnormal_color, normal_color, scatter_alpha, kde_shade, preview):
+    """Draws the normal-range KDE plus abnormal/normal scatter for one group ('healthy' or 'diseased')."""
+    abnormal, normal = f"abnormal_bp_{group}", f"normal_bp_{group}"
+    draw_density_2d(ax, cohorts.kde(normal, "RestingBP"), cmap=cmap, bw_adjust=.5, fill=kde_shade, preview=preview)
+    draw_scatter_panel(ax, cohorts, "RestingBP", [(abnormal, abnormal_color, scatter_alpha), # Light colour for abnormal
+                                                  (normal, normal_color, None)], preview=preview, marker=".")
+
+
+def _bp_scaffold():
+    """Builds the static part of the BP figure: layout, spines, ticks, titles and threshold guides."""
+    fig = Figure(figsize=(20, 9))
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2, gridspec_kw={'height_ratios': [0.7, 3]})
+    fig.subplots_adjust(hspace=0.1)
 
     # --- Top KDE Plots (Age Distribution) ---
     for ax in [ax1, ax2]:
@@ -20,54 +28,59 @@ def plot_bp_visualization(healthy_data, diseased_data,
         ax.set_xlabel("")
         ax.set_ylabel("")
 
-    # Healthy KDE
-    sns.kdeplot(healthy_data["Age"], bw_adjust=kde_bw_adjust, ax=ax1, color="#0000FF", lw=1, fill=kde_shade) # Blue for healthy
-    ax1.axhline(y=0.02, xmin=0.22, xmax=0.62, color='k', linestyle='--', alpha=0.3)
+    ax1.axhline(y=0.02, xmin=0.22, xmax=0.62, color='k', linestyle='--', alpha=0.3, zorder=GUIDE_ZORDER)
     ax1.text(25, 0.01, "Age", fontsize=9, fontweight="normal", horizontalalignment="left")
     ax1.set_title("Age Distribution (Healthy)", fontsize=12)
 
-    # Diseased KDE
-    sns.kdeplot(diseased_data["Age"], bw_adjust=kde_bw_adjust, ax=ax2, color="#FF0000", lw=1, fill=kde_shade) # Red for diseased
-    ax2.axhline(y=0.02, xmin=0.35, xmax=0.71, color='k', linestyle='--', alpha=0.3)
+    ax2.axhline(y=0.02, xmin=0.35, xmax=0.71, color='k', linestyle='--', alpha=0.3, zorder=GUIDE_ZORDER)
     ax2.text(25, 0.01, "Age", fontsize=9, fontweight="normal", horizontalalignment="left")
     ax2.set_title("Age Distribution (Diseased)", fontsize=12)
 
     # --- Bottom Scatter/KDE Plots (Age vs RestingBP) ---
-    bp_min, bp_max = 115, 155 # Define normal BP range
-
-    # Healthy Scatter/KDE
-    ax3.spines['right'].set_visible(False)
-    ax3.spines['top'].set_visible(False)
-    sns.kdeplot(data=normal_bp_healthy, x="Age", y="RestingBP", cmap="Blues", ax=ax3, shade=kde_shade, bw_adjust=.5)
-    ax3.scatter(abnormal_bp_healthy["Age"], abnormal_bp_healthy["RestingBP"], color="#ADD8E6", marker=".", alpha=scatter_alpha) # Light blue for abnormal healthy
-    ax3.scatter(normal_bp_healthy["Age"], normal_bp_healthy["RestingBP"], color="#0000FF", marker=".") # Blue for normal healthy
-    ax3.set_ylim(80, 210)
-    ax3.set_xlim(25, 85)
-    ax3.set_xticks([30, 40, 50, 60, 70, 80])
-    ax3.set_yticks([]) # Keep Y axis labels consistent with original if needed, or simplify
-    ax3.set_ylabel("") # Add label "Resting BP" if desired
-    ax3.set_xlabel("Age")
-    ax3.axhline(y=bp_max + 0.5, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax3.axhline(y=bp_min - 0.5, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax3.text(24, (bp_min+bp_max)/2 , f'Normal BP\n({bp_min}-{bp_max} mmHg)', horizontalalignment='right', verticalalignment='center')
-    ax3.set_title("Healthy: Age vs Resting BP", fontsize=12)
-
-
-    # Diseased Scatter/KDE
-    ax4.spines['right'].set_visible(False)
-    ax4.spines['top'].set_visible(False)
-    sns.kdeplot(data=normal_bp_diseased, x="Age", y="RestingBP", cmap="Reds", ax=ax4, shade=kde_shade, bw_adjust=.5)
-    ax4.scatter(abnormal_bp_diseased["Age"], abnormal_bp_diseased["RestingBP"], color="#FFA07A", marker=".", alpha=scatter_alpha) # Light red for abnormal diseased
-    ax4.scatter(normal_bp_diseased["Age"], normal_bp_diseased["RestingBP"], color="#FF0000", marker=".") # Red for normal diseased
-    ax4.set_ylabel("")
-    ax4.set_xlabel("Age")
-    ax4.set_ylim(80, 210)
-    ax4.set_xlim(25, 85)
-    ax4.set_xticks([30, 40, 50, 60, 70, 80])
-    ax4.set_yticks([])
-    ax4.axhline(y=bp_max + 0.5, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax4.axhline(y=bp_min - 0.5, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax4.text(24, (bp_min+bp_max)/2 , f'Normal BP\n({bp_min}-{bp_max} mmHg)', horizontalalignment='right', verticalalignment='center')
-    ax4.set_title("Diseased: Age vs Resting BP", fontsize=12)
-
-    st.pyplot(fig)
+    # The normal-range guides are placed by each render, from the BP thresholds
+    guides = []
+    for ax, title in [(ax3, "Healthy: Age vs Resting BP"), (ax4, "Diseased: Age vs Resting BP")]:
+        ax.spines['right'].set_visible(False)
+        ax.spines['top'].set_visible(False)
+        ax.set_ylim(80, 210)
+        ax.set_xlim(25, 85)
+        ax.set_xticks([30, 40, 50, 60, 70, 80])
+        ax.set_yticks([]) # Keep Y axis labels consistent with original if needed, or simplify
+        ax.set_ylabel("") # Add label "Resting BP" if desired
+        ax.set_xlabel("Age")
+        high = ax.axhline(y=0, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3, zorder=GUIDE_ZORDER)
+        low = ax.axhline(y=0, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3, zorder=GUIDE_ZORDER)
+        label = ax.text(24, 0, "", horizontalalignment='right', verticalalignment='center')
+        ax.set_title(title, fontsize=12)
+        guides.append((high, low, label))
+
+    return fig, (ax1, ax2, ax3, ax4), {"bp_guides": guides}
+
+
+_templates = TemplatePool(_bp_scaffold)
+
+
+def build_bp_figure(cohorts, kde_bw_adjust=2.0, scatter_alpha=0.5, kde_shade=True, thresholds=None, preview=False):
+    """Builds the Blood Pressure vs. Age visualization; returns the figure (release it with release_figure).
+
+    A ``preview`` draws coarser densities and a sample of the points, for progressive rendering.
+    """
+    cohorts = with_thresholds(cohorts, thresholds)
+    template = _templates.checkout()
+    ax1, ax2, ax3, ax4 = template.axes
+
+    # --- Top KDE Plots (Age Distribution) ---
+    draw_density_1d(ax1, cohorts.kde("healthy"), "#0000FF", bw_adjust=kde_bw_adjust, fill=kde_shade) # Blue for healthy
+    draw_density_1d(ax2, cohorts.kde("diseased"), "#FF0000", bw_adjust=kde_bw_adjust, fill=kde_shade) # Red for diseased
+
+    # --- Bottom Scatter/KDE Plots (Age vs RestingBP) ---
+    bp_min, bp_max = cohorts.thresholds["bp_low"], cohorts.thresholds["bp_high"] # Normal BP range
+    _draw_bp_panel(ax3, cohorts, "healthy", "Blues", "#ADD8E6", "#0000FF", scatter_alpha, kde_shade, preview)
+    _draw_bp_panel(ax4, cohorts, "diseased", "Reds", "#FFA07A", "#FF0000", scatter_alpha, kde_shade, preview)
+    for high, low, label in template.artists["bp_guides"]:
+        high.set_ydata([bp_max + 0.5] * 2)
+        low.set_ydata([bp_min - 0.5] * 2)
+        label.set_y((bp_min + bp_max) / 2)
+        label.set_text(f'Normal BP\n({bp_min}-{bp_max} mmHg)')
+
+    return template.figure
@@ -1,21 +1,31 @@
-import streamlit as st
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-def plot_cholesterol_visualization(healthy_data, diseased_data,
-                                   abnormal_cls_healthy, abnormal_cls_diseased,
-                                   normal_cls_healthy, normal_cls_diseased,
-                                   male_abnormal_cls_healthy_pct, female_abnormal_cls_healthy_pct,
-                                   male_abnormal_cls_diseased_pct, female_abnormal_cls_diseased_pct,
-                                   kde_bw_adjust=2.0, scatter_alpha=0.3, kde_shade=True):
-    """Generates the Cholesterol vs. Age visualization."""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(20, 9), gridspec_kw={'height_ratios': [0.7, 3]})
-    plt.subplots_adjust(hspace=0.1)
+from matplotlib.figure import Figure
 
-    # --- Top KDE Plots (Age Distribution by Sex) ---
-    ax1_colors = ["#0000FF", "#FFC0CB"] # Blue for M, Pink for F
-    ax2_colors = ["#FF0000", "#FFA07A"] # Red for M, Light Red for F
+from figure_templates import GUIDE_ZORDER, TemplatePool
+from plot_layers import draw_density_2d, draw_density_by_sex, draw_scatter_panel
+from thresholds import with_thresholds
+
+def _draw_age_by_sex(ax, cohorts, group, palette, kde_bw_adjust, kde_shade):
+    """Draws the Age KDE of one group split by sex."""
+    kdes = [cohorts.kde(group, sex="M"), cohorts.kde(group, sex="F")]
+    draw_density_by_sex(ax, kdes, palette, bw_adjust=kde_bw_adjust, fill=kde_shade)
+
+
+def _draw_cholesterol_panel(ax, cohorts, group, cmap, abnormal_color, normal_color, scatter_alpha, kde_shade, preview):
+    """Draws the high-cholesterol KDE plus abnormal/normal scatter for one group."""
+    abnormal, normal = f"abnormal_cls_{group}", f"normal_cls_{group}"
+    # The KDE covers only the high (above threshold) cohort, so Cholesterol == 0 rows never skew it
+    draw_density_2d(ax, cohorts.kde(abnormal, "Cholesterol"), cmap=cmap, bw_adjust=.5, fill=kde_shade, preview=preview)
+    draw_scatter_panel(ax, cohorts, "Cholesterol", [(abnormal, abnormal_color, None), (normal, normal_color, scatter_alpha)],
+                       preview=preview, marker=".")
 
+
+def _cholesterol_scaffold():
+    """Builds the static part of the cholesterol figure; percentages and the threshold guide are set per render."""
+    fig = Figure(figsize=(20, 9))
+    ((ax1, ax2), (ax3, ax4)) = fig.subplots(2, 2, gridspec_kw={'height_ratios': [0.7, 3]})
+    fig.subplots_adjust(hspace=0.1)
+
+    # --- Top KDE Plots (Age Distribution by Sex) ---
     for ax in [ax1, ax2]:
         for i in ["top", "right", "left", "bottom"]:
             ax.spines[i].set_visible(False)
@@ -24,63 +34,72 @@ def plot_cholesterol_visualization(healthy_data, diseased_data,
         ax.set_xlim(25, 85)
         ax.set_xlabel("")
         ax.set_ylabel("")
-        ax.get_legend().remove() # Remove default legend
 
-    # Healthy KDE by Sex
-    sns.kdeplot(data=healthy_data, x="Age", bw_adjust=kde_bw_adjust, ax=ax1, hue="Sex", palette=ax1_colors, lw=1, fill=kde_shade)
-    ax1.text(33, 0.01, f"Age\nMale-{male_abnormal_cls_healthy_pct:.1f}%", fontsize=9, fontweight="normal", horizontalalignment="right")
-    ax1.text(45, 0.005, f"Age\nFemale-{female_abnormal_cls_healthy_pct:.1f}%", fontsize=9, fontweight="normal", horizontalalignment="left")
+    sex_labels = [
+        ax1.text(33, 0.01, "", fontsize=9, fontweight="normal", horizontalalignment="right"),
+        ax1.text(45, 0.005, "", fontsize=9, fontweight="normal", horizontalalignment="left"),
+        ax2.text(45, 0.02, "", fontsize=9, fontweight="normal", horizontalalignment="right"),
+        ax2.text(50, 0.006, "", fontsize=9, fontweight="normal", horizontalalignment="left"),
+    ]
     ax1.set_title("Age Distribution by Sex (Healthy)", fontsize=12)
+    ax2.set_title("Age Distribution by Sex (Diseased)", fontsize=12)
+
+    # --- Bottom Scatter/KDE Plots (Age vs Cholesterol) ---
+    guides = []
+    for ax, title in [(ax3, "Healthy: Age vs Cholesterol"), (ax4, "Diseased: Age vs Cholesterol")]:
+        ax.spines['right'].set_visible(False)
+        ax.spines['top'].set_visible(False)
+        ax.set_ylim(-5, 650)
+        ax.set_xlim(25, 85)
+        ax.set_xticks([30, 40, 50, 60, 70, 80])
+        ax.set_yticks([])
+        ax.set_xlabel("Age")
+        ax.set_ylabel("") # Add Label "Cholesterol" if desired
+        line = ax.axhline(y=0, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3, zorder=GUIDE_ZORDER)
+        label = ax.text(24, 350, "", horizontalalignment='right', verticalalignment='center')
+        value = ax.text(24, 0, "", horizontalalignment='right', verticalalignment='center')
+        ax.set_title(title, fontsize=12)
+        guides.append((line, label, value))
 
+    return fig, (ax1, ax2, ax3, ax4), {"sex_labels": sex_labels, "cholesterol_guides": guides}
 
-    # Diseased KDE by Sex
-    sns.kdeplot(data=diseased_data, x="Age", bw_adjust=kde_bw_adjust, ax=ax2, hue="Sex", palette=ax2_colors, lw=1, fill=kde_shade)
-    ax2.text(45, 0.02, f"Age\nMale-{male_abnormal_cls_diseased_pct:.1f}%", fontsize=9, fontweight="normal", horizontalalignment="right")
-    ax2.text(50, 0.006, f"Age\nFemale-{female_abnormal_cls_diseased_pct:.1f}%", fontsize=9, fontweight="normal", horizontalalignment="left")
-    ax2.set_title("Age Distribution by Sex (Diseased)", fontsize=12)
 
+_templates = TemplatePool(_cholesterol_scaffold)
+
+
+def build_cholesterol_figure(cohorts, kde_bw_adjust=2.0, scatter_alpha=0.3, kde_shade=True, thresholds=None,
+                             preview=False):
+    """Builds the Cholesterol vs. Age visualization; returns the figure (release it with release_figure).
+
+    A ``preview`` draws coarser densities and a sample of the points, for progressive rendering.
+    """
+    cohorts = with_thresholds(cohorts, thresholds)
+    male_abnormal_cls_healthy_pct = cohorts.sex_pct("abnormal_cls_healthy", "M")
+    female_abnormal_cls_healthy_pct = cohorts.sex_pct("abnormal_cls_healthy", "F")
+    male_abnormal_cls_diseased_pct = cohorts.sex_pct("abnormal_cls_diseased", "M")
+    female_abnormal_cls_diseased_pct = cohorts.sex_pct("abnormal_cls_diseased", "F")
+
+    template = _templates.checkout()
+    ax1, ax2, ax3, ax4 = template.axes
+
+    # --- Top KDE Plots (Age Distribution by Sex) ---
+    ax1_colors = ["#0000FF", "#FFC0CB"] # Blue for M, Pink for F
+    ax2_colors = ["#FF0000", "#FFA07A"] # Red for M, Light Red for F
+    _draw_age_by_sex(ax1, cohorts, "healthy", ax1_colors, kde_bw_adjust, kde_shade)
+    _draw_age_by_sex(ax2, cohorts, "diseased", ax2_colors, kde_bw_adjust, kde_shade)
+    for label, text in zip(template.artists["sex_labels"], [
+            f"Age\nMale-{male_abnormal_cls_healthy_pct:.1f}%", f"Age\nFemale-{female_abnormal_cls_healthy_pct:.1f}%",
+            f"Age\nMale-{male_abnormal_cls_diseased_pct:.1f}%", f"Age\nFemale-{female_abnormal_cls_diseased_pct:.1f}%"]):
+        label.set_text(text)
 
     # --- Bottom Scatter/KDE Plots (Age vs Cholesterol) ---
-    cholesterol_threshold = 200
-
-    # Healthy Scatter/KDE
-    ax3.spines['right'].set_visible(False)
-    ax3.spines['top'].set_visible(False)
-    # Filter out Cholesterol == 0 for KDE plot if desired, as it skews the density
-    kde_data_healthy = abnormal_cls_healthy[abnormal_cls_healthy['Cholesterol'] > 0]
-    if not kde_data_healthy.empty:
-        sns.kdeplot(data=kde_data_healthy, x="Age", y="Cholesterol", cmap="Blues", shade=kde_shade, ax=ax3, bw_adjust=.5)
-    ax3.scatter(abnormal_cls_healthy["Age"], abnormal_cls_healthy["Cholesterol"], color="#0000FF", marker=".") # Blue for abnormal healthy
-    ax3.scatter(normal_cls_healthy["Age"], normal_cls_healthy["Cholesterol"], color="#ADD8E6", marker=".", alpha=scatter_alpha) # Light Blue for normal healthy
-    ax3.set_ylim(-5, 650)
-    ax3.set_xlim(25, 85)
-    ax3.set_xticks([30, 40, 50, 60, 70, 80])
-    ax3.set_yticks([])
-    ax3.set_xlabel("Age")
-    ax3.set_ylabel("") # Add Label "Cholesterol" if desired
-    ax3.axhline(y=cholesterol_threshold, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax3.text(24, 350, f'High cholesterol\n> {cholesterol_threshold} mg/dL', horizontalalignment='right', verticalalignment='center')
-    ax3.text(24, cholesterol_threshold, f'{cholesterol_threshold}', horizontalalignment='right', verticalalignment='center')
-    ax3.set_title("Healthy: Age vs Cholesterol", fontsize=12)
-
-    # Diseased Scatter/KDE
-    ax4.spines['right'].set_visible(False)
-    ax4.spines['top'].set_visible(False)
-    kde_data_diseased = abnormal_cls_diseased[abnormal_cls_diseased['Cholesterol'] > 0]
-    if not kde_data_diseased.empty:
-        sns.kdeplot(data=kde_data_diseased, x="Age", y="Cholesterol", cmap="Reds", shade=kde_shade, ax=ax4, bw_adjust=.5)
-    ax4.scatter(abnormal_cls_diseased["Age"], abnormal_cls_diseased["Cholesterol"], color="#FF0000", marker=".") # Red for abnormal diseased
-    ax4.scatter(normal_cls_diseased["Age"], normal_cls_diseased["Cholesterol"], marker=".", color="#FFA07A", alpha=scatter_alpha) # Light Red for normal diseased
-    ax4.set_ylim(-5, 650)
-    ax4.set_xlim(25, 85)
-    ax4.set_xticks([30, 40, 50, 60, 70, 80])
-    ax4.set_yticks([])
-    ax4.set_xlabel("Age")
-    ax4.set_ylabel("")
-    ax4.axhline(y=cholesterol_threshold, xmin=0.0, xmax=1.0, color='k', linestyle='--', alpha=0.3)
-    ax4.text(24, 350, f'High cholesterol\n> {cholesterol_threshold} mg/dL', horizontalalignment='right', verticalalignment='center')
-    ax4.text(24, cholesterol_threshold, f'{cholesterol_threshold}', horizontalalignment='right', verticalalignment='center')
-    ax4.set_title("Diseased: Age vs Cholesterol", fontsize=12)
-
-
-    st.pyplot(fig)
+    cholesterol_threshold = cohorts.thresholds["cholesterol_high"]
+    _draw_cholesterol_panel(ax3, cohorts, "healthy", "Blues", "#0000FF", "#ADD8E6", scatter_alpha, kde_shade, preview) # Blue / Light Blue
+    _draw_cholesterol_panel(ax4, cohorts, "diseased", "Reds", "#FF0000", "#FFA07A", scatter_alpha, kde_shade, preview) # Red / Light Red
+    for line, label, value in template.artists["cholesterol_guides"]:
+        line.set_ydata([cholesterol_threshold] * 2)
+        label.set_text(f'High cholesterol\n> {cholesterol_threshold} mg/dL')
+        value.set_y(cholesterol_threshold)
+        value.set_text(f'{cholesterol_threshold}')
+
+    return template.figure
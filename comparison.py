@@ -0,0 +1,181 @@
+import streamlit as st
+import numpy as np
+import os
+import time
+
+from binning import AGE_EDGES, VALUE_EDGES
+from data_loader import COHORTS, read_sidecar_table, shared_dataset, source_signature
+from kde import BinnedKDE
+from partitions import dataset_signature, partitioned_fingerprint
+from precompute import MAX_WORKERS, blank_main, load_source, spawn_executor
+from thresholds import INDEXED, THRESHOLD_COHORTS, with_thresholds
+from visualizations import VISUALIZATIONS
+from profiling import span
+
+# --- Multi-dataset comparison ---
+# Datasets (e.g. sites or time periods) listed in HEART_COMPARE_PATHS are loaded and
+# preprocessed side by side, one per worker of a spawned process pool, so comparing four
+# datasets takes about as long as loading the largest one (given the cores). Every dataset is
+# binned on the shared grids (binning.py), so the charts of each can be shown as aligned
+# panels, and their densities subtracted cell by cell in difference maps.
+COMPARE_PATHS = [path for path in os.environ.get("HEART_COMPARE_PATHS", "").split(os.pathsep) if path]
+COMPARE_WORKERS = int(os.environ.get("HEART_COMPARE_WORKERS", MAX_WORKERS))
+
+# Value axis limits of the charts' Age x value panels
+VALUE_LIMITS = {"RestingBP": (80, 210), "Cholesterol": (-5, 650), "MaxHR": (80, 210)}
+
+
+def dataset_labels(paths):
+    """{label: path} of the datasets to compare, labelled by file or directory name (full paths where those collide)."""
+    labels = [os.path.splitext(os.path.basename(os.path.normpath(path)))[0] for path in paths]
+    if len(set(labels)) < len(labels):
+        labels = [os.path.normpath(path) for path in paths]
+    return dict(zip(labels, paths))
+
+
+def dataset_source(path, streamed=False):
+    """The (mode, path, ...) source and fingerprint of a heart.csv file or dataset directory at its current version."""
+    if os.path.isdir(path):
+        return ("partitioned", path, {}, streamed), partitioned_fingerprint(path, dataset_signature(path), {}, streamed)
+    signature = source_signature(path)
+    if streamed:
+        return ("streamed", path), f"streamed:{path}:{signature}"
+    return ("typed", path), f"{path}:{signature}"
+
+
+# --- Worker side ---
+def prepare_dataset(source, fingerprint):
+    """Loads and preprocesses one dataset in a worker; returns (cohorts, seconds).
+
+    The aggregation cube, threshold indexes and the histograms of every chart's densities are
+    built here. In memory, a CSV's frame is not sent back once its sidecar is written, as the
+    dashboard memory-maps the sidecar instead.
+    """
+    start = time.perf_counter()
+    cohorts = load_source(source, fingerprint)
+    cohorts.cube
+    for parent, column in INDEXED:
+        cohorts.value_index(parent, column)
+    for visualization in VISUALIZATIONS.values():
+        for name, column in visualization.densities.values():
+            if name not in THRESHOLD_COHORTS: # Threshold cohorts are split from the value indexes
+                cohorts.hist2d(name, column)
+    if source[0] == "typed" and read_sidecar_table(source[1], source_signature(source[1])) is not None:
+        cohorts.df = None
+    return cohorts, time.perf_counter() - start
+
+
+# --- Dashboard access ---
+class ComparedDataset:
+    """One dataset of a comparison: its label, path, cohorts and the source workers load it from."""
+    __slots__ = ("label", "path", "source", "cohorts", "seconds")
+
+    def __init__(self, label, path, source, cohorts, seconds):
+        self.label = label
+        self.path = path
+        self.source = source
+        self.cohorts = cohorts
+        self.seconds = seconds
+
+    @property
+    def n_rows(self):
+        return self.cohorts.n_rows
+
+
+class Comparison:
+    """Datasets loaded side by side, the first being the reference of difference maps."""
+    __slots__ = ("datasets", "seconds")
+
+    def __init__(self, datasets, seconds):
+        self.datasets = datasets
+        self.seconds = seconds
+
+    @property
+    def fingerprint(self):
+        return "|".join(dataset.cohorts.fingerprint for dataset in self.datasets)
+
+    @property
+    def worker_seconds(self):
+        """Load and preprocessing time summed over the datasets, i.e. the time of loading them one by one."""
+        return sum(dataset.seconds for dataset in self.datasets)
+
+
+@st.cache_resource(max_entries=2)
+def _load_comparison(datasets):
+    # ``datasets`` holds (label, path, source, fingerprint); fingerprints change with each dataset's version
+    start = time.perf_counter()
+    with spawn_executor(min(len(datasets), COMPARE_WORKERS)) as executor:
+        with blank_main():
+            futures = [executor.submit(prepare_dataset, source, fingerprint) for _, _, source, fingerprint in datasets]
+        results = [future.result() for future in futures]
+    compared = []
+    for (label, path, source, _), (cohorts, seconds) in zip(datasets, results):
+        if cohorts.has_rows and cohorts.df is None:
+            cohorts.df = shared_dataset(path).df # The sidecar the worker wrote, memory-mapped
+        compared.append(ComparedDataset(label, path, source, cohorts, seconds))
+    return Comparison(compared, time.perf_counter() - start)
+
+
+def load_comparison(datasets, streamed=False):
+    """Loads and preprocesses ``datasets`` ({label: path}) concurrently; cached until one of them changes."""
+    return _load_comparison(tuple((label, path, *dataset_source(path, streamed)) for label, path in datasets.items()))
+
+
+# --- Difference maps ---
+def share(cohorts, name):
+    """A cohort's size as a percentage of its parent cohort's."""
+    parent = THRESHOLD_COHORTS[name][0] if name in THRESHOLD_COHORTS else COHORTS[name][0]
+    total = cohorts.size(parent)
+    return 100 * cohorts.size(name) / total if total else np.nan
+
+
+def shared_densities(views, name, column, bw_adjust=1.0):
+    """A cohort's Age x ``column`` density in each view, all smoothed with the kernel of their pooled counts."""
+    counts = [view.hist2d(name, column) for view in views]
+    pooled = BinnedKDE(sum(counts), AGE_EDGES, VALUE_EDGES[column])
+    return [pooled.smooth(c, bw_adjust) for c in counts]
+
+
+def build_difference_figure(comparison, visualization, kde_bw_adjust=1.0, thresholds=None):
+    """Difference maps of a chart's densities: a row of panels per dataset, against the first.
+
+    Cells show the difference in the share of the cohort falling in each one-unit grid cell,
+    in percentage points. None with fewer than two datasets or a chart without densities.
+    """
+    from matplotlib.figure import Figure
+    panels = visualization.densities
+    if len(comparison.datasets) < 2 or not panels:
+        return None
+    reference, *others = comparison.datasets
+    views = [with_thresholds(dataset.cohorts, thresholds) for dataset in comparison.datasets]
+    fig = Figure(figsize=(20, 1 + 4.5 * len(others)), constrained_layout=True)
+    axes = fig.subplots(len(others), len(panels), squeeze=False)
+    for j, (title, (name, column)) in enumerate(panels.items()):
+        with span("compare.densities"):
+            densities = shared_densities(views, name, column, kde_bw_adjust)
+        differences = [None if density is None or densities[0] is None else (density - densities[0]) * 100
+                       for density in densities[1:]]
+        # One symmetric colour scale per column, so the rows can be read against each other
+        limit = max([np.abs(difference).max() for difference in differences if difference is not None], default=0) or 1
+        parent = THRESHOLD_COHORTS[name][0] if name in THRESHOLD_COHORTS else COHORTS[name][0]
+        mesh = None
+        for i, (dataset, view, difference) in enumerate(zip(others, views[1:], differences)):
+            ax = axes[i, j]
+            ax.spines['right'].set_visible(False)
+            ax.spines['top'].set_visible(False)
+            ax.set_xlim(25, 85)
+            ax.set_ylim(*VALUE_LIMITS[column])
+            ax.set_xlabel("Age")
+            if j == 0:
+                ax.set_ylabel(f"{dataset.label} − {reference.label}\n{column}")
+            if difference is None:
+                ax.text(55, sum(VALUE_LIMITS[column]) / 2, "Too few rows to compare", ha="center", va="center")
+            else:
+                mesh = ax.pcolormesh(AGE_EDGES, VALUE_EDGES[column], difference.T, cmap="RdBu_r",
+                                     vmin=-limit, vmax=limit, rasterized=True)
+            shares = share(view, name), share(views[0], name)
+            ax.set_title(f"{title}\n{dataset.label} {shares[0]:.1f}% vs {reference.label} {shares[1]:.1f}% "
+                         f"of {parent} ({shares[0] - shares[1]:+.1f} pp)", fontsize=12)
+        if mesh is not None:
+            fig.colorbar(mesh, ax=axes[:, j], label="Difference (pp of cohort per cell)", shrink=0.8)
+    return fig
@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+
+from binning import AGE_EDGES, centers
+from schema import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+from profiling import span
+
+# --- Aggregation cube ---
+# A single pass bins every row into a cell of
+#   (HeartDisease, Sex, ChestPainType, RestingECG, ExerciseAngina, Age)
+# and accumulates row counts and MaxHR sums per cell. Cohort sizes, sex shares, age histograms
+# and mean-MaxHR-by-age lines are then slices of the cube, however many the charts ask for.
+# Every dimension ends with an "other" slot (unknown categories, missing values) so that slices
+# which do not filter on a dimension still count every row. Ages on the charts' grid come
+# first, followed by every other age the schema can hold, so the mean-MaxHR lines are those of
+# a groupby over any data while age histograms are the leading grid slots. Cohorts split by the
+# adjustable BP and cholesterol thresholds are served by thresholds.py instead.
+GRID_AGES = list(centers(AGE_EDGES).astype(int))
+_AGE_LIMITS = np.iinfo(NUMERIC_COLUMNS["Age"])
+OFF_GRID_AGES = [age for age in range(_AGE_LIMITS.min, _AGE_LIMITS.max + 1) if age not in GRID_AGES]
+
+DIMENSIONS = {
+    "HeartDisease": [0, 1],
+    "Sex": CATEGORICAL_COLUMNS["Sex"],
+    "ChestPainType": CATEGORICAL_COLUMNS["ChestPainType"],
+    "RestingECG": CATEGORICAL_COLUMNS["RestingECG"],
+    "ExerciseAngina": CATEGORICAL_COLUMNS["ExerciseAngina"],
+    "Age": GRID_AGES + OFF_GRID_AGES,
+}
+AXES = {dim: i for i, dim in enumerate(DIMENSIONS)}
+SHAPE = tuple(len(labels) + 1 for labels in DIMENSIONS.values())
+
+# Cube slot of every age the schema can hold, indexed by age - _AGE_LIMITS.min
+_AGE_SLOTS = np.empty(_AGE_LIMITS.max - _AGE_LIMITS.min + 1, dtype=np.int32)
+_AGE_SLOTS[np.array(DIMENSIONS["Age"]) - _AGE_LIMITS.min] = np.arange(len(DIMENSIONS["Age"]))
+
+# Cohort name -> {dimension: allowed labels}; these mirror the predicates of data_loader.COHORTS
+COHORT_SLICES = {
+    "diseased": {"HeartDisease": [1]},
+    "healthy": {"HeartDisease": [0]},
+}
+for _ecg in CATEGORICAL_COLUMNS["RestingECG"]:
+    COHORT_SLICES[f"resting_ecg_{_ecg.lower()}_bp_dis"] = {"HeartDisease": [1], "RestingECG": [_ecg]}
+for _induced, _angina in (("induced", "Y"), ("not_induced", "N")):
+    COHORT_SLICES[f"angina_{_induced}_dis"] = {"HeartDisease": [1], "ExerciseAngina": [_angina]}
+    for _pain in CATEGORICAL_COLUMNS["ChestPainType"]:
+        COHORT_SLICES[f"angina_{_induced}_{_pain.lower()}_dis"] = {
+            "HeartDisease": [1], "ExerciseAngina": [_angina], "ChestPainType": [_pain]}
+
+
+def dimension_codes(df, dim):
+    """Cube coordinates of every row along ``dim``; len(DIMENSIONS[dim]) is the "other" slot."""
+    other = len(DIMENSIONS[dim])
+    if dim in CATEGORICAL_COLUMNS:
+        # apply_schema puts the known categories first, so their codes line up with the cube
+        codes = df[dim].cat.codes.to_numpy().astype(np.int32)
+        codes[(codes < 0) | (codes >= other)] = other
+    elif dim == "HeartDisease":
+        values = df[dim].to_numpy()
+        codes = np.where((values == 0) | (values == 1), values, other).astype(np.int32)
+    else: # Age
+        # Ages are of the schema's integer type, so every value has a slot
+        codes = _AGE_SLOTS[df[dim].to_numpy().astype(np.int32) - _AGE_LIMITS.min]
+    return codes
+
+
+def grid_age_codes(df):
+    """Positions of every row's age on the charts' age grid, len(GRID_AGES) for any age off it."""
+    return np.minimum(dimension_codes(df, "Age"), len(GRID_AGES))
+
+
+class AggregationCube:
+    """Row counts and MaxHR sums over every combination of the cube dimensions."""
+    __slots__ = ("counts", "maxhr_sums")
+
+    def __init__(self, counts=None, maxhr_sums=None):
+        self.counts = np.zeros(SHAPE, dtype=np.int64) if counts is None else counts
+        self.maxhr_sums = np.zeros(SHAPE) if maxhr_sums is None else maxhr_sums
+
+    @classmethod
+    def from_frame(cls, df):
+        """Builds the cube from a typed frame in one vectorized pass."""
+        with span("preprocess.cube"):
+            # Row-major flat cell index, accumulated in place (the cube has far fewer than 2**31 cells)
+            flat = np.zeros(len(df), dtype=np.int32)
+            for dim, size in zip(DIMENSIONS, SHAPE):
+                flat *= size
+                flat += dimension_codes(df, dim)
+            n_cells = int(np.prod(SHAPE))
+            counts = np.bincount(flat, minlength=n_cells).reshape(SHAPE)
+            maxhr_sums = np.bincount(flat, weights=df["MaxHR"].to_numpy(), minlength=n_cells).reshape(SHAPE)
+        return cls(counts, maxhr_sums)
+
+    def __iadd__(self, other):
+        self.counts += other.counts
+        self.maxhr_sums += other.maxhr_sums
+        return self
+
+    def __add__(self, other):
+        return AggregationCube(self.counts + other.counts, self.maxhr_sums + other.maxhr_sums)
+
+    def cohort(self, name):
+        """Counts and MaxHR sums of a cohort by (Sex, Age), other dimensions summed out."""
+        filters = COHORT_SLICES[name]
+        index = tuple(
+            [DIMENSIONS[dim].index(label) for label in filters[dim]] if dim in filters else slice(None)
+            for dim in DIMENSIONS
+        )
+        keep = (AXES["Sex"], AXES["Age"])
+        drop = tuple(axis for axis in range(len(SHAPE)) if axis not in keep)
+        # Reduce one filtered axis at a time, so no fancy-indexed copy of the whole cube is made
+        counts, sums = self.counts, self.maxhr_sums
+        for axis, selection in enumerate(index):
+            if not isinstance(selection, slice):
+                counts = np.take(counts, selection, axis=axis)
+                sums = np.take(sums, selection, axis=axis)
+        return counts.sum(axis=drop), sums.sum(axis=drop)
+
+
+class CubeCohortsMixin:
+    """Cohort sizes, sex shares, age histograms and mean MaxHR lines as slices of ``self.cube``.
+
+    Classes using it provide a ``cube`` attribute and a ``_slices`` dict for memoizing slices;
+    ``_cohort_slice`` returns a cohort's counts by (Sex, Age) and its MaxHR sums (or None).
+    """
+    __slots__ = ()
+
+    def _cohort_slice(self, name):
+        cohort = self._slices.get(name)
+        if cohort is None:
+            cohort = self.cube.cohort(name)
+            self._slices[name] = cohort
+        return cohort
+
+    def size(self, name):
+        return int(self._cohort_slice(name)[0].sum())
+
+    def empty(self, name):
+        return self.size(name) == 0
+
+    def sex_pct(self, name, sex):
+        """Percentage of a cohort with the given Sex ('M' or 'F'); 0 for an empty cohort."""
+        counts = self._cohort_slice(name)[0]
+        size = counts.sum()
+        if size == 0:
+            return 0
+        return (counts[DIMENSIONS["Sex"].index(sex)].sum() / size) * 100
+
+    def age_hist(self, name, sex=None):
+        """Age counts on AGE_EDGES, for one sex or both."""
+        counts = self._cohort_slice(name)[0]
+        counts = counts.sum(axis=0) if sex is None else counts[DIMENSIONS["Sex"].index(sex)]
+        return counts[:len(AGE_EDGES) - 1]
+
+    def mean_maxhr_by_age(self, name):
+        """Mean MaxHR per Age, shaped like ``df.groupby("Age")[["MaxHR"]].mean()``."""
+        counts, sums = self._cohort_slice(name)
+        if sums is None:
+            raise KeyError(f"No MaxHR sums are aggregated for cohort '{name}'")
+        ages = np.array(DIMENSIONS["Age"])
+        order = np.argsort(ages)
+        counts, sums = counts.sum(axis=0)[order], sums.sum(axis=0)[order]
+        seen = counts > 0
+        index = pd.Index(ages[order][seen], name="Age")
+        return pd.DataFrame({"MaxHR": sums[seen] / counts[seen]}, index=index)
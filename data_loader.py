@@ -1,22 +1,220 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+from pyarrow import csv, feather
 import os
+import hashlib
+import threading
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from binning import AGE_EDGES, VALUE_EDGES, hist2d
+from kde import BinnedCohortsMixin
+from bootstrap import BootstrapCohortsMixin
+from schema import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+from cube import AggregationCube, CubeCohortsMixin
+from thresholds import SegmentedSortedIndex, SortedIndex, ValueIndex
+from sampling import lowest, priority_stream, sample_rows
+from profiling import span
+
+
+def apply_schema(df):
+    """Casts a raw heart.csv frame to the compact typed schema (in place where possible)."""
+    for col, dtype in NUMERIC_COLUMNS.items():
+        if col in df:
+            # Missing values are filled with 0, matching the original fillna(0) handling
+            df[col] = df[col].fillna(0).astype(dtype)
+    for col, categories in CATEGORICAL_COLUMNS.items():
+        if col in df:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                observed = df[col].cat.categories
+            else:
+                observed = df[col].dropna().unique()
+            extra = sorted(set(observed) - set(categories))
+            df[col] = df[col].astype(pd.CategoricalDtype(categories + extra))
+    return df
+
+
+def read_heart_csv(source):
+    """Parses a heart.csv file (path or file-like) with the pyarrow engine into the typed schema."""
+    return apply_schema(pd.read_csv(source, engine="pyarrow"))
+
+
+# CSV columns read block by block are given their schema types up front; pyarrow would
+# otherwise take each column's type from the first block alone (e.g. an all-integer Oldpeak)
+CSV_COLUMN_TYPES = {**{col: pa.from_numpy_dtype(np.dtype(dtype)) for col, dtype in NUMERIC_COLUMNS.items()},
+                    **{col: pa.string() for col in CATEGORICAL_COLUMNS}}
+
+
+def read_heart_csv_chunks(source, block_size=16 << 20):
+    """Parses a heart.csv file (path or file-like) ``block_size`` bytes at a time, yielding typed chunks."""
+    reader = csv.open_csv(source, read_options=csv.ReadOptions(block_size=block_size),
+                          convert_options=csv.ConvertOptions(column_types=CSV_COLUMN_TYPES))
+    for batch in reader:
+        yield apply_schema(batch.to_pandas())
+
+
+def concat_typed(chunks):
+    """Joins typed chunks into one typed frame, with the categories apply_schema gives the whole file."""
+    chunks = list(chunks)
+    for col, categories in CATEGORICAL_COLUMNS.items():
+        if chunks and col in chunks[0]:
+            observed = set().union(*(chunk[col].cat.categories for chunk in chunks))
+            dtype = pd.CategoricalDtype(categories + sorted(observed - set(categories)))
+            for chunk in chunks:
+                chunk[col] = chunk[col].astype(dtype) # Recodes only; concat then keeps the categorical
+    return pd.concat(chunks, ignore_index=True) if chunks else None
+
+
+# --- Sidecar cache ---
+# The typed frame is written next to the CSV as an uncompressed Feather (Arrow IPC) file,
+# which can be memory-mapped back in far faster than the CSV can be parsed. It is written as
+# a single record batch, so every column converts to pandas as a view of the mapped file.
+SIDECAR_SIGNATURE_KEY = b"heart_source_signature"
+
+
+def sidecar_path(file_path):
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}.feather")
+
+
+def source_signature(file_path):
+    """Identifies the current version of a source file by its size and mtime."""
+    stat = os.stat(file_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_sidecar_table(file_path, signature):
+    """Memory-maps the cached typed table, or returns None if there is no sidecar or it is stale."""
+    path = sidecar_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(SIDECAR_SIGNATURE_KEY) != signature.encode():
+        return None
+    return table
+
+
+def table_to_frame(table):
+    """Converts a typed table to pandas, zero-copy (and read-only) when its columns are unchunked."""
+    return table.to_pandas(split_blocks=True)
+
+
+def read_sidecar(file_path, signature):
+    """Returns the cached typed frame, or None if there is no sidecar or it is stale."""
+    table = read_sidecar_table(file_path, signature)
+    return None if table is None else table_to_frame(table)
+
+
+def write_typed_feather(path, df, metadata=None):
+    """Atomically writes a typed frame as one uncompressed record batch; returns whether it was written."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **(metadata or {})})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(table, tmp_path, compression="uncompressed", chunksize=max(len(df), 1))
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def write_sidecar(file_path, df, signature):
+    """Writes the typed frame as a sidecar; failures (e.g. read-only dirs) are not fatal."""
+    write_typed_feather(sidecar_path(file_path), df, {SIDECAR_SIGNATURE_KEY: signature.encode()})
+
+
+def load_typed(file_path):
+    """Loads a heart.csv path into the typed schema, reusing the sidecar while the CSV is unchanged."""
+    signature = source_signature(file_path)
+    with span("load.read_sidecar"):
+        df = read_sidecar(file_path, signature)
+    if df is None:
+        with span("load.parse_csv"):
+            df = read_heart_csv(file_path)
+        with span("load.write_sidecar"):
+            write_sidecar(file_path, df, signature)
+    return df
+
+
+# --- Shared dataset store ---
+# One read-only copy of each dataset per process: the sidecar is memory-mapped and every
+# session gets the same zero-copy frame over it, so an added session costs no dataset memory
+# (pages are shared with the OS page cache, too). Stores are keyed by the source signature,
+# so a changed CSV gets a new store while sessions still holding the old frame keep theirs.
+class SharedDataset:
+    """A read-only typed frame shared by every session, with the set of sessions using it."""
+
+    def __init__(self, file_path, signature, df, mapped):
+        self.file_path = file_path
+        self.signature = signature
+        self.df = df
+        self.mapped = mapped
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, file_path, signature):
+        """Maps the sidecar of ``file_path`` at ``signature``, parsing the CSV first if it is missing or stale."""
+        with span("load.read_sidecar"):
+            table = read_sidecar_table(file_path, signature)
+        if table is None:
+            df = load_typed(file_path) # Parses the CSV and writes the sidecar
+            with span("load.read_sidecar"):
+                table = read_sidecar_table(file_path, signature)
+            if table is None: # The sidecar could not be written; share the parsed frame
+                return cls(file_path, signature, df, mapped=False)
+        if any(column.num_chunks > 1 for column in table.columns):
+            table = table.combine_chunks() # Sidecars written in batches would convert to a copy anyway
+        return cls(file_path, signature, table_to_frame(table), mapped=True)
+
+    @property
+    def nbytes(self):
+        return int(self.df.memory_usage(index=False, deep=False).sum())
+
+    def attach(self):
+        """Returns the shared frame, recording the calling session as a user of it."""
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            with self._lock:
+                self._sessions.add(ctx.session_id)
+        return self.df
+
+    def session_count(self):
+        """How many connected sessions have attached to this dataset."""
+        with self._lock:
+            if runtime.exists():
+                active = runtime.get_instance().is_active_session
+                self._sessions = {session for session in self._sessions if active(session)}
+            return len(self._sessions)
+
+
+@st.cache_resource(max_entries=2)
+def _shared_dataset(file_path, signature):
+    return SharedDataset.open(file_path, signature)
+
+
+def shared_dataset(file_path):
+    """The process-wide store of the current version of ``file_path``."""
+    return _shared_dataset(file_path, source_signature(file_path))
+
 
-# Use caching to load data only once
-@st.cache_data
 def load_data(file_path="input/heart.csv"):
     """Loads the heart failure prediction dataset."""
     # Since Streamlit runs from the app's directory, adjust the path if needed
     # Check if the default path exists, otherwise prompt for upload
     if os.path.exists(file_path):
         try:
-            df = pd.read_csv(file_path)
-            # Basic preprocessing: Handle potential missing values if any (example: fill with 0)
-            # A better strategy might be needed depending on the actual data
-            df.fillna(0, inplace=True)
-            # Convert Cholesterol 0 values to NaN potentially, then impute, or handle as is.
-            # For this example, we'll keep 0s as they might represent missing data handled this way in the notebook.
-            return df
+            # Missing values are filled with 0 while casting to the typed schema.
+            # Cholesterol 0 values are kept, as they represent missing data handled this way in the notebook.
+            return shared_dataset(file_path).attach()
         except Exception as e:
             st.error(f"Error loading data from path: {e}")
             return None
@@ -25,83 +223,343 @@ def load_data(file_path="input/heart.csv"):
         uploaded_file = st.file_uploader("Upload heart.csv", type=['csv'])
         if uploaded_file is not None:
             try:
-                df = pd.read_csv(uploaded_file)
-                df.fillna(0, inplace=True)
-                return df
+                # Imported here, as the upload cache builds on this module
+                from upload_cache import get_upload_cache
+                return get_upload_cache().load(uploaded_file)
             except Exception as e:
                 st.error(f"Error loading uploaded file: {e}")
                 return None
         else:
             return None
 
-def preprocess_data_for_viz(df):
-    """Preprocesses data specifically for the visualizations."""
-    if df is None:
-        return None, None, None, None, None, None, None, None, None, None, None, None, None
-
-    # Common preprocessing
-    diseased_data = df.loc[df["HeartDisease"] == 1, :].copy()
-    healthy_data = df.loc[df["HeartDisease"] == 0, :].copy()
-
-    # --- BP Visualization Data ---
-    abnormal_bp_healthy = healthy_data.loc[(healthy_data["RestingBP"] < 115) | (healthy_data["RestingBP"] > 155), :].copy()
-    abnormal_bp_diseased = diseased_data.loc[(diseased_data["RestingBP"] < 115) | (diseased_data["RestingBP"] > 155), :].copy()
-    normal_bp_healthy = healthy_data.loc[(healthy_data["RestingBP"] >= 115) & (healthy_data["RestingBP"] <= 155), :].copy()
-    normal_bp_diseased = diseased_data.loc[(diseased_data["RestingBP"] >= 115) & (diseased_data["RestingBP"] <= 155), :].copy()
-
-    # --- Cholesterol Visualization Data ---
-    abnormal_cls_healthy = healthy_data.loc[healthy_data["Cholesterol"] > 200, :].copy()
-    abnormal_cls_diseased = diseased_data.loc[diseased_data["Cholesterol"] > 200, :].copy()
-    normal_cls_healthy = healthy_data.loc[healthy_data["Cholesterol"] <= 200, :].copy() # Includes 0 values
-    normal_cls_diseased = diseased_data.loc[diseased_data["Cholesterol"] <= 200, :].copy() # Includes 0 values
-
-    male_abnormal_cls_healthy_pct = 0
-    female_abnormal_cls_healthy_pct = 0
-    if not abnormal_cls_healthy.empty:
-        male_abnormal_cls_healthy_pct = (len(abnormal_cls_healthy.loc[abnormal_cls_healthy["Sex"] == "M", :]) / len(abnormal_cls_healthy)) * 100
-        female_abnormal_cls_healthy_pct = (len(abnormal_cls_healthy.loc[abnormal_cls_healthy["Sex"] == "F", :]) / len(abnormal_cls_healthy)) * 100
-
-    male_abnormal_cls_diseased_pct = 0
-    female_abnormal_cls_diseased_pct = 0
-    if not abnormal_cls_diseased.empty:
-        male_abnormal_cls_diseased_pct = (len(abnormal_cls_diseased.loc[abnormal_cls_diseased["Sex"] == "M", :]) / len(abnormal_cls_diseased)) * 100
-        female_abnormal_cls_diseased_pct = (len(abnormal_cls_diseased.loc[abnormal_cls_diseased["Sex"] == "F", :]) / len(abnormal_cls_diseased)) * 100
-
-
-    # --- ECG Visualization Data ---
-    resting_ecg_normal_bp_dis = diseased_data.loc[diseased_data["RestingECG"]=="Normal", :].copy()
-    resting_ecg_st_bp_dis = diseased_data.loc[diseased_data["RestingECG"]=="ST", :].copy()
-    resting_ecg_lvh_bp_dis = diseased_data.loc[diseased_data["RestingECG"]=="LVH", :].copy()
-
-    male_normal_ecg_pct = 0
-    female_normal_ecg_pct = 0
-    if not resting_ecg_normal_bp_dis.empty:
-        male_normal_ecg_pct = (len(resting_ecg_normal_bp_dis[resting_ecg_normal_bp_dis['Sex'] == 'M']) / len(resting_ecg_normal_bp_dis)) * 100
-        female_normal_ecg_pct = (len(resting_ecg_normal_bp_dis[resting_ecg_normal_bp_dis['Sex'] == 'F']) / len(resting_ecg_normal_bp_dis)) * 100
-
-    male_st_ecg_pct = 0
-    female_st_ecg_pct = 0
-    if not resting_ecg_st_bp_dis.empty:
-        male_st_ecg_pct = (len(resting_ecg_st_bp_dis[resting_ecg_st_bp_dis['Sex'] == 'M']) / len(resting_ecg_st_bp_dis)) * 100
-        female_st_ecg_pct = (len(resting_ecg_st_bp_dis[resting_ecg_st_bp_dis['Sex'] == 'F']) / len(resting_ecg_st_bp_dis)) * 100
-
-    male_lvh_ecg_pct = 0
-    female_lvh_ecg_pct = 0
-    if not resting_ecg_lvh_bp_dis.empty:
-        male_lvh_ecg_pct = (len(resting_ecg_lvh_bp_dis[resting_ecg_lvh_bp_dis['Sex'] == 'M']) / len(resting_ecg_lvh_bp_dis)) * 100
-        female_lvh_ecg_pct = (len(resting_ecg_lvh_bp_dis[resting_ecg_lvh_bp_dis['Sex'] == 'F']) / len(resting_ecg_lvh_bp_dis)) * 100
-
-
-    return (df, diseased_data, healthy_data,
-            abnormal_bp_healthy, abnormal_bp_diseased,
-            normal_bp_healthy, normal_bp_diseased,
-            abnormal_cls_healthy, abnormal_cls_diseased,
-            normal_cls_healthy, normal_cls_diseased,
-            male_abnormal_cls_healthy_pct, female_abnormal_cls_healthy_pct,
-            male_abnormal_cls_diseased_pct, female_abnormal_cls_diseased_pct,
-            resting_ecg_normal_bp_dis, resting_ecg_st_bp_dis, resting_ecg_lvh_bp_dis,
-            male_normal_ecg_pct, female_normal_ecg_pct,
-            male_st_ecg_pct, female_st_ecg_pct,
-            male_lvh_ecg_pct, female_lvh_ecg_pct
-            )
 
+# --- Cohort definitions ---
+# name -> (parent cohort, predicate). Predicates receive ``col(name)`` which returns
+# the parent cohort's rows of that column, so no intermediate frame is copied.
+# The normal/abnormal BP and cholesterol cohorts depend on adjustable thresholds and are
+# defined in thresholds.py.
+COHORTS = {
+    "diseased": (None, lambda col: col("HeartDisease") == 1),
+    "healthy": (None, lambda col: col("HeartDisease") == 0),
+    # ECG Visualization
+    "resting_ecg_normal_bp_dis": ("diseased", lambda col: col("RestingECG") == "Normal"),
+    "resting_ecg_st_bp_dis": ("diseased", lambda col: col("RestingECG") == "ST"),
+    "resting_ecg_lvh_bp_dis": ("diseased", lambda col: col("RestingECG") == "LVH"),
+    # Angina Visualization
+    "angina_induced_dis": ("diseased", lambda col: col("ExerciseAngina") == "Y"),
+    "angina_not_induced_dis": ("diseased", lambda col: col("ExerciseAngina") == "N"),
+}
+PAIN_TYPES = ['TA', 'ATA', 'NAP', 'ASY']
+for _pain in PAIN_TYPES:
+    COHORTS[f"angina_induced_{_pain.lower()}_dis"] = ("angina_induced_dis", lambda col, p=_pain: col("ChestPainType") == p)
+    COHORTS[f"angina_not_induced_{_pain.lower()}_dis"] = ("angina_not_induced_dis", lambda col, p=_pain: col("ChestPainType") == p)
+
+
+def merge_trailing(segments, size, merge):
+    """Merges the last two ``segments`` while the newer is at least half the size of the one before it.
+
+    Segment sizes then at least double going back, so as segments are appended there are
+    logarithmically many and each row is copied a logarithmic number of times.
+    """
+    segments = list(segments)
+    while len(segments) > 1 and 2 * size(segments[-1]) >= size(segments[-2]):
+        segments[-2:] = [merge(*segments[-2:])]
+    return segments
+
+
+class CohortBundle(CubeCohortsMixin, BinnedCohortsMixin, BootstrapCohortsMixin):
+    """Lazily computed cohort subsets and aggregates for the visualizations.
+
+    Sizes, sex percentages, age histograms and mean MaxHR lines are slices of an
+    aggregation cube built in one pass over the frame. Each cohort is resolved to an
+    array of row positions only when its points, 2-D histogram or threshold indexes are
+    needed, and memoized; frames are only built from those positions on request.
+
+    A bundle with rows appended (``extended``) holds its rows as segments: bundles over
+    consecutive row ranges. Its aggregates are summed over the segments and its samples
+    drawn from theirs; the frame, cohort rows and priorities of all rows are only joined
+    up when asked for.
+    """
+    __slots__ = ("_df", "_rows", "_cube", "_slices", "_indexes", "_hists", "_kdes", "_bands", "_fingerprint",
+                 "_priorities", "_segments", "_offsets")
+    has_rows = True
+
+    def __init__(self, df, fingerprint=None):
+        self._df = df
+        self._rows = {}
+        self._cube = None
+        self._slices = {}
+        self._indexes = {}
+        self._hists = {}
+        self._kdes = {}
+        self._bands = {}
+        self._fingerprint = fingerprint
+        self._priorities = None
+        self._segments = None
+        self._offsets = None
+
+    @classmethod
+    def from_chunks(cls, chunks, fingerprint=None):
+        """A bundle over consecutive typed frames, each a segment."""
+        if len(chunks) == 1:
+            return cls(chunks[0], fingerprint)
+        return cls._segmented([cls(chunk) for chunk in chunks], fingerprint)
+
+    @classmethod
+    def _segmented(cls, segments, fingerprint=None):
+        bundle = cls(None, fingerprint)
+        bundle._segments = segments
+        bundle._offsets = np.cumsum([0] + [segment.n_rows for segment in segments[:-1]])
+        return bundle
+
+    @property
+    def df(self):
+        if self._df is None and self._segments is not None:
+            with span("preprocess.concat"):
+                # Shallow copies: concat_typed recodes its inputs' categoricals in place
+                self._df = concat_typed([segment.df.copy(deep=False) for segment in self._segments])
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+
+    @property
+    def chunks(self):
+        """The typed frames of the segments (the frame itself when there are none)."""
+        return [self.df] if self._segments is None else [segment.df for segment in self._segments]
+
+    @property
+    def n_rows(self):
+        if self._segments is None:
+            return len(self._df)
+        return int(self._offsets[-1]) + self._segments[-1].n_rows
+
+    def _summed(self, aggregate):
+        """``aggregate(segment)`` added up over the segments."""
+        total = aggregate(self._segments[0])
+        for segment in self._segments[1:]:
+            total = total + aggregate(segment)
+        return total
+
+    @property
+    def fingerprint(self):
+        """Identifies the dataset contents, for keying caches of rendered results."""
+        if self._fingerprint is None:
+            hashes = pd.util.hash_pandas_object(self.df, index=False).to_numpy()
+            self._fingerprint = hashlib.sha1(hashes.tobytes()).hexdigest()
+        return self._fingerprint
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            if self._segments is not None:
+                self._cube = self._summed(lambda segment: segment.cube)
+            else:
+                self._cube = AggregationCube.from_frame(self.df)
+        return self._cube
+
+    def rows(self, name):
+        """Returns the (memoized) row positions of a cohort within ``df``."""
+        idx = self._rows.get(name)
+        if idx is None:
+            parent, predicate = COHORTS[name]
+            if self._segments is not None:
+                idx = np.concatenate([segment.rows(name) + offset
+                                      for segment, offset in zip(self._segments, self._offsets)])
+            elif parent is None:
+                with span("preprocess.subset"):
+                    idx = np.flatnonzero(predicate(lambda c: self.df[c]).to_numpy())
+            else:
+                parent_idx = self.rows(parent)
+                with span("preprocess.subset"):
+                    mask = predicate(lambda c: self.df[c].take(parent_idx))
+                    idx = parent_idx[mask.to_numpy()]
+            self._rows[name] = idx
+        return idx
+
+    def value_index(self, name, column):
+        """ValueIndex of a cohort's ``column``, for threshold range queries."""
+        key = ("value", name, column)
+        index = self._indexes.get(key)
+        if index is None:
+            if self._segments is not None:
+                index = self._summed(lambda segment: segment.value_index(name, column))
+            else:
+                rows = self.rows(name)
+                with span("preprocess.index"):
+                    index = ValueIndex.from_frame(self.df[["Sex", "Age", column]].take(rows), column)
+            self._indexes[key] = index
+        return index
+
+    def sorted_index(self, name, column):
+        """A cohort's row positions sorted by ``column``, for slicing at thresholds."""
+        key = ("sorted", name, column)
+        index = self._indexes.get(key)
+        if index is None:
+            if self._segments is not None:
+                index = SegmentedSortedIndex([segment.sorted_index(name, column) for segment in self._segments],
+                                             self._offsets)
+            else:
+                rows = self.rows(name)
+                with span("preprocess.index"):
+                    index = SortedIndex(rows, self.df[column].to_numpy()[rows])
+            self._indexes[key] = index
+        return index
+
+    @property
+    def priorities(self):
+        """Seeded sampling priority of every row (see sampling.py)."""
+        if self._priorities is None:
+            if self._segments is not None:
+                self._segment_priorities()
+                self._priorities = np.concatenate([segment._priorities for segment in self._segments])
+            else:
+                self._priorities = priority_stream().random(len(self.df))
+        return self._priorities
+
+    def _segment_priorities(self):
+        # Each segment's priorities continue the stream from its first row
+        for segment, offset in zip(self._segments, self._offsets):
+            if segment._priorities is None:
+                segment._priorities = priority_stream(offset).random(segment.n_rows)
+
+    def sample(self, name, column, n):
+        """Age and ``column`` values of a seeded sample of ``n`` of a cohort's points."""
+        if self._segments is not None:
+            return self._sample_segments([segment.rows(name) for segment in self._segments], column, n)
+        return sample_rows(self.df, self.priorities, self.rows(name), column, n)
+
+    def sample_split(self, parent, split_column, low, high, inside, column, n):
+        """Like ``sample``, for the rows of ``parent`` with ``split_column`` within [low, high] (or outside it).
+
+        The points come in the order of the rows in ``sorted_index(parent, split_column)``.
+        """
+        if self._segments is not None:
+            rows = [segment.sorted_index(parent, split_column).positions(low, high, inside) for segment in self._segments]
+            return self._sample_segments(rows, column, n, order_by=split_column)
+        rows = self.sorted_index(parent, split_column).positions(low, high, inside)
+        return sample_rows(self.df, self.priorities, rows, column, n)
+
+    def _sample_segments(self, rows, column, n, order_by=None):
+        # The n lowest priorities overall are among the n lowest of each segment
+        self._segment_priorities()
+        priorities, positions, ages, values, keys = [], [], [], [], []
+        for segment, offset, segment_rows in zip(self._segments, self._offsets, rows):
+            kept = segment_rows[lowest(segment._priorities[segment_rows], n)]
+            priorities.append(segment._priorities[kept])
+            positions.append(kept + offset)
+            ages.append(segment.df["Age"].to_numpy()[kept])
+            values.append(segment.df[column].to_numpy()[kept])
+            if order_by is not None:
+                keys.append(segment.df[order_by].to_numpy()[kept])
+        chosen = lowest(np.concatenate(priorities), n)
+        ages, values = np.concatenate(ages)[chosen], np.concatenate(values)[chosen]
+        if order_by is not None:
+            # Segments come in position order; one index of all rows orders by value first
+            order = np.lexsort((np.concatenate(positions)[chosen], np.concatenate(keys)[chosen]))
+            ages, values = ages[order], values[order]
+        return ages, values
+
+    def extended(self, chunk, fingerprint=None):
+        """A new bundle with the typed rows of ``chunk`` appended; this one is left unchanged.
+
+        The rows become a new segment. Aggregates and histograms already computed here are
+        added to the chunk's, and trailing segments are merged as in merge_trailing, so the
+        cost scales with the rows appended (amortized), not with the rows already held.
+        """
+        with span("preprocess.extend"):
+            increment = CohortBundle(chunk)
+            segments = merge_trailing([*(self._segments or [self]), increment], lambda segment: segment.n_rows,
+                                      CohortBundle._concatenated)
+            bundle = CohortBundle._segmented(segments, fingerprint)
+            if self._cube is not None:
+                bundle._cube = self._cube + increment.cube
+            for key, index in self._indexes.items():
+                kind, name, column = key
+                if kind == "value":
+                    bundle._indexes[key] = index + increment.value_index(name, column)
+            for key, counts in self._hists.items():
+                bundle._hists[key] = counts + increment.hist2d(*key)
+        return bundle
+
+    def _concatenated(self, other):
+        """One bundle over the rows of two unsegmented bundles, carrying the work done on them over."""
+        offset = self.n_rows
+        bundle = CohortBundle(concat_typed([self.df.copy(deep=False), other.df.copy(deep=False)]))
+        if self._cube is not None:
+            bundle._cube = self._cube + other.cube
+        for name, rows in self._rows.items():
+            bundle._rows[name] = np.concatenate([rows, other.rows(name) + offset])
+        for key, index in self._indexes.items():
+            kind, name, column = key
+            if kind == "value":
+                bundle._indexes[key] = index + other.value_index(name, column)
+            else:
+                rows = other.rows(name)
+                bundle._indexes[key] = index.extended(rows + offset, other.df[column].to_numpy()[rows])
+        for key, counts in self._hists.items():
+            bundle._hists[key] = counts + other.hist2d(*key)
+        if self._priorities is not None and other._priorities is not None:
+            bundle._priorities = np.concatenate([self._priorities, other._priorities])
+        return bundle
+
+    def head(self, n=5):
+        if self._segments is not None and self._segments[0].n_rows >= n:
+            return self._segments[0].head(n)
+        return self.df.head(n)
+
+    def take(self, rows, columns=None):
+        """The rows at positions ``rows``, optionally limited to ``columns``, without joining up segments."""
+        if self._segments is None:
+            frame = self.df if columns is None else self.df[columns]
+            return frame.take(rows)
+        which = np.searchsorted(self._offsets, rows, side="right") - 1
+        order = np.argsort(which, kind="stable")
+        ordered = rows[order]
+        bounds = np.searchsorted(which[order], np.arange(len(self._segments) + 1))
+        frame = concat_typed([segment.take(ordered[start:stop] - offset, columns)
+                              for segment, offset, start, stop in zip(self._segments, self._offsets, bounds, bounds[1:])])
+        frame.index = ordered
+        return frame.iloc[np.argsort(order)]
+
+    def subset(self, name, columns=None):
+        """Returns the cohort rows, optionally limited to ``columns``."""
+        return self.take(self.rows(name), columns)
+
+    def column(self, name, column):
+        """Returns a single column of a cohort as a Series."""
+        return self.take(self.rows(name), [column])[column]
+
+    def hist2d(self, name, column):
+        """Age x ``column`` counts on (AGE_EDGES, VALUE_EDGES[column])."""
+        key = (name, column)
+        counts = self._hists.get(key)
+        if counts is None:
+            if self._segments is not None:
+                counts = self._summed(lambda segment: segment.hist2d(name, column))
+            else:
+                x, y = self.column(name, "Age").to_numpy(), self.column(name, column).to_numpy()
+                with span("preprocess.bin"):
+                    counts = hist2d(x, y, AGE_EDGES, VALUE_EDGES[column])
+            self._hists[key] = counts
+        return counts
+
+
+@st.cache_resource(max_entries=8)
+def _shared_bundle(fingerprint, _bundle):
+    # The first bundle built for a dataset is shared by every later rerun and session,
+    # so its memoized cohorts, histograms and KDE spectra survive parameter changes.
+    return _bundle
+
+
+def preprocess_data_for_viz(df, fingerprint=None):
+    """Wraps the data in a lazy cohort bundle for the visualizations.
+
+    ``fingerprint`` identifies the source (e.g. path and signature); without it one is
+    hashed from the data the first time it is needed.
+    """
+    if df is None:
+        return None
+    bundle = CohortBundle(df, fingerprint)
+    return _shared_bundle(bundle.fingerprint, bundle)
@@ -0,0 +1,125 @@
+"""Headless batch export of the dashboard charts.
+
+Renders any of the four charts for a heart.csv-schema file to PNG, SVG or PDF without a
+Streamlit session, sweeping over bandwidth, scatter alpha, shading, interpolation kind and
+confidence bands.
+Variants are spread across a process pool.
+
+Example:
+    python export_charts.py input/heart.csv --charts bp ecg --bw 0.5 1 2 --alpha 0.2 0.4 --format png svg
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data_loader import source_signature
+from figure_templates import release_figure
+from precompute import build_chart, init_worker
+from thresholds import DEFAULT_THRESHOLDS
+from visualizations import VISUALIZATIONS
+
+# Short CLI names -> dashboard chart labels
+CHARTS = {
+    "bp": "Blood Pressure vs Age",
+    "cholesterol": "Cholesterol vs Age",
+    "angina": "Angina vs Max HR",
+    "ecg": "Resting ECG vs BP",
+}
+INTERPOLATION_KINDS = ['linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic']
+
+
+
+def sweep(charts, bandwidths, alphas, shades, interpolation_kinds, bands=(False,), thresholds=None):
+    """Yields (chart, params) for every distinct variant; each chart only sweeps the parameters it uses."""
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    for chart in charts:
+        visualization = VISUALIZATIONS[CHARTS[chart]]
+        for bw, alpha, shade, kind, band in itertools.product(*[
+                values if name in visualization.params else [None] for name, values in [
+                    ("kde_bw_adjust", bandwidths), ("scatter_alpha", alphas), ("kde_shade", shades),
+                    ("interpolation_kind", interpolation_kinds), ("confidence_bands", bands)]]):
+            controls = dict(kde_bw_adjust=bw, scatter_alpha=alpha, kde_shade=shade, interpolation_kind=kind,
+                            confidence_bands=band, thresholds=thresholds)
+            yield chart, visualization.chart_params(controls)
+
+
+def variant_name(chart, params):
+    parts = [chart]
+    if "interpolation_kind" in params:
+        parts.append(params["interpolation_kind"])
+    if params.get("confidence_bands"):
+        parts.append("bands")
+    if "kde_bw_adjust" in params:
+        parts += [f"bw{params['kde_bw_adjust']:g}", f"alpha{params['scatter_alpha']:g}", f"shade{int(params['kde_shade'])}"]
+    return "_".join(parts)
+
+
+def export_variant(chart, params, source, fingerprint, out_dir, formats, dpi):
+    """Renders one variant in a worker and writes it in each format; returns the written paths."""
+    fig = build_chart(CHARTS[chart], source, fingerprint, params)
+    if fig is None:
+        return []
+    paths = []
+    try:
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{variant_name(chart, params)}.{fmt}")
+            fig.savefig(path, format=fmt, dpi=dpi, bbox_inches="tight")
+            paths.append(path)
+    finally:
+        release_figure(fig)
+    return paths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export heart failure dashboard charts without a browser.")
+    parser.add_argument("csv", help="Path to a heart.csv-schema file")
+    parser.add_argument("--charts", nargs="+", choices=sorted(CHARTS), default=sorted(CHARTS))
+    parser.add_argument("--format", nargs="+", choices=["png", "svg", "pdf"], default=["png"], dest="formats")
+    parser.add_argument("--bw", nargs="+", type=float, default=[1.0], help="KDE bandwidth adjustments")
+    parser.add_argument("--alpha", nargs="+", type=float, default=[0.4], help="Scatter point alphas")
+    parser.add_argument("--shade", nargs="+", choices=["on", "off"], default=["on"], help="KDE shading")
+    parser.add_argument("--interpolation", nargs="+", choices=INTERPOLATION_KINDS, default=["cubic"],
+                        help="Interpolation kinds for the angina chart")
+    parser.add_argument("--bands", nargs="+", choices=["on", "off"], default=["off"],
+                        help="Bootstrap confidence bands on the angina chart")
+    parser.add_argument("--bp-range", nargs=2, type=int, metavar=("LOW", "HIGH"),
+                        default=[DEFAULT_THRESHOLDS["bp_low"], DEFAULT_THRESHOLDS["bp_high"]], help="Normal BP range (mmHg)")
+    parser.add_argument("--cholesterol-high", type=int, default=DEFAULT_THRESHOLDS["cholesterol_high"],
+                        help="High cholesterol cutoff (mg/dL)")
+    parser.add_argument("--out", default="exports", help="Output directory")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--streamed", action="store_true",
+                        help="Render from chunked streaming aggregates instead of loading the full frame")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    mode = "streamed" if args.streamed else "typed"
+    source = (mode, args.csv)
+    fingerprint = f"{mode}:{args.csv}:{source_signature(args.csv)}"
+    shades = [shade == "on" for shade in args.shade]
+    thresholds = dict(bp_low=args.bp_range[0], bp_high=args.bp_range[1], cholesterol_high=args.cholesterol_high)
+    bands = [band == "on" for band in args.bands]
+    variants = list(sweep(args.charts, args.bw, args.alpha, shades, args.interpolation, bands, thresholds))
+
+    start = time.perf_counter()
+    written = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        futures = {executor.submit(export_variant, chart, params, source, fingerprint, args.out, args.formats, args.dpi):
+                   (chart, params) for chart, params in variants}
+        for future in as_completed(futures):
+            chart, params = futures[future]
+            paths = future.result()
+            if not paths:
+                print(f"skipped {variant_name(chart, params)} (nothing to draw)")
+            written += len(paths)
+    print(f"Exported {written} files for {len(variants)} variants to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
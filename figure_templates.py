@@ -0,0 +1,97 @@
+import threading
+
+# --- Figure templates ---
+# Each chart's figure, axes and static decoration (spines, ticks, limits, titles, fixed labels)
+# is built once by a scaffold function and then reused. A render checks out an idle template,
+# updates the decoration that depends on parameters (threshold lines, percentages) in place and
+# draws the data layers; releasing the template after encoding removes those data artists
+# again. Figures are created without pyplot, so its global figure registry never holds them,
+# and at most MAX_IDLE_TEMPLATES per chart are kept between renders.
+MAX_IDLE_TEMPLATES = 2
+
+# Scaffold guide lines are created before the data, so they sit between data lines (2) and text (3)
+GUIDE_ZORDER = 2.5
+
+
+class FigureTemplate:
+    """A chart scaffold: the figure, its axes and the named artists renders update in place."""
+    __slots__ = ("figure", "axes", "artists", "pool", "in_use", "_static", "_positions")
+
+    def __init__(self, figure, axes, artists, pool=None):
+        self.figure = figure
+        self.axes = axes
+        self.artists = artists
+        self.pool = pool
+        self.in_use = True
+        # Everything on the axes now is scaffold; anything added later is a data artist
+        self._static = {id(artist) for ax in figure.axes for artist in self._layers(ax)}
+        # Layout engines (constrained layout) start from the current axes positions, so each render
+        # starts from the scaffold's to lay out exactly as a fresh figure would
+        self._positions = [ax.get_position(original=True).frozen() for ax in figure.axes]
+        figure.template = self
+
+    @staticmethod
+    def _layers(ax):
+        return [*ax.lines, *ax.collections, *ax.images, *ax.patches, *ax.texts]
+
+    def reset(self):
+        """Removes the data artists (and legends) drawn since the scaffold was built."""
+        for ax, position in zip(self.figure.axes, self._positions):
+            ax._set_position(position)
+            for artist in self._layers(ax):
+                if id(artist) not in self._static:
+                    artist.remove()
+            if ax.get_legend() is not None:
+                ax.get_legend().remove()
+            # Autoscaled axes would otherwise keep the extent of every earlier render
+            ax.relim()
+
+    def release(self):
+        """Clears the data layers and returns the template to its pool (once per checkout)."""
+        if not self.in_use:
+            return
+        self.in_use = False
+        if self.pool is None:
+            self.figure.clear()
+        else:
+            self.pool.release(self)
+
+
+class TemplatePool:
+    """Idle templates of one chart; ``scaffold()`` builds a new (figure, axes, artists) on demand.
+
+    Each checked-out template is used by one render at a time, so concurrent sessions never
+    draw on the same figure.
+    """
+
+    def __init__(self, scaffold, max_idle=MAX_IDLE_TEMPLATES):
+        self.scaffold = scaffold
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        with self._lock:
+            if self._idle:
+                template = self._idle.pop()
+                template.in_use = True
+                return template
+        return FigureTemplate(*self.scaffold(), pool=self)
+
+    def release(self, template):
+        template.reset()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(template)
+                return
+        template.figure.clear() # Over the idle limit: let it be collected
+
+
+def release_figure(fig):
+    """Releases a finished figure: templated figures go back to their pool, others are closed."""
+    template = getattr(fig, "template", None)
+    if template is not None:
+        template.release()
+    else:
+        import matplotlib.pyplot as plt
+        plt.close(fig)
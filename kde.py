@@ -0,0 +1,119 @@
+import numpy as np
+
+from binning import AGE_EDGES, VALUE_EDGES, centers
+from profiling import span
+
+# --- Binned FFT kernel density estimation ---
+# Data is binned once onto the shared grids (binning.py); a density for any bandwidth is then
+# a single FFT convolution of the cached count spectrum with a Gaussian kernel. Bandwidths
+# follow Scott's rule scaled by ``bw_adjust``, as seaborn's kdeplot does.
+
+
+class BinnedKDE:
+    """Kernel density estimate over binned counts (1-D or 2-D) on uniform grids."""
+    __slots__ = ("counts", "edges", "n", "_cov", "_spectrum", "_densities")
+
+    def __init__(self, counts, *edges):
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.edges = edges
+        self.n = self.counts.sum()
+        self._cov = None
+        self._spectrum = None
+        self._densities = {}
+
+    @property
+    def widths(self):
+        return np.array([e[1] - e[0] for e in self.edges])
+
+    def covariance(self):
+        """Sample covariance of the binned data (bin centres weighted by counts)."""
+        if self._cov is None:
+            grids = np.meshgrid(*[centers(e) for e in self.edges], indexing="ij")
+            points = np.stack([g.ravel() for g in grids])
+            weights = self.counts.ravel()
+            mean = points @ weights / self.n
+            deviations = points - mean[:, None]
+            self._cov = (deviations * weights) @ deviations.T / max(self.n - 1, 1)
+        return self._cov
+
+    def _count_spectrum(self):
+        # Zero-padding to twice the grid keeps the circular FFT convolution linear
+        if self._spectrum is None:
+            self._spectrum = np.fft.rfftn(self.counts, s=[2 * s for s in self.counts.shape])
+        return self._spectrum
+
+    def _kernel(self, bw_adjust):
+        """Gaussian kernel sampled at all bin offsets, laid out for circular convolution."""
+        dims = self.counts.ndim
+        factor = self.n ** (-1 / (dims + 4)) * bw_adjust
+        cov = self.covariance() * factor ** 2
+        offsets = [np.fft.fftfreq(2 * s, 1 / (2 * s)) * w for s, w in zip(self.counts.shape, self.widths)]
+        grids = np.meshgrid(*offsets, indexing="ij")
+        points = np.stack([g.ravel() for g in grids])
+        inv = np.linalg.inv(cov)
+        mahalanobis = np.einsum("ij,ik,kj->j", points, inv, points)
+        norm = np.sqrt((2 * np.pi) ** dims * np.linalg.det(cov))
+        return (np.exp(-0.5 * mahalanobis) / norm).reshape(grids[0].shape)
+
+    def density(self, bw_adjust=1.0):
+        """Density at the bin centres, or None when there is too little data to estimate one."""
+        if self.n < 2:
+            return None
+        density = self._densities.get(bw_adjust)
+        if density is None:
+            cov = self.covariance()
+            if np.linalg.det(np.atleast_2d(cov)) <= 0:
+                return None
+            with span("kde"):
+                density = self._convolve(self._count_spectrum(), self.n, bw_adjust)
+            # Only the last few bandwidths per cohort are kept
+            if len(self._densities) >= 8:
+                self._densities.pop(next(iter(self._densities)))
+            self._densities[bw_adjust] = density
+        return density
+
+    def _convolve(self, count_spectrum, n, bw_adjust):
+        padded_shape = [2 * s for s in self.counts.shape]
+        kernel_spectrum = np.fft.rfftn(self._kernel(bw_adjust), s=padded_shape)
+        full = np.fft.irfftn(count_spectrum * kernel_spectrum, s=padded_shape)
+        density = full[tuple(slice(0, s) for s in self.counts.shape)] / n
+        return np.clip(density, 0, None)
+
+    def smooth(self, counts, bw_adjust=1.0):
+        """Density of other ``counts`` on the same grid, smoothed with this estimate's kernel.
+
+        Densities of several datasets smoothed with the kernel of their pooled counts share one
+        bandwidth, so they can be subtracted. None when either has too little data.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        n = counts.sum()
+        if n == 0 or self.density(bw_adjust) is None:
+            return None
+        with span("kde"):
+            return self._convolve(np.fft.rfftn(counts, s=[2 * s for s in counts.shape]), n, bw_adjust)
+
+
+class BinnedCohortsMixin:
+    """Memoized BinnedKDEs for cohort containers exposing ``age_hist`` and ``hist2d``."""
+    __slots__ = ()
+
+    def kde(self, name, column=None, sex=None):
+        """BinnedKDE of a cohort's Age counts (optionally for one sex), or Age x ``column``."""
+        key = (name, column, sex)
+        kde = self._kdes.get(key)
+        if kde is None:
+            if column is None:
+                kde = BinnedKDE(self.age_hist(name, sex), AGE_EDGES)
+            else:
+                kde = BinnedKDE(self.hist2d(name, column), AGE_EDGES, VALUE_EDGES[column])
+            self._kdes[key] = kde
+        return kde
+
+
+def iso_proportion_levels(density, levels=10, thresh=0.05):
+    """Density values enclosing the given proportions of mass (seaborn's contour levels)."""
+    values = np.sort(density.ravel())[::-1]
+    cumulative = np.cumsum(values) / values.sum()
+    proportions = np.linspace(thresh, 1, levels)
+    idx = np.searchsorted(cumulative, 1 - proportions)
+    return np.unique(np.take(values, idx, mode="clip"))
@@ -0,0 +1,172 @@
+import streamlit as st
+import io
+import os
+import threading
+import pyarrow as pa
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from data_loader import (CohortBundle, concat_typed, merge_trailing, read_heart_csv, read_heart_csv_chunks,
+                         shared_dataset, source_signature)
+from streaming import StreamedCohorts
+from profiling import span
+
+# --- Watched-file refresh ---
+# A heart.csv that is appended to is watched with watchdog. When it grows and the bytes just
+# before the last position read are unchanged, only the new complete lines are parsed (with
+# the header put in front) and folded into copy-on-write successors of the cached cohorts.
+# The appended rows are kept as a new segment of the in-memory cohorts (see
+# CohortBundle.extended) and aggregates, histograms and sampling reservoirs are updated from
+# them alone, so a refresh costs in proportion to the rows appended. Anything else
+# (a shrunk or rewritten file) reloads it. Sessions poll the version and rerun when it changes.
+POLL_SECONDS = 2
+
+# Bytes before the last read position compared to tell an append from a rewrite
+TAIL_BYTES = 4096
+
+
+class LiveDataset:
+    """The rows of a watched CSV read so far, as in-memory cohorts and/or streamed aggregates.
+
+    Each version's cohorts are never modified once published, so sessions rendering an older
+    version are unaffected by a refresh.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.version = 0
+        self.appends = 0
+        self.appended_rows = 0
+        self.error = None
+        self._lock = threading.Lock() # Guards the published version
+        self._refresh_lock = threading.Lock() # One refresh at a time
+        self._load()
+
+    def _load(self):
+        """(Re)starts from the complete lines of the file as it is now, normally the shared typed frame."""
+        try:
+            dataset = shared_dataset(self.file_path)
+        except ValueError: # Unparseable, e.g. while a short last line is being written
+            dataset = None
+        if dataset is not None:
+            # The store's signature is "size:mtime" of exactly the bytes it was loaded from
+            generation, frame = dataset.signature, dataset.df
+            offset = int(generation.split(":")[0])
+            with open(self.file_path, "rb") as f:
+                header = f.readline()
+                f.seek(max(offset - TAIL_BYTES, 0))
+                tail = f.read(offset - f.tell())
+        if dataset is None or (tail and not tail.endswith(b"\n")):
+            # A line was being written when the file was loaded; as in refresh, it waits for its end
+            generation = source_signature(self.file_path)
+            with open(self.file_path, "rb") as f:
+                data = f.read(int(generation.split(":")[0]))
+            header = data[:data.find(b"\n") + 1]
+            offset = data.rfind(b"\n") + 1
+            with span("load.parse_csv"):
+                frame = read_heart_csv(io.BytesIO(data[:offset]))
+            tail = data[max(offset - TAIL_BYTES, 0):offset]
+        with self._lock:
+            self._generation = generation
+            self._header = header
+            self._offset = offset
+            self._tail = tail
+            self._bundle = None
+            self._streamed = None
+            self._chunks = [frame]
+            self.version += 1
+
+    def _fingerprint(self, streamed, offset=None):
+        offset = self._offset if offset is None else offset
+        return f"{'streamed-' if streamed else ''}live:{self.file_path}:{self._generation}:{offset}"
+
+    def current(self, streamed=False):
+        """(version, cohorts) of the rows read so far; cohorts are built on first request."""
+        with self._lock:
+            if streamed and self._streamed is None:
+                cohorts = StreamedCohorts(self._fingerprint(True))
+                with pa.memory_map(self.file_path) as source:
+                    for chunk in read_heart_csv_chunks(pa.BufferReader(source.read_buffer(self._offset))):
+                        cohorts.update(chunk)
+                self._streamed = cohorts
+            elif not streamed and self._bundle is None:
+                self._bundle = CohortBundle.from_chunks(self._chunks, self._fingerprint(False))
+            return self.version, self._streamed if streamed else self._bundle
+
+    def refresh(self):
+        """Folds rows appended since the last refresh in; reloads if the file was not appended to."""
+        with self._refresh_lock:
+            try:
+                size = os.path.getsize(self.file_path)
+                if size == self._offset:
+                    return
+                with open(self.file_path, "rb") as f:
+                    f.seek(self._offset - len(self._tail))
+                    data = f.read(size - f.tell()) if size > self._offset else b""
+                if size < self._offset or data[:len(self._tail)] != self._tail:
+                    self._load()
+                    return
+                data = data[len(self._tail):]
+                data = data[:data.rfind(b"\n") + 1] # A partly written last line waits for the next refresh
+                if data:
+                    self._fold(data)
+                self.error = None
+            except Exception as e:
+                self.error = e
+
+    def _fold(self, data):
+        with span("load.parse_append"):
+            chunk = read_heart_csv(io.BytesIO(self._header + data))
+        with self._lock:
+            chunks, bundle, streamed = self._chunks, self._bundle, self._streamed
+        offset = self._offset + len(data)
+        # Cohorts nobody has asked for yet are built from the chunks when first requested
+        if bundle is not None:
+            bundle = bundle.extended(chunk, self._fingerprint(False, offset))
+            chunks = bundle.chunks
+        else:
+            # Shallow copies: concat_typed recodes its inputs' categoricals in place
+            chunks = merge_trailing([*chunks, chunk], len,
+                                    lambda a, b: concat_typed([a.copy(deep=False), b.copy(deep=False)]))
+        if streamed is not None:
+            streamed = streamed.extended(chunk, self._fingerprint(True, offset))
+        with self._lock:
+            self._chunks, self._bundle, self._streamed = chunks, bundle, streamed
+            self._offset, self._tail = offset, (self._tail + data)[-TAIL_BYTES:]
+            self.version += 1
+            self.appends += 1
+            self.appended_rows += len(chunk)
+
+
+class _AppendHandler(FileSystemEventHandler):
+    def __init__(self, live):
+        self.live = live
+        self.path = os.path.abspath(live.file_path)
+
+    def on_any_event(self, event):
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        if event.event_type in ("modified", "created", "moved") and self.path in map(os.path.abspath, filter(None, paths)):
+            self.live.refresh()
+
+
+@st.cache_resource
+def live_dataset(file_path):
+    """The process-wide watched dataset of ``file_path``, kept current by a watchdog observer."""
+    live = LiveDataset(file_path)
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(_AppendHandler(live), os.path.dirname(os.path.abspath(file_path)))
+    observer.start()
+    live.refresh() # Rows appended while the watch was being set up
+    return live
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def live_status(live, version):
+    """Reruns the session when a newer version than the one it shows is published."""
+    if live.version != version:
+        st.rerun()
+    note = f"Watching {os.path.basename(live.file_path)}: {live.appends} append(s), {live.appended_rows:,} rows added"
+    if live.error is not None:
+        note += f" (last refresh failed: {live.error})"
+    st.caption(note)
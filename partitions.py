@@ -0,0 +1,203 @@
+import streamlit as st
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import csv
+import hashlib
+import os
+
+from binning import AGE_EDGES
+from data_loader import CSV_COLUMN_TYPES, CohortBundle, apply_schema, preprocess_data_for_viz
+from schema import CATEGORICAL_COLUMNS, NUMERIC_COLUMNS
+from streaming import StreamedCohorts
+from profiling import span
+
+# --- Partitioned datasets ---
+# A directory of heart.csv-schema Parquet or CSV files, optionally hive-partitioned
+# (e.g. site=A/month=2024-01/part-0.parquet), is read as one dataset. Filters on age, sex and
+# the partition keys are combined into one scan expression: partition keys prune whole files
+# before they are opened, Parquet row-group statistics skip row groups whose Age or Sex values
+# cannot match, and the remaining rows are filtered as they are decoded (CSV files have no
+# statistics, so only their partition pruning happens before parsing). Only matching rows
+# reach pandas; in streaming mode they are folded into aggregates a chunk at a time, so the
+# dataset itself can be far larger than memory.
+FORMATS = {".parquet": "parquet", ".pq": "parquet", ".csv": "csv"}
+
+# Ages the charts cover; an age filter spanning all of them is no restriction
+AGE_RANGE = (int(AGE_EDGES[0] + 0.5), int(AGE_EDGES[-1] - 0.5))
+
+# Streaming folds scanned batches into aggregates in chunks of about this many rows
+STREAM_CHUNK_ROWS = 1 << 20
+
+def dataset_format(directory):
+    """The file format ("parquet" or "csv") of a dataset directory's data files."""
+    formats = {FORMATS.get(os.path.splitext(name)[1].lower())
+               for _, _, files in os.walk(directory) for name in files if not name.startswith((".", "_"))}
+    formats.discard(None)
+    if len(formats) != 1:
+        raise ValueError(f"{directory} must contain either Parquet or CSV files (found {sorted(formats) or 'neither'})")
+    return formats.pop()
+
+
+def dataset_signature(directory):
+    """Identifies the current version of a dataset directory by its files' paths, sizes and mtimes."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update(f"{os.path.relpath(os.path.join(root, name), directory)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def open_dataset(directory):
+    """Opens a dataset directory, discovering hive-style partition keys from its subdirectory names."""
+    fmt = dataset_format(directory)
+    if fmt == "csv":
+        fmt = ds.CsvFileFormat(convert_options=csv.ConvertOptions(column_types=CSV_COLUMN_TYPES))
+    # Dot- and underscore-prefixed files (e.g. sidecars, _SUCCESS markers) are skipped
+    return ds.dataset(directory, format=fmt, partitioning="hive")
+
+
+def partition_values(dataset):
+    """The values of each partition key ({key: sorted values}), read from the file paths only."""
+    values = {}
+    for fragment in dataset.get_fragments():
+        for key, value in ds.get_partition_keys(fragment.partition_expression).items():
+            values.setdefault(key, set()).add(value)
+    return {key: sorted(found) for key, found in values.items()}
+
+
+def dataset_filters(age_range=None, sexes=None, partitions=None, available=None):
+    """Canonical filters for a scan, dropping restrictions that select everything.
+
+    ``available`` maps each partition key to all of its values (see partition_values).
+    """
+    available = available or {}
+    filters = {}
+    if age_range is not None and tuple(age_range) != AGE_RANGE:
+        filters["age_range"] = tuple(age_range)
+    if sexes is not None and set(sexes) != set(CATEGORICAL_COLUMNS["Sex"]):
+        filters["sexes"] = tuple(sorted(sexes))
+    for key, values in sorted((partitions or {}).items()):
+        if set(values) != set(available.get(key, ())):
+            filters.setdefault("partitions", {})[key] = tuple(sorted(values))
+    return filters
+
+
+def _isin(field, values):
+    # An empty selection matches nothing (isin cannot type an empty value set)
+    return ds.field(field).isin(list(values)) if values else ds.scalar(False)
+
+
+def scan_expression(filters):
+    """The pyarrow dataset expression for ``filters`` (see dataset_filters), or None for no filter."""
+    conditions = []
+    if "age_range" in filters:
+        low, high = filters["age_range"]
+        conditions += [ds.field("Age") >= low, ds.field("Age") <= high]
+    if "sexes" in filters:
+        conditions.append(_isin("Sex", filters["sexes"]))
+    for key, values in filters.get("partitions", {}).items():
+        conditions.append(_isin(key, values))
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def schema_columns(dataset):
+    """The heart.csv-schema columns of a dataset (partition keys are left out of the frames)."""
+    return [name for name in dataset.schema.names if name in NUMERIC_COLUMNS or name in CATEGORICAL_COLUMNS]
+
+
+def scanner(dataset, filters):
+    return dataset.scanner(columns=schema_columns(dataset), filter=scan_expression(filters))
+
+
+def read_partitioned(directory, filters=None):
+    """Loads the rows of a dataset directory matching ``filters`` into the typed schema."""
+    dataset = open_dataset(directory)
+    with span("load.scan"):
+        table = scanner(dataset, filters or {}).to_table()
+    return apply_schema(table.to_pandas())
+
+
+def stream_partitioned(directory, filters=None, fingerprint=None):
+    """Aggregates the rows of a dataset directory matching ``filters`` without holding them all.
+
+    Peak memory is bounded by one chunk of about STREAM_CHUNK_ROWS rows plus the aggregates.
+    """
+    dataset = open_dataset(directory)
+    cohorts = StreamedCohorts(fingerprint=fingerprint)
+    # Small files and row groups give small batches; they are joined before aggregating
+    pending, pending_rows = [], 0
+    for batch in scanner(dataset, filters or {}).to_batches():
+        if not batch.num_rows:
+            continue
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= STREAM_CHUNK_ROWS:
+            cohorts.update(apply_schema(pa.Table.from_batches(pending).to_pandas()))
+            pending, pending_rows = [], 0
+    if pending:
+        cohorts.update(apply_schema(pa.Table.from_batches(pending).to_pandas()))
+    return cohorts
+
+
+def partitioned_fingerprint(directory, signature, filters, streamed=False):
+    return f"{'streamed-' if streamed else ''}partitioned:{directory}:{signature}:{sorted(filters.items())}"
+
+
+def load_cohorts(directory, filters, streamed=False, fingerprint=None):
+    """Cohorts of a dataset directory's matching rows: in-memory, or streamed aggregates."""
+    if streamed:
+        return stream_partitioned(directory, filters, fingerprint)
+    return CohortBundle(read_partitioned(directory, filters), fingerprint)
+
+
+# --- Dashboard access ---
+class PartitionedDataset:
+    """An opened dataset directory at one version, with its partition keys and values."""
+
+    def __init__(self, directory, signature):
+        self.directory = directory
+        self.signature = signature
+        self.dataset = open_dataset(directory)
+        self.partitions = partition_values(self.dataset)
+
+    def file_count(self, filters=None):
+        """How many files a scan with ``filters`` opens, after partition pruning."""
+        return sum(1 for _ in self.dataset.get_fragments(filter=scan_expression(filters or {})))
+
+
+@st.cache_resource(max_entries=2)
+def _partitioned_dataset(directory, signature):
+    return PartitionedDataset(directory, signature)
+
+
+def partitioned_dataset(directory):
+    """The opened current version of a dataset directory (re-opened when its files change)."""
+    return _partitioned_dataset(directory, dataset_signature(directory))
+
+
+@st.cache_resource(max_entries=4)
+def _streamed_cohorts(directory, signature, filters):
+    return stream_partitioned(directory, filters, partitioned_fingerprint(directory, signature, filters, True))
+
+
+@st.cache_resource(max_entries=4)
+def _partitioned_frame(directory, signature, filters):
+    return read_partitioned(directory, filters)
+
+
+def load_partitioned_cohorts(dataset, filters, streamed=False):
+    """Cached cohorts of ``dataset`` (a PartitionedDataset) restricted to ``filters``.
+
+    In-memory frames are shared by every session using the same filters.
+    """
+    if streamed:
+        return _streamed_cohorts(dataset.directory, dataset.signature, filters)
+    df = _partitioned_frame(dataset.directory, dataset.signature, filters)
+    return preprocess_data_for_viz(df, fingerprint=partitioned_fingerprint(dataset.directory, dataset.signature, filters))
@@ -0,0 +1,115 @@
+import numpy as np
+import os
+from matplotlib.colors import to_rgb
+
+from binning import AGE_EDGES, VALUE_EDGES, centers
+from kde import iso_proportion_levels
+from sampling import SCATTER_BUDGET, allocate
+
+# Scatter layers with more points than this are drawn as a full-data density raster instead of
+# a sample (0 always samples)
+RASTER_THRESHOLD = int(os.environ.get("HEART_RASTER_THRESHOLD", 200_000))
+
+# Progressive rendering previews scatter at most this many points per panel and contour
+# densities on a grid this many times coarser
+PREVIEW_POINTS = int(os.environ.get("HEART_PREVIEW_POINTS", 2_000))
+PREVIEW_COARSEN = 2
+
+# --- Drawing from binned data ---
+# These helpers render the KDE layers from BinnedKDEs (kde.py) and scatter layers from raw
+# rows, from histograms on the shared grids (binning.py) or from samples (sampling.py).
+
+
+def draw_density_1d(ax, kde, color, bw_adjust=1.0, fill=True, lw=1, scale=1.0):
+    """Draws a 1-D KDE; ``scale`` weights it for hue-style common norms."""
+    density = kde.density(bw_adjust)
+    if density is None:
+        return
+    x = centers(kde.edges[0])
+    density = density * scale
+    ax.plot(x, density, color=color, lw=lw)
+    if fill:
+        ax.fill_between(x, density, color=color, alpha=0.25, lw=0)
+
+
+def draw_density_by_sex(ax, kdes, palette, bw_adjust=1.0, fill=True, lw=1):
+    """Draws one 1-D KDE per sex, normalized jointly like ``sns.kdeplot(hue="Sex")``."""
+    total = sum(kde.n for kde in kdes)
+    if total == 0:
+        return
+    for kde, color in zip(kdes, palette):
+        draw_density_1d(ax, kde, color, bw_adjust=bw_adjust, fill=fill, lw=lw, scale=kde.n / total)
+
+
+def coarsen(values, factor):
+    """Averages blocks of ``factor`` cells along every axis, dropping cells left over at the end."""
+    for axis, size in enumerate(values.shape):
+        blocks = size // factor
+        values = np.take(values, np.arange(blocks * factor), axis=axis)
+        values = values.reshape(values.shape[:axis] + (blocks, factor) + values.shape[axis + 1:]).mean(axis=axis + 1)
+    return values
+
+
+def draw_density_2d(ax, kde, cmap, bw_adjust=1.0, fill=True, preview=False):
+    """Draws filled (or line) iso-proportion density contours; coarser ones for a ``preview``."""
+    density = kde.density(bw_adjust)
+    if density is None or not density.any():
+        return
+    grid = [centers(e) for e in kde.edges]
+    if preview:
+        density = coarsen(density, PREVIEW_COARSEN)
+        grid = [coarsen(c, PREVIEW_COARSEN) for c in grid]
+    levels = iso_proportion_levels(density)
+    if len(levels) < 2:
+        return
+    xx, yy = np.meshgrid(*grid, indexing="ij")
+    if fill:
+        ax.contourf(xx, yy, density, levels=levels, cmap=cmap)
+    else:
+        ax.contour(xx, yy, density, levels=levels, cmap=cmap)
+
+
+def draw_binned_scatter(ax, counts, x_edges, y_edges, **kwargs):
+    """Scatters one marker per occupied cell, which on one-unit grids matches the raw points."""
+    ix, iy = np.nonzero(counts)
+    ax.scatter(centers(x_edges)[ix], centers(y_edges)[iy], **kwargs)
+
+
+def draw_density_raster(ax, counts, x_edges, y_edges, color, alpha=None):
+    """Draws a 2-D count image as one image artist in the layer's colour.
+
+    Each cell gets the opacity ``count`` overlapping markers of the given alpha would have
+    composited to, so dense regions read the same as an overplotted scatter.
+    """
+    alpha = 1.0 if alpha is None else alpha
+    opacity = 1 - (1 - alpha) ** counts.T.astype(np.float64)
+    rgba = np.empty(opacity.shape + (4,))
+    rgba[..., :3] = to_rgb(color)
+    rgba[..., 3] = opacity
+    ax.imshow(rgba, extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]), origin="lower",
+              aspect="auto", interpolation="nearest", zorder=1)
+
+
+def draw_scatter_panel(ax, cohorts, column, layers, budget=None, preview=False, **scatter_kwargs):
+    """Draws a panel's Age x ``column`` scatter layers, ``(cohort, color, alpha)`` in drawing order.
+
+    While the layers fit the panel's point budget together (SCATTER_BUDGET, or PREVIEW_POINTS
+    for a ``preview``) every point is scattered (cell by cell for aggregates). Beyond it each
+    layer scatters a seeded sample, its share of the budget in proportion to its size. Layers
+    above RASTER_THRESHOLD points are drawn as a density raster of all their points instead.
+    """
+    if budget is None:
+        budget = PREVIEW_POINTS if preview else SCATTER_BUDGET
+    edges = (AGE_EDGES, VALUE_EDGES[column])
+    sizes = [cohorts.size(name) for name, _, _ in layers]
+    for (name, color, alpha), size, count in zip(layers, sizes, allocate(sizes, budget)):
+        if RASTER_THRESHOLD and size > RASTER_THRESHOLD:
+            draw_density_raster(ax, cohorts.hist2d(name, column), *edges, color, alpha)
+        elif count < size:
+            ages, values = cohorts.sample(name, column, count)
+            ax.scatter(ages, values, color=color, alpha=alpha, **scatter_kwargs)
+        elif cohorts.has_rows:
+            points = cohorts.subset(name, ["Age", column])
+            ax.scatter(points["Age"], points[column], color=color, alpha=alpha, **scatter_kwargs)
+        else:
+            draw_binned_scatter(ax, cohorts.hist2d(name, column), *edges, color=color, alpha=alpha, **scatter_kwargs)
@@ -0,0 +1,193 @@
+import streamlit as st
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from render_cache import figure_to_png, get_render_cache
+from visualizations import VISUALIZATIONS
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# --- Worker side ---
+# Each worker loads a dataset from its source once and keeps it for later jobs, so only the
+# chart name, source description and parameters cross the process boundary. A few datasets
+# are kept, so the charts of compared datasets (comparison.py) can be rendered in turn.
+MAX_WORKER_DATASETS = 4
+_worker_datasets = {}
+
+
+def init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def load_source(source, fingerprint):
+    """Loads the cohorts of a (mode, path, ...) source; see build_chart for the modes."""
+    mode, file_path, *options = source
+    if mode == "partitioned":
+        from partitions import load_cohorts
+        return load_cohorts(file_path, *options, fingerprint=fingerprint)
+    if mode == "streamed":
+        from streaming import stream_cohorts
+        return stream_cohorts(file_path)
+    from data_loader import CohortBundle, load_typed
+    return CohortBundle(load_typed(file_path), fingerprint)
+
+
+def _load_source(source, fingerprint):
+    cohorts = _worker_datasets.get(fingerprint)
+    if cohorts is None:
+        cohorts = load_source(source, fingerprint)
+        if len(_worker_datasets) >= MAX_WORKER_DATASETS:
+            _worker_datasets.pop(next(iter(_worker_datasets))) # The earliest loaded goes
+        _worker_datasets[fingerprint] = cohorts
+    return cohorts
+
+
+def build_chart(visualization, source, fingerprint, params):
+    """Builds one chart's figure from a (mode, path) source; None when it has nothing to draw.
+
+    Partitioned dataset directories are given as ("partitioned", directory, filters, streamed).
+    """
+    # Chart modules are imported by the registry, inside the worker
+    return VISUALIZATIONS[visualization].build_figure(_load_source(source, fingerprint), **params)
+
+
+def render_chart(visualization, source, fingerprint, params):
+    """Renders one chart to PNG bytes in a worker; None when the chart has nothing to draw."""
+    fig = build_chart(visualization, source, fingerprint, params)
+    return None if fig is None else figure_to_png(fig)
+
+
+# --- Spawned pools ---
+def spawn_executor(max_workers, initializer=init_worker):
+    # Spawned (not forked) workers, since the Streamlit server process is multi-threaded
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer)
+
+
+@contextmanager
+def blank_main():
+    """Submit to spawned pools inside this block, so new workers do not re-run the app.
+
+    Workers are started on submit, and a spawned worker first re-runs the parent's __main__
+    module. During a script run Streamlit makes that the app itself, so workers are started
+    with a blank one instead.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+# --- Scheduler ---
+class RenderScheduler:
+    """Renders charts ahead of time in a process pool and stores them in the render cache.
+
+    The scheduler is shared by every session. Each session's ``schedule`` call supersedes
+    that session's previous one: jobs that have not started yet and are no longer wanted by
+    any session are cancelled, and the foreground chart is submitted first.
+    """
+
+    def __init__(self, render_cache, max_workers=MAX_WORKERS):
+        self.render_cache = render_cache
+        self.max_workers = max_workers
+        self._executor = self._new_executor()
+        self._futures = {}
+        self._wanted = {} # Session id -> cache keys of its latest request
+        # Re-entrant: a future that is already done runs its callback inside schedule()
+        self._lock = threading.RLock()
+
+    def _new_executor(self):
+        return spawn_executor(self.max_workers)
+
+    def _submit(self, *args):
+        with blank_main():
+            try:
+                return self._executor.submit(render_chart, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool and retry once
+                self._executor = self._new_executor()
+                self._futures.clear()
+                return self._executor.submit(render_chart, *args)
+
+    def schedule(self, source, fingerprint, jobs, foreground=None):
+        """Queues ``jobs`` ({visualization: (cache_key, params)}), the foreground chart first."""
+        self.schedule_sources([(source, fingerprint, jobs)], foreground)
+
+    def schedule_sources(self, requests, foreground=None):
+        """Queues the jobs of several datasets ([(source, fingerprint, jobs)]) as one request.
+
+        The foreground chart of every dataset comes first, in dataset order.
+        """
+        order = sorted([(viz, source, fingerprint, *jobs[viz]) for source, fingerprint, jobs in requests for viz in jobs],
+                       key=lambda job: job[0] != foreground)
+        ctx = get_script_run_ctx()
+        with self._lock:
+            self._wanted[ctx.session_id if ctx is not None else None] = {key for _, _, _, key, _ in order}
+            if runtime.exists():
+                active = runtime.get_instance().is_active_session
+                self._wanted = {session: keys for session, keys in self._wanted.items()
+                                if session is None or active(session)}
+            wanted = set().union(*self._wanted.values())
+            for key, future in list(self._futures.items()):
+                # A cancelled future's callback runs right away and may already have removed it
+                if key not in wanted and future.cancel():
+                    self._futures.pop(key, None)
+            for viz, source, fingerprint, key, params in order:
+                if key in self._futures or self.render_cache.peek(key):
+                    continue
+                try:
+                    future = self._submit(viz, source, fingerprint, params)
+                except BrokenProcessPool:
+                    return # Charts are rendered in the foreground until the next schedule
+                future.add_done_callback(lambda f, key=key: self._finish(key, f))
+                self._futures[key] = future
+
+    def _finish(self, key, future):
+        with self._lock:
+            # A future of a broken pool finishes after its key may have been resubmitted
+            if self._futures.get(key) is future:
+                del self._futures[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        data = future.result()
+        if data is not None:
+            self.render_cache.put(key, data)
+
+    def result(self, key, build_figure):
+        """Returns the chart for ``key``: cached, awaited from a queued job, or rendered inline."""
+        with self._lock:
+            future = self._futures.get(key)
+        if future is not None and not self.render_cache.peek(key):
+            try:
+                data = future.result()
+            except Exception:
+                pass # Cancelled or failed in the worker; render in this process instead
+            else:
+                if data is None:
+                    return None
+                self.render_cache.put(key, data)
+        return self.render_cache.get_or_render(key, build_figure)
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+@st.cache_resource
+def get_scheduler():
+    """The process-wide background render scheduler."""
+    return RenderScheduler(get_render_cache())
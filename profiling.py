@@ -0,0 +1,207 @@
+import contextlib
+import functools
+import atexit
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# --- Stage spans ---
+# Spans are recorded for the whole process when HEART_PROFILE is set or enable() is called:
+# they are added to per-stage totals and appended, in buffered batches, to a JSON-lines log.
+# A run (one Streamlit script run) can also collect its own thread's spans just to show them,
+# without touching the process-wide state. Otherwise span() hands back a shared no-op context
+# manager and profiled() calls straight through. Each span records wall time and the calling
+# thread's CPU time; net bytes allocated are tracked only when tracemalloc was started for the
+# process (HEART_PROFILE_ALLOCATIONS or trace_allocations()), as tracing slows every allocation.
+LOG_PATH = os.environ.get("HEART_PROFILE_LOG", "profile/spans.jsonl")
+METRICS_PATH = os.environ.get("HEART_PROFILE_METRICS", "profile/metrics.prom")
+
+# Log entries are written once this many are pending, and at the end of each run
+LOG_BUFFER_SPANS = 256
+
+_enabled = False
+_NULL_SPAN = contextlib.nullcontext()
+_local = threading.local() # Per-thread span stack and current run (one Streamlit script run per thread)
+_lock = threading.Lock()
+_log_lock = threading.Lock() # Keeps flushed batches in order
+_totals = {} # stage -> [calls, wall seconds, cpu seconds, allocated bytes]
+_pending = [] # Log lines not written yet
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    """Turns span recording on for the whole process."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    flush()
+
+
+def trace_allocations():
+    """Starts tracemalloc for the rest of the process, so spans record the bytes they allocate."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _traced_memory():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+
+class _Span:
+    __slots__ = ("name", "depth", "start", "wall", "cpu", "alloc")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault("stack", [])
+        self.depth = len(stack)
+        stack.append(self.name)
+        self.start = time.time()
+        self.alloc = _traced_memory()
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        alloc = _traced_memory()
+        alloc = None if alloc is None or self.alloc is None else alloc - self.alloc
+        _local.stack.pop()
+        _record({"stage": self.name, "depth": self.depth, "wall_s": wall, "cpu_s": cpu, "alloc_bytes": alloc,
+                 "ts": self.start, "pid": os.getpid(), "thread": threading.get_ident()})
+        return False
+
+
+def _recording():
+    return _enabled or getattr(_local, "run", None) is not None
+
+
+def span(name):
+    """Context manager timing one stage; a shared no-op while nothing records spans."""
+    if not _recording():
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def profiled(name):
+    """Decorator form of ``span``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _recording():
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _record(entry):
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run.append(entry)
+    if not _enabled:
+        return
+    with _lock:
+        totals = _totals.setdefault(entry["stage"], [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += entry["wall_s"]
+        totals[2] += entry["cpu_s"]
+        totals[3] += max(entry["alloc_bytes"] or 0, 0)
+        if LOG_PATH:
+            _pending.append(json.dumps(entry) + "\n")
+        full = len(_pending) >= LOG_BUFFER_SPANS
+    if full:
+        flush()
+
+
+def flush():
+    """Appends the pending span log entries to LOG_PATH."""
+    global _pending
+    with _log_lock:
+        with _lock:
+            lines, _pending = _pending, []
+        if not lines:
+            return
+        try:
+            os.makedirs(os.path.dirname(LOG_PATH) or ".", exist_ok=True)
+            with open(LOG_PATH, "a") as f:
+                f.writelines(lines)
+        except OSError:
+            pass # Logging must never break the dashboard
+
+
+atexit.register(flush)
+
+
+# --- Runs ---
+def begin_run(collect=True):
+    """Starts a run of this thread (e.g. one Streamlit script run), collecting its spans if ``collect``."""
+    _local.run = [] if collect else None
+
+
+def end_run():
+    """Returns this thread's spans since ``begin_run``; flushes the log and refreshes the metrics snapshot."""
+    run = getattr(_local, "run", None) or []
+    _local.run = None
+    if _enabled:
+        flush()
+        if METRICS_PATH:
+            write_metrics(METRICS_PATH)
+    return run
+
+
+# --- Prometheus export ---
+METRICS = [
+    ("heart_stage_calls_total", "Completed spans per stage.", 0),
+    ("heart_stage_wall_seconds_total", "Wall time spent per stage.", 1),
+    ("heart_stage_cpu_seconds_total", "Thread CPU time spent per stage.", 2),
+    ("heart_stage_alloc_bytes_total", "Net bytes allocated per stage (tracemalloc).", 3),
+]
+
+
+def stage_totals():
+    """Cumulative per-stage totals of this process: {stage: [calls, wall s, cpu s, allocated bytes]}."""
+    with _lock:
+        return {stage: list(values) for stage, values in _totals.items()}
+
+
+def metrics_text():
+    """Cumulative per-stage totals of this process in the Prometheus text format."""
+    totals = stage_totals()
+    lines = []
+    for metric, help_text, i in METRICS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for stage in sorted(totals):
+            lines.append(f'{metric}{{stage="{stage}",pid="{os.getpid()}"}} {totals[stage][i]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=METRICS_PATH):
+    """Atomically rewrites the snapshot file, so a collector never reads a partial one."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w") as f:
+            f.write(metrics_text())
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+if os.environ.get("HEART_PROFILE_ALLOCATIONS", "").lower() in ("1", "true", "yes"):
+    trace_allocations()
+if os.environ.get("HEART_PROFILE", "").lower() in ("1", "true", "yes"):
+    enable()
@@ -0,0 +1,117 @@
+import streamlit as st
+import io
+import json
+import threading
+from collections import OrderedDict
+
+from profiling import span
+
+# Default memory budget for encoded images, shared by every session of the process
+DEFAULT_MAX_BYTES = 64 << 20
+
+# Same encoding st.pyplot uses, so cached images look identical to direct renders
+PNG_OPTIONS = {"bbox_inches": "tight", "dpi": 200, "format": "png"}
+
+# Progressive previews: the same framing at a quarter of the resolution, which encodes several
+# times faster and is shown stretched until the full-resolution image replaces it
+PREVIEW_PNG_OPTIONS = {**PNG_OPTIONS, "dpi": 50}
+
+
+def figure_to_png(fig, options=PNG_OPTIONS):
+    """Encodes a figure as PNG bytes and releases it (back to its template pool, or from pyplot)."""
+    from figure_templates import release_figure # Imported with the first figure, keeping startup light
+    buffer = io.BytesIO()
+    try:
+        # Includes layout and drawing, which savefig performs as part of encoding
+        with span("figure.encode"):
+            fig.savefig(buffer, **options)
+    finally:
+        release_figure(fig)
+    return buffer.getvalue()
+
+
+def chart_to_json(chart):
+    """Serializes an Altair chart's Vega-Lite spec (data included) as UTF-8 JSON bytes."""
+    with span("figure.encode"):
+        return json.dumps(chart.to_dict()).encode()
+
+
+def render_key(visualization, fingerprint, kde_bw_adjust=None, scatter_alpha=None, kde_shade=None,
+               interpolation_kind=None, confidence_bands=None, thresholds=None):
+    """Cache key for a rendered chart; parameters a chart does not use should be left as None."""
+    thresholds = tuple(sorted(thresholds.items())) if thresholds else None
+    return (visualization, kde_bw_adjust, scatter_alpha, kde_shade, interpolation_kind, confidence_bands, thresholds,
+            fingerprint)
+
+
+class RenderCache:
+    """Thread-safe LRU cache of encoded figure images (and chart specs) with a total byte budget."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached bytes for ``key`` (marking them recently used), or None."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def peek(self, key):
+        """Whether ``key`` is cached, without touching recency or the hit/miss counters."""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data):
+        """Stores ``data``, evicting least recently used entries to stay within budget."""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def get_or_render(self, key, build_figure):
+        """Returns cached bytes for ``key``, building and encoding the figure on a miss.
+
+        ``build_figure`` may return None (nothing to draw), which is passed through uncached.
+        """
+        data = self.get(key)
+        if data is None:
+            with span("figure.build"):
+                fig = build_figure()
+            if fig is None:
+                return None
+            data = figure_to_png(fig)
+            self.put(key, data)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_render_cache():
+    """The process-wide render cache."""
+    return RenderCache()
@@ -0,0 +1,87 @@
+import numpy as np
+import os
+
+# --- Sampled scatter layers ---
+# Scatter marks are drawn from a sample of at most SCATTER_BUDGET points per panel, while the
+# densities, sizes and percentages keep coming from the full data. Every row gets a seeded
+# uniform priority in file order and a layer's sample is its lowest-priority rows: a bottom-k
+# reservoir, i.e. a uniform sample without replacement. It is the same sample for the
+# in-memory frame and for a streamed read of the file (whatever the chunking), and moving a
+# threshold only changes it at the margins. A panel's budget is split between its layers (a
+# cohort's normal and abnormal bands) in proportion to their full sizes, so the marks keep
+# the cohort's proportions.
+SCATTER_BUDGET = int(os.environ.get("HEART_SCATTER_BUDGET", 20_000))
+SAMPLE_SEED = 0
+
+# Streamed reservoirs keep this many times the budget per cohort, so either band of a cohort
+# split at any threshold still holds its share of the points
+RESERVOIR_HEADROOM = 2
+
+
+def priority_stream(start=0):
+    """The seeded generator row priorities are drawn from, one ``random()`` value per row in file order.
+
+    The stream is positioned at row ``start``, so the priorities of rows appended later can be
+    drawn on their own.
+    """
+    stream = np.random.default_rng(SAMPLE_SEED)
+    stream.bit_generator.advance(int(start)) # Each value takes one step
+    return stream
+
+
+def allocate(sizes, budget):
+    """Splits ``budget`` points between layers of the given sizes, in proportion (largest remainders).
+
+    Layers are kept whole when they fit the budget together.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = sizes.sum()
+    if total <= budget:
+        return sizes
+    quotas = sizes * (budget / total)
+    counts = np.floor(quotas).astype(np.int64)
+    counts[np.argsort(counts - quotas, kind="stable")[:budget - counts.sum()]] += 1
+    return counts
+
+
+def lowest(priorities, n):
+    """Positions of the ``n`` lowest ``priorities`` (all of them when there are no more than ``n``)."""
+    if n >= len(priorities):
+        return np.arange(len(priorities))
+    return np.sort(np.argpartition(priorities, n)[:n])
+
+
+def sample_rows(df, priorities, rows, column, n):
+    """Age and ``column`` values of the ``n`` lowest-priority of ``rows`` (positions within ``df``)."""
+    rows = rows[lowest(priorities[rows], n)]
+    return df["Age"].to_numpy()[rows], df[column].to_numpy()[rows]
+
+
+class Reservoir:
+    """The ``capacity`` lowest-priority (Age, value) points of a cohort read in chunks."""
+    __slots__ = ("capacity", "priorities", "ages", "values")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.priorities = np.empty(0)
+        self.ages = np.empty(0, dtype=np.int8)
+        self.values = np.empty(0, dtype=np.int16)
+
+    def add(self, priorities, ages, values):
+        if len(self.priorities) >= self.capacity:
+            # Only points below the current cut can enter a full reservoir
+            keep = priorities < self.priorities.max()
+            priorities, ages, values = priorities[keep], ages[keep], values[keep]
+        priorities = np.concatenate([self.priorities, priorities])
+        kept = lowest(priorities, self.capacity)
+        self.priorities = priorities[kept]
+        self.ages = np.concatenate([self.ages, ages])[kept]
+        self.values = np.concatenate([self.values, values])[kept]
+
+    def sample(self, n, mask=None):
+        """Age and value of the ``n`` lowest-priority points (among ``mask``)."""
+        priorities, ages, values = self.priorities, self.ages, self.values
+        if mask is not None:
+            priorities, ages, values = priorities[mask], ages[mask], values[mask]
+        kept = lowest(priorities, n)
+        return ages[kept], values[kept]
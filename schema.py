@@ -0,0 +1,24 @@
+# --- Schema ---
+# Categorical columns list their known categories first so the integer codes are stable
+# across files; any unexpected values are appended after them.
+CATEGORICAL_COLUMNS = {
+    "Sex": ["M", "F"],
+    "ChestPainType": ["TA", "ATA", "NAP", "ASY"],
+    "RestingECG": ["Normal", "ST", "LVH"],
+    "ExerciseAngina": ["N", "Y"],
+    "ST_Slope": ["Up", "Flat", "Down"],
+}
+# Display names of the chest pain types
+PAIN_TITLES = {
+    "TA": "Typical Angina", "ATA": "Atypical Angina",
+    "NAP": "Non-Anginal Pain", "ASY": "Asymptomatic",
+}
+NUMERIC_COLUMNS = {
+    "Age": "int8",
+    "RestingBP": "int16",
+    "Cholesterol": "int16",
+    "FastingBS": "int8",
+    "MaxHR": "int16",
+    "Oldpeak": "float32",
+    "HeartDisease": "int8",
+}
@@ -0,0 +1,120 @@
+import streamlit as st
+import numpy as np
+import copy
+
+from binning import AGE_EDGES, VALUE_EDGES
+from cube import AggregationCube, CubeCohortsMixin
+from kde import BinnedCohortsMixin
+from bootstrap import BAND_PARTS, BootstrapCohortsMixin
+from thresholds import INDEXED, ValueIndex
+from data_loader import CohortBundle, read_heart_csv_chunks, source_signature
+from sampling import RESERVOIR_HEADROOM, SCATTER_BUDGET, Reservoir, priority_stream
+
+# Value column each scatter cohort is binned against (Age is always on the x axis)
+SCATTER_COLUMNS = {
+    "resting_ecg_normal_bp_dis": "RestingBP",
+    "resting_ecg_st_bp_dis": "RestingBP",
+    "resting_ecg_lvh_bp_dis": "RestingBP",
+    "angina_induced_dis": "MaxHR",
+    "angina_not_induced_dis": "MaxHR",
+}
+# The angina chart's per-pain-type cohorts are binned as well, for their bootstrap bands
+HIST2D_COLUMNS = {**SCATTER_COLUMNS, **{name: "MaxHR" for name in BAND_PARTS}}
+
+
+class StreamedCohorts(CubeCohortsMixin, BinnedCohortsMixin, BootstrapCohortsMixin):
+    """Running per-cohort aggregates built from a CSV read in chunks.
+
+    Exposes the same cohort accessors as CohortBundle (size, empty, sex_pct, head), plus the
+    binned data the visualizations render from, without ever holding the full frame. Each
+    chunk's aggregation cube and threshold value indexes are added to running totals, and
+    the scatter cohorts' lowest-priority points to bounded sampling reservoirs.
+    """
+    __slots__ = ("fingerprint", "n_rows", "_head", "cube", "_slices", "_value_indexes", "_hists2d", "_kdes",
+                 "_bands", "_priorities", "_reservoirs")
+    has_rows = False
+
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.n_rows = 0
+        self._head = None
+        self.cube = AggregationCube()
+        self._slices = {}
+        self._value_indexes = {(name, column): ValueIndex(VALUE_EDGES[column]) for name, column in INDEXED}
+        self._hists2d = {name: np.zeros((len(AGE_EDGES) - 1, len(VALUE_EDGES[column]) - 1), dtype=np.int64)
+                         for name, column in HIST2D_COLUMNS.items()}
+        self._kdes = {}
+        self._bands = {}
+        self._priorities = priority_stream()
+        self._reservoirs = {key: Reservoir(SCATTER_BUDGET * RESERVOIR_HEADROOM)
+                            for key in [*INDEXED, *SCATTER_COLUMNS.items()]}
+
+    def update(self, chunk):
+        """Folds one typed chunk into the running aggregates."""
+        self._slices.clear()
+        self._kdes.clear()
+        self._bands.clear()
+        if self._head is None:
+            self._head = chunk.head().copy()
+        self.n_rows += len(chunk)
+        bundle = CohortBundle(chunk)
+        self.cube += bundle.cube
+        for name, column in HIST2D_COLUMNS.items():
+            self._hists2d[name] += bundle.hist2d(name, column)
+        for key, index in self._value_indexes.items():
+            index += bundle.value_index(*key)
+        priorities = self._priorities.random(len(chunk))
+        for (name, column), reservoir in self._reservoirs.items():
+            rows = bundle.rows(name)
+            reservoir.add(priorities[rows], chunk["Age"].to_numpy()[rows], chunk[column].to_numpy()[rows])
+
+    def extended(self, chunk, fingerprint=None):
+        """A copy of these aggregates with one more typed chunk folded in; this one is left unchanged."""
+        cohorts = copy.deepcopy(self)
+        cohorts.fingerprint = fingerprint
+        cohorts.update(chunk)
+        return cohorts
+
+    def head(self, n=5):
+        return self._head.head(n) if self._head is not None else None
+
+    def value_index(self, name, column):
+        """ValueIndex of a cohort's ``column``, for threshold range queries."""
+        return self._value_indexes[(name, column)]
+
+    def hist2d(self, name, column):
+        """Age x ``column`` counts on (AGE_EDGES, VALUE_EDGES[column])."""
+        if HIST2D_COLUMNS.get(name) != column:
+            raise KeyError(f"No {column} histogram is aggregated for cohort '{name}'")
+        return self._hists2d[name]
+
+    def reservoir(self, name, column):
+        """Sampling reservoir of a cohort's Age x ``column`` points."""
+        if (name, column) not in self._reservoirs:
+            raise KeyError(f"No {column} sample is kept for cohort '{name}'")
+        return self._reservoirs[(name, column)]
+
+    def sample(self, name, column, n):
+        """Age and ``column`` values of a seeded sample of ``n`` of a cohort's points."""
+        return self.reservoir(name, column).sample(n)
+
+
+def stream_cohorts(file_path, block_size=16 << 20):
+    """Reads a heart.csv file in ``block_size``-byte chunks, aggregating as it goes.
+
+    Peak memory is bounded by one chunk plus the fixed-size aggregates.
+    """
+    cohorts = StreamedCohorts(fingerprint=f"streamed:{file_path}:{source_signature(file_path)}")
+    for chunk in read_heart_csv_chunks(file_path, block_size):
+        cohorts.update(chunk)
+    return cohorts
+
+
+@st.cache_resource(max_entries=4)
+def _stream_cohorts_cached(file_path, signature):
+    return stream_cohorts(file_path)
+
+
+def load_streamed_cohorts(file_path="input/heart.csv"):
+    """Cached streaming load; re-aggregates when the file's size or mtime changes."""
+    return _stream_cohorts_cached(file_path, source_signature(file_path))
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def _repo_root(monkeypatch):
+    monkeypatch.chdir(ROOT) # Default paths such as input/heart.csv are relative to the repository
+
+
+@pytest.fixture(scope="session")
+def synthetic_csv(tmp_path_factory):
+    """A 20,000-row synthetic heart.csv, larger than the scatter budget's share of any cohort."""
+    from benchmarks.synthetic import write_csv
+    return write_csv(20_000, str(tmp_path_factory.mktemp("data") / "heart.csv"))
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from binning import AGE_EDGES
+from cube import COHORT_SLICES
+from data_loader import CohortBundle, load_typed
+
+
+@pytest.fixture(scope="module", params=["heart.csv", "off-grid ages"])
+def cohorts(request):
+    df = load_typed("input/heart.csv")
+    if request.param == "off-grid ages":
+        # Ages the charts' grid (25-85) does not cover, as well as the fillna(0) of a missing age
+        df = df.copy()
+        df.loc[::7, "Age"] = np.resize(np.array([0, 18, 22, 24, 86, 90, 101, 127, -3], dtype=np.int8), len(df[::7]))
+    return CohortBundle(df)
+
+
+@pytest.mark.parametrize("name", list(COHORT_SLICES))
+def test_cube_slices_match_groupby(cohorts, name):
+    rows = cohorts.subset(name)
+    assert cohorts.size(name) == len(rows)
+    for sex in ("M", "F"):
+        expected = 100 * (rows["Sex"] == sex).sum() / len(rows) if len(rows) else 0
+        assert cohorts.sex_pct(name, sex) == pytest.approx(expected)
+    assert np.array_equal(cohorts.age_hist(name), np.histogram(rows["Age"], AGE_EDGES)[0])
+    expected = rows.groupby("Age", observed=True)[["MaxHR"]].mean()
+    pd.testing.assert_frame_equal(cohorts.mean_maxhr_by_age(name), expected, check_index_type=False)
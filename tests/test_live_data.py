@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+import pytest
+
+from data_loader import COHORTS, CohortBundle, read_heart_csv
+from live_data import LiveDataset
+from streaming import SCATTER_COLUMNS
+from thresholds import INDEXED, THRESHOLD_COHORTS, with_thresholds
+
+
+@pytest.fixture
+def lines(synthetic_csv):
+    with open(synthetic_csv, "rb") as f:
+        return f.readlines()
+
+
+def fresh(lines):
+    return CohortBundle(read_heart_csv(io.BytesIO(b"".join(lines))))
+
+
+def assert_same_cohorts(live, expected):
+    assert live.n_rows == expected.n_rows
+    for name in COHORTS:
+        assert np.array_equal(live.rows(name), expected.rows(name))
+        assert np.array_equal(live.age_hist(name), expected.age_hist(name))
+    for name, column in SCATTER_COLUMNS.items():
+        assert np.array_equal(live.hist2d(name, column), expected.hist2d(name, column))
+        for got, want in zip(live.sample(name, column, 300), expected.sample(name, column, 300)):
+            assert np.array_equal(got, want)
+    for parent, column in INDEXED:
+        assert np.array_equal(live.value_index(parent, column).counts, expected.value_index(parent, column).counts)
+    live_view, expected_view = with_thresholds(live, {"bp_low": 125}), with_thresholds(expected, {"bp_low": 125})
+    for name, (_, column, _) in THRESHOLD_COHORTS.items():
+        assert np.array_equal(live_view.rows(name), expected_view.rows(name))
+        for got, want in zip(live_view.sample(name, column, 300), expected_view.sample(name, column, 300)):
+            assert np.array_equal(got, want)
+    assert live.df.equals(expected.df)
+
+
+def test_refresh_after_appends_matches_fresh_load(tmp_path, lines):
+    path = tmp_path / "heart.csv"
+    path.write_bytes(b"".join(lines[:5001]))
+    live = LiveDataset(str(path))
+    live.current()[1].sample("healthy", "MaxHR", 100) # Cohorts in use are extended, the rest built later
+    live.current(streamed=True)
+    written = 5001
+    for stop in (5002, 5500, 9000, 9001, 15000, len(lines) - 1):
+        with open(path, "ab") as f:
+            f.write(b"".join(lines[written:stop]) + lines[stop][:7]) # A partly written line waits
+        live.refresh()
+        assert live.error is None
+        cohorts = live.current()[1]
+        assert_same_cohorts(cohorts, fresh(lines[:stop]))
+        streamed = live.current(streamed=True)[1]
+        assert streamed.n_rows == stop - 1
+        for name in COHORTS:
+            assert streamed.size(name) == cohorts.size(name)
+        with open(path, "ab") as f:
+            f.write(lines[stop][7:])
+        written = stop + 1
+    live.refresh()
+    assert_same_cohorts(live.current()[1], fresh(lines))
+    assert live.appends == 7
+
+def test_rewritten_file_is_reloaded(tmp_path, lines):
+    path = tmp_path / "heart.csv"
+    path.write_bytes(b"".join(lines[:3000]))
+    live = LiveDataset(str(path))
+    path.write_bytes(b"".join(lines[:1] + lines[3000:4000]))
+    live.refresh()
+    assert_same_cohorts(live.current()[1], fresh(lines[:1] + lines[3000:4000]))
@@ -0,0 +1,58 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+from data_loader import COHORTS, CohortBundle, load_typed
+from partitions import dataset_filters, load_cohorts, open_dataset, partition_values, read_partitioned
+
+DATA_PATH = "input/heart.csv"
+SITES = ["a", "b", "c"]
+
+
+@pytest.fixture(scope="module")
+def heart():
+    df = load_typed(DATA_PATH)
+    return df.assign(site=np.array(SITES)[np.arange(len(df)) % len(SITES)])
+
+
+@pytest.fixture(scope="module")
+def partitioned(heart, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("parts")
+    table = pa.Table.from_pandas(heart.astype({"Sex": str, "ChestPainType": str, "RestingECG": str,
+                                               "ExerciseAngina": str, "ST_Slope": str}), preserve_index=False)
+    ds.write_dataset(table, directory, format="parquet", partitioning=["site"], partitioning_flavor="hive")
+    return str(directory)
+
+
+def expected(heart, age_range, sexes, sites):
+    mask = heart["Age"].between(*age_range) & heart["Sex"].isin(sexes) & heart["site"].isin(sites)
+    return heart.loc[mask].drop(columns="site")
+
+
+CASES = [((28, 77), ["M", "F"], SITES), ((40, 60), ["F"], ["a", "c"]), ((28, 77), ["M"], ["b"]),
+         ((50, 55), ["M", "F"], [])]
+
+
+@pytest.mark.parametrize("age_range, sexes, sites", CASES)
+def test_partitioned_rows_match_filtered_frame(heart, partitioned, age_range, sexes, sites):
+    available = partition_values(open_dataset(partitioned))
+    assert available == {"site": SITES}
+    filters = dataset_filters(age_range, sexes, {"site": sites}, available)
+    want = expected(heart, age_range, sexes, sites)
+    got = read_partitioned(partitioned, filters)
+    key = list(want.columns)
+    assert list(got.columns) == key
+    assert got.sort_values(key).reset_index(drop=True).astype(str).equals(
+        want.sort_values(key).reset_index(drop=True).astype(str))
+
+
+@pytest.mark.parametrize("age_range, sexes, sites", CASES)
+def test_streamed_partitions_match_filtered_frame(heart, partitioned, age_range, sexes, sites):
+    filters = dataset_filters(age_range, sexes, {"site": sites}, partition_values(open_dataset(partitioned)))
+    want = CohortBundle(expected(heart, age_range, sexes, sites))
+    streamed = load_cohorts(partitioned, filters, streamed=True)
+    assert streamed.n_rows == len(want.df)
+    for name in COHORTS:
+        assert streamed.size(name) == want.size(name)
+        assert np.array_equal(streamed.age_hist(name), want.age_hist(name))
@@ -0,0 +1,116 @@
+import sys
+import types
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import precompute
+from precompute import RenderScheduler
+from render_cache import RenderCache
+
+SOURCE = ("typed", "input/heart.csv")
+PARAMS = dict(kde_bw_adjust=1.0, scatter_alpha=0.4, kde_shade=True)
+
+
+class FakeExecutor:
+    """Hands out futures the test finishes by hand; ``broken`` makes the next submit fail."""
+
+    def __init__(self):
+        self.submitted = []
+        self.broken = False
+
+    def submit(self, func, visualization, source, fingerprint, params):
+        if self.broken:
+            raise BrokenProcessPool("worker died")
+        future = Future()
+        self.submitted.append((visualization, future))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class FakeScheduler(RenderScheduler):
+    def _new_executor(self):
+        return FakeExecutor()
+
+
+def jobs(*keys):
+    return {f"chart {key}": (key, PARAMS) for key in keys}
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """Sets the session id schedule() sees, as a Streamlit script run context would."""
+    def use(session_id):
+        monkeypatch.setattr(precompute, "get_script_run_ctx", lambda: types.SimpleNamespace(session_id=session_id))
+    return use
+
+
+def test_a_new_request_cancels_jobs_nobody_wants(session):
+    scheduler = FakeScheduler(RenderCache())
+    session("a")
+    scheduler.schedule(SOURCE, "fp", jobs("k1", "k2", "k3"), foreground="chart k2")
+    assert [viz for viz, _ in scheduler._executor.submitted] == ["chart k2", "chart k1", "chart k3"]
+    futures = dict(scheduler._futures)
+    futures["k1"].set_running_or_notify_cancel() # Started jobs cannot be cancelled
+    scheduler.schedule(SOURCE, "fp", jobs("k4"))
+    assert futures["k1"].running() and futures["k2"].cancelled() and futures["k3"].cancelled()
+    assert set(scheduler._futures) == {"k1", "k4"}
+
+
+def test_requests_of_other_sessions_are_kept(session):
+    scheduler = FakeScheduler(RenderCache())
+    session("a")
+    scheduler.schedule(SOURCE, "fp", jobs("k1", "k2"))
+    session("b")
+    scheduler.schedule(SOURCE, "fp", jobs("k2", "k3"))
+    assert set(scheduler._futures) == {"k1", "k2", "k3"}
+    assert not any(future.cancelled() for future in scheduler._futures.values())
+    session("a")
+    scheduler.schedule(SOURCE, "fp", jobs("k4"))
+    assert set(scheduler._futures) == {"k2", "k3", "k4"} # k2 is still wanted by b
+
+
+def test_finished_jobs_fill_the_render_cache(session):
+    scheduler = FakeScheduler(RenderCache())
+    session("a")
+    scheduler.schedule(SOURCE, "fp", jobs("k1", "k2"))
+    scheduler._futures["k1"].set_result(b"png")
+    scheduler._futures["k2"].set_exception(RuntimeError("render failed"))
+    assert scheduler.pending() == 0
+    assert scheduler.render_cache.get("k1") == b"png"
+    assert scheduler.result("k2", lambda: None) is None # Rendered inline instead
+    scheduler.schedule(SOURCE, "fp", jobs("k1"))
+    assert scheduler.pending() == 0 # Cached charts are not resubmitted
+
+
+def test_resubmitted_jobs_survive_the_broken_pool(session):
+    scheduler = FakeScheduler(RenderCache())
+    session("a")
+    scheduler.schedule(SOURCE, "fp", jobs("k1"))
+    old = scheduler._futures["k1"]
+    scheduler._executor.broken = True # The next submit starts a fresh pool and resubmits
+    scheduler.schedule(SOURCE, "fp", jobs("k1", "k2"))
+    assert "k1" not in scheduler._futures # Cleared with the broken pool; k2 went to the fresh one
+    scheduler.schedule(SOURCE, "fp", jobs("k1", "k2"))
+    new = scheduler._futures["k1"]
+    old.set_exception(BrokenProcessPool("worker died")) # The broken pool's future finishes late
+    assert scheduler._futures["k1"] is new
+    new.set_result(b"png")
+    assert scheduler.render_cache.get("k1") == b"png"
+
+
+def test_workers_render_while_the_app_is_main(monkeypatch):
+    # Streamlit runs the app as __main__; spawned workers must not re-run it
+    app = types.ModuleType("__main__")
+    app.__file__ = "app_that_must_not_run.py"
+    monkeypatch.setitem(sys.modules, "__main__", app)
+    scheduler = RenderScheduler(RenderCache(), max_workers=1)
+    try:
+        scheduler.schedule(SOURCE, "fp", {"Blood Pressure vs Age": ("k1", PARAMS)})
+        data = scheduler.result("k1", lambda: pytest.fail("rendered in the test process"))
+    finally:
+        scheduler.shutdown()
+    assert data.startswith(b"\x89PNG")
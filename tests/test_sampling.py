@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from data_loader import CohortBundle, load_typed
+from sampling import allocate, lowest, priority_stream
+from streaming import SCATTER_COLUMNS, stream_cohorts
+from thresholds import THRESHOLD_COHORTS, with_thresholds
+
+
+@pytest.fixture(scope="module")
+def cohorts(synthetic_csv):
+    return CohortBundle(load_typed(synthetic_csv)), stream_cohorts(synthetic_csv, block_size=64 << 10)
+
+
+@pytest.mark.parametrize("n", [0, 1, 7, 500, 10**9])
+def test_lowest_keeps_exactly_k(n):
+    priorities = priority_stream().random(1000)
+    kept = lowest(priorities, n)
+    assert len(kept) == min(n, 1000)
+    assert np.all(np.diff(kept) > 0)
+    assert np.all(priorities[kept].max(initial=-1) < np.delete(priorities, kept).min(initial=2))
+
+
+@pytest.mark.parametrize("sizes, budget", [([10, 20, 30], 100), ([1000, 3, 250], 101), ([0, 5000], 20), ([7, 7, 7], 10)])
+def test_allocate_fills_budget_in_proportion(sizes, budget):
+    counts = allocate(sizes, budget)
+    assert counts.sum() == min(sum(sizes), budget)
+    assert np.all(counts <= sizes)
+    assert np.all(np.abs(counts - np.array(sizes) * min(budget / sum(sizes), 1)) <= 1)
+
+
+@pytest.mark.parametrize("n", [1, 250, 2000, 10**6])
+def test_in_memory_and_streamed_samples_agree(cohorts, n):
+    in_memory, streamed = cohorts
+    for name, column in SCATTER_COLUMNS.items():
+        ages, values = in_memory.sample(name, column, n)
+        assert len(ages) == len(values) == min(n, in_memory.size(name))
+        # The sample is the n lowest-priority rows of the cohort
+        rows = in_memory.rows(name)
+        chosen = np.sort(rows[np.argsort(in_memory.priorities[rows])[:n]])
+        assert np.array_equal(ages, in_memory.df["Age"].to_numpy()[chosen])
+        assert np.array_equal(values, in_memory.df[column].to_numpy()[chosen])
+        streamed_ages, streamed_values = streamed.sample(name, column, n)
+        if n <= streamed.reservoir(name, column).capacity:
+            assert np.array_equal(ages, streamed_ages) and np.array_equal(values, streamed_values)
+
+
+@pytest.mark.parametrize("n", [1, 250, 2000])
+def test_threshold_samples_keep_exactly_k(cohorts, n):
+    in_memory, streamed = cohorts
+    thresholds = {"bp_low": 120, "bp_high": 140, "cholesterol_high": 220}
+    memory_view, streamed_view = with_thresholds(in_memory, thresholds), with_thresholds(streamed, thresholds)
+    for name, (_, column, _) in THRESHOLD_COHORTS.items():
+        ages, values = memory_view.sample(name, column, n)
+        assert len(ages) == len(values) == min(n, memory_view.size(name))
+        # Streamed reservoirs are split at the thresholds; the points are the same, in file order
+        streamed_points = sorted(zip(*streamed_view.sample(name, column, n)))
+        assert streamed_points == sorted(zip(ages, values))
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from data_loader import COHORTS, CohortBundle, load_typed
+from streaming import HIST2D_COLUMNS, stream_cohorts
+from thresholds import INDEXED
+
+DATA_PATH = "input/heart.csv"
+
+
+@pytest.fixture(scope="module")
+def in_memory():
+    return CohortBundle(load_typed(DATA_PATH))
+
+
+@pytest.mark.parametrize("block_size", [200, 4096, 16 << 20])
+def test_streamed_cohorts_match_in_memory(in_memory, block_size):
+    # Small blocks make later blocks hold values (e.g. a decimal Oldpeak) the first block has no sign of
+    streamed = stream_cohorts(DATA_PATH, block_size=block_size)
+    assert streamed.n_rows == len(in_memory.df)
+    for name in COHORTS:
+        assert streamed.size(name) == in_memory.size(name)
+        assert np.array_equal(streamed.age_hist(name), in_memory.age_hist(name))
+    for name, column in HIST2D_COLUMNS.items():
+        assert np.array_equal(streamed.hist2d(name, column), in_memory.hist2d(name, column))
+    for name, column in INDEXED:
+        assert np.array_equal(streamed.value_index(name, column).counts, in_memory.value_index(name, column).counts)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from binning import AGE_EDGES, VALUE_EDGES, hist2d
+from data_loader import CohortBundle, load_typed
+from thresholds import DEFAULT_THRESHOLDS, THRESHOLD_COHORTS, normal_range, with_thresholds
+
+THRESHOLDS = [
+    DEFAULT_THRESHOLDS,
+    {"bp_low": 80, "bp_high": 210, "cholesterol_high": 0},
+    {"bp_low": 132, "bp_high": 133, "cholesterol_high": 651},
+]
+
+
+@pytest.fixture(scope="module")
+def cohorts():
+    return CohortBundle(load_typed("input/heart.csv"))
+
+
+@pytest.mark.parametrize("thresholds", THRESHOLDS)
+@pytest.mark.parametrize("name", list(THRESHOLD_COHORTS))
+def test_threshold_cohorts_match_mask(cohorts, thresholds, name):
+    parent, column, inside = THRESHOLD_COHORTS[name]
+    low, high = normal_range(column, thresholds)
+    rows = cohorts.rows(parent)
+    values = cohorts.df[column].to_numpy()[rows]
+    within = (values >= low) & (values <= high)
+    expected = cohorts.df.take(rows[within if inside else ~within])
+
+    view = with_thresholds(cohorts, thresholds)
+    assert view.size(name) == len(expected)
+    for sex in ("M", "F"):
+        share = 100 * (expected["Sex"] == sex).sum() / len(expected) if len(expected) else 0
+        assert view.sex_pct(name, sex) == pytest.approx(share)
+    assert np.array_equal(view.age_hist(name), np.histogram(expected["Age"], AGE_EDGES)[0])
+    assert np.array_equal(view.hist2d(name, column),
+                          hist2d(expected["Age"], expected[column], AGE_EDGES, VALUE_EDGES[column]))
+    # Sorted index rows: the same rows, ordered by value as a stable sort of the mask's rows gives
+    order = np.argsort(expected[column].to_numpy(), kind="stable")
+    assert np.array_equal(view.rows(name), expected.index.to_numpy()[order])
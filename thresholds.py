@@ -0,0 +1,224 @@
+import numpy as np
+
+from binning import AGE_EDGES, VALUE_EDGES
+from cube import AXES, GRID_AGES, SHAPE, CubeCohortsMixin, dimension_codes, grid_age_codes
+from kde import BinnedCohortsMixin
+
+# --- Clinical thresholds ---
+# The normal BP range and the high-cholesterol cutoff are parameters rather than part of the
+# cohort definitions. Each (parent cohort, column) pair they split gets a value index: counts by
+# (Sex, Age, value) with running totals along the value axis, so the size, sex shares and age
+# histograms of either side of any threshold are a binary search and a subtraction away. In
+# memory, a second index holds the parent's rows sorted by the value, so the rows on either
+# side are slices rather than masked copies.
+DEFAULT_THRESHOLDS = {"bp_low": 115, "bp_high": 155, "cholesterol_high": 200}
+
+# Threshold cohort -> (parent cohort, value column, whether it is the normal side)
+THRESHOLD_COHORTS = {}
+for _status in ("healthy", "diseased"):
+    THRESHOLD_COHORTS[f"abnormal_bp_{_status}"] = (_status, "RestingBP", False)
+    THRESHOLD_COHORTS[f"normal_bp_{_status}"] = (_status, "RestingBP", True)
+    THRESHOLD_COHORTS[f"abnormal_cls_{_status}"] = (_status, "Cholesterol", False)
+    THRESHOLD_COHORTS[f"normal_cls_{_status}"] = (_status, "Cholesterol", True)
+INDEXED = sorted({(parent, column) for parent, column, _ in THRESHOLD_COHORTS.values()})
+
+
+def normal_range(column, thresholds):
+    """Inclusive (low, high) bounds of the normal values of ``column``."""
+    if column == "RestingBP":
+        return thresholds["bp_low"], thresholds["bp_high"]
+    return -np.inf, thresholds["cholesterol_high"] # Cholesterol 0 (missing) counts as normal
+
+
+class ValueIndex:
+    """Counts of one cohort by (Sex, Age, value bin) with running totals along the value axis.
+
+    Value bins are the column's VALUE_EDGES grid plus one bin below and one above it. Ages are
+    those of the cube's age grid, with one slot for all ages off it.
+    """
+    __slots__ = ("edges", "counts", "_cumulative")
+
+    def __init__(self, edges, counts=None):
+        self.edges = edges
+        shape = (SHAPE[AXES["Sex"]], len(GRID_AGES) + 1, len(edges) + 1)
+        self.counts = np.zeros(shape, dtype=np.int64) if counts is None else counts
+        self._cumulative = None
+
+    @classmethod
+    def from_frame(cls, df, column):
+        """Indexes a cohort's Sex, Age and ``column`` in one pass."""
+        edges = VALUE_EDGES[column]
+        n_age, n_bins = len(GRID_AGES) + 1, len(edges) + 1
+        value_bins = np.searchsorted(edges, df[column].to_numpy(), side="right")
+        flat = (dimension_codes(df, "Sex") * n_age + grid_age_codes(df)) * n_bins + value_bins
+        counts = np.bincount(flat, minlength=SHAPE[AXES["Sex"]] * n_age * n_bins)
+        return cls(edges, counts.reshape(-1, n_age, n_bins))
+
+    def __iadd__(self, other):
+        self.counts += other.counts
+        self._cumulative = None
+        return self
+
+    def __add__(self, other):
+        return ValueIndex(self.edges, self.counts + other.counts)
+
+    def _bin_span(self, low, high):
+        # Thresholds lie on the grid, so values below/above it are always outside [low, high]
+        return np.searchsorted(self.edges, low, side="right"), np.searchsorted(self.edges, high, side="right") + 1
+
+    def range_counts(self, low, high, inside=True):
+        """Counts by (Sex, Age) of values within [low, high], or outside it."""
+        if self._cumulative is None:
+            cumulative = np.zeros(self.counts.shape[:2] + (self.counts.shape[2] + 1,), dtype=np.int64)
+            np.cumsum(self.counts, axis=2, out=cumulative[..., 1:])
+            self._cumulative = cumulative
+        start, stop = self._bin_span(low, high)
+        within = self._cumulative[..., stop] - self._cumulative[..., start]
+        return within if inside else self._cumulative[..., -1] - within
+
+    def hist2d(self, low, high, inside=True):
+        """Age x value counts on (AGE_EDGES, edges) of values within [low, high], or outside it."""
+        grid = self.counts[:, :len(AGE_EDGES) - 1, 1:-1].sum(axis=0)
+        start, stop = self._bin_span(low, high)
+        bins = np.arange(1, len(self.edges))
+        within = (bins >= start) & (bins < stop)
+        return grid * (within if inside else ~within)
+
+
+class SortedIndex:
+    """A cohort's row positions ordered by one column's values."""
+    __slots__ = ("rows", "values")
+
+    def __init__(self, rows, values):
+        order = np.argsort(values, kind="stable")
+        self.rows = rows[order]
+        self.values = values[order]
+
+    def extended(self, rows, values):
+        """A new index with more rows merged in; they must come after every row already indexed.
+
+        Only the new rows are sorted. Placing them after equal values keeps the order a stable
+        sort of all the rows would give.
+        """
+        order = np.argsort(values, kind="stable")
+        rows, values = rows[order], values[order]
+        at = np.searchsorted(self.values, values, side="right")
+        index = SortedIndex.__new__(SortedIndex)
+        index.rows = np.insert(self.rows, at, rows)
+        index.values = np.insert(self.values, at, values)
+        return index
+
+    def span(self, low, high):
+        """(start, stop) of the values within [low, high]."""
+        return np.searchsorted(self.values, low, side="left"), np.searchsorted(self.values, high, side="right")
+
+    def positions(self, low, high, inside=True):
+        """Row positions with values within [low, high] (a view), or outside it."""
+        start, stop = self.span(low, high)
+        if inside:
+            return self.rows[start:stop]
+        return np.concatenate([self.rows[:start], self.rows[stop:]])
+
+
+class SegmentedSortedIndex:
+    """Sorted indexes of consecutive row segments (at row ``offsets``), queried as one index of all their rows."""
+    __slots__ = ("indexes", "offsets")
+
+    def __init__(self, indexes, offsets):
+        self.indexes = indexes
+        self.offsets = offsets
+
+    def positions(self, low, high, inside=True):
+        """Row positions with values within [low, high], or outside it, ordered as by one SortedIndex."""
+        rows, values = [], []
+        for index, offset in zip(self.indexes, self.offsets):
+            start, stop = index.span(low, high)
+            selection = slice(start, stop) if inside else np.r_[0:start, stop:len(index.rows)]
+            rows.append(index.rows[selection] + offset)
+            values.append(index.values[selection])
+        rows, values = np.concatenate(rows), np.concatenate(values)
+        return rows[np.lexsort((rows, values))] # By value, then position, as a stable sort gives
+
+
+class ThresholdView(CubeCohortsMixin, BinnedCohortsMixin):
+    """A shared cohort container seen through one set of clinical thresholds.
+
+    Threshold cohorts are answered from the container's indexes and memoized in the view;
+    every other cohort and attribute is delegated to the container, so its memos keep
+    being shared.
+    """
+    __slots__ = ("base", "thresholds", "_slices", "_kdes")
+
+    def __init__(self, base, thresholds):
+        self.base = base
+        self.thresholds = thresholds
+        self._slices = {}
+        self._kdes = {}
+
+    def __getattr__(self, attr):
+        return getattr(self.base, attr)
+
+    def _split(self, name):
+        parent, column, inside = THRESHOLD_COHORTS[name]
+        low, high = normal_range(column, self.thresholds)
+        return parent, column, low, high, inside
+
+    def _cohort_slice(self, name):
+        if name not in THRESHOLD_COHORTS:
+            return self.base._cohort_slice(name)
+        cohort = self._slices.get(name)
+        if cohort is None:
+            parent, column, low, high, inside = self._split(name)
+            cohort = (self.base.value_index(parent, column).range_counts(low, high, inside), None)
+            self._slices[name] = cohort
+        return cohort
+
+    def hist2d(self, name, column):
+        """Age x ``column`` counts on (AGE_EDGES, VALUE_EDGES[column])."""
+        if name not in THRESHOLD_COHORTS:
+            return self.base.hist2d(name, column)
+        parent, index_column, low, high, inside = self._split(name)
+        if column != index_column:
+            raise KeyError(f"No {column} histogram is indexed for cohort '{name}'")
+        return self.base.value_index(parent, column).hist2d(low, high, inside)
+
+    def kde(self, name, column=None, sex=None):
+        if name not in THRESHOLD_COHORTS:
+            return self.base.kde(name, column, sex)
+        return BinnedCohortsMixin.kde(self, name, column, sex)
+
+    def rows(self, name):
+        if name not in THRESHOLD_COHORTS:
+            return self.base.rows(name)
+        parent, column, low, high, inside = self._split(name)
+        return self.base.sorted_index(parent, column).positions(low, high, inside)
+
+    def subset(self, name, columns=None):
+        """Returns the cohort rows, optionally limited to ``columns``."""
+        return self.base.take(self.rows(name), columns)
+
+    def column(self, name, column):
+        """Returns a single column of a cohort as a Series."""
+        return self.base.take(self.rows(name), [column])[column]
+
+    def sample(self, name, column, n):
+        """Age and ``column`` values of a seeded sample of ``n`` of a cohort's points."""
+        if name not in THRESHOLD_COHORTS:
+            return self.base.sample(name, column, n)
+        parent, index_column, low, high, inside = self._split(name)
+        if self.base.has_rows:
+            return self.base.sample_split(parent, index_column, low, high, inside, column, n)
+        # Aggregates keep a reservoir per parent cohort, split here at the thresholds
+        reservoir = self.base.reservoir(parent, index_column)
+        within = (reservoir.values >= low) & (reservoir.values <= high)
+        return reservoir.sample(n, within if inside else ~within)
+
+
+def with_thresholds(cohorts, thresholds=None):
+    """Views ``cohorts`` through ``thresholds`` (missing keys take their defaults)."""
+    if cohorts is None:
+        return None
+    if isinstance(cohorts, ThresholdView):
+        cohorts = cohorts.base
+    return ThresholdView(cohorts, {**DEFAULT_THRESHOLDS, **(thresholds or {})})
+
@@ -0,0 +1,150 @@
+import streamlit as st
+import pyarrow as pa
+from pyarrow import feather
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from data_loader import concat_typed, read_heart_csv_chunks, table_to_frame, write_typed_feather
+from profiling import span
+
+# --- Upload cache ---
+# Uploads are keyed by the SHA-256 of their contents, hashed block by block as they are read.
+# The upload is read only once: a new one is parsed from the bytes just hashed, one block at a
+# time, into the typed schema and stored under
+# UPLOAD_CACHE_DIR as an uncompressed Feather file named by its hash, so the same file uploaded
+# again, from any session, is a lookup rather than a parse. Parsed frames are memory-mapped
+# from those files and kept in a process-wide LRU; both tiers have a byte budget.
+UPLOAD_CACHE_DIR = os.environ.get("HEART_UPLOAD_CACHE_DIR", "cache/uploads")
+MAX_DISK_BYTES = int(os.environ.get("HEART_UPLOAD_CACHE_DISK_MB", 1024)) << 20
+MAX_MEMORY_BYTES = int(os.environ.get("HEART_UPLOAD_CACHE_MEMORY_MB", 256)) << 20
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def read_contents(file, block_size=HASH_BLOCK_SIZE):
+    """Reads a file-like object's contents once, in blocks; returns (SHA-256 hex digest, contents)."""
+    digest = hashlib.sha256()
+    contents = bytearray()
+    file.seek(0)
+    for block in iter(lambda: file.read(block_size), b""):
+        digest.update(block)
+        contents += block
+    return digest.hexdigest(), contents
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(index=False, deep=False).sum())
+
+
+class UploadCache:
+    """Content-addressed cache of parsed uploads: typed Feather files on disk, frames in memory."""
+
+    def __init__(self, directory=UPLOAD_CACHE_DIR, max_disk_bytes=MAX_DISK_BYTES, max_memory_bytes=MAX_MEMORY_BYTES):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self._parse_lock = threading.Lock()
+
+    def path(self, digest):
+        return os.path.join(self.directory, f"{digest}.feather")
+
+    def load(self, file):
+        """Returns the typed frame of an uploaded file-like, parsing it only if its contents are new.
+
+        The frame is shared and read-only; its ``attrs["fingerprint"]`` identifies the contents.
+        """
+        with span("load.hash_upload"):
+            digest, contents = read_contents(file)
+        df = self._get(digest)
+        if df is not None:
+            return df
+        # One parse per upload, however many sessions submit it at once
+        with self._parse_lock:
+            df = self._get(digest, count=False)
+            if df is None:
+                df = self._read_disk(digest)
+                if df is None:
+                    self.misses += 1
+                    with span("load.parse_csv"):
+                        df = concat_typed(read_heart_csv_chunks(pa.BufferReader(pa.py_buffer(contents))))
+                    if df is None:
+                        return None
+                    with span("load.write_sidecar"):
+                        if write_typed_feather(self._entry_path(digest), df):
+                            self._evict_disk()
+                            mapped = self._read_disk(digest) # Swaps the parsed frame for a view of the file
+                            df = df if mapped is None else mapped
+                else:
+                    self.disk_hits += 1
+                df.attrs["fingerprint"] = f"upload:{digest}"
+                self._put(digest, df)
+        return df
+
+    def _entry_path(self, digest):
+        os.makedirs(self.directory, exist_ok=True)
+        return self.path(digest)
+
+    def _get(self, digest, count=True):
+        with self._lock:
+            df = self._frames.get(digest)
+            if df is not None:
+                self._frames.move_to_end(digest)
+                if count:
+                    self.hits += 1
+            return df
+
+    def _put(self, digest, df):
+        nbytes = frame_nbytes(df)
+        if nbytes > self.max_memory_bytes:
+            return
+        with self._lock:
+            self._frames[digest] = df
+            self.memory_bytes += nbytes
+            while self.memory_bytes > self.max_memory_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.memory_bytes -= frame_nbytes(evicted)
+
+    def _read_disk(self, digest):
+        path = self.path(digest)
+        try:
+            with span("load.read_sidecar"):
+                table = feather.read_table(path, memory_map=True)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        os.utime(path) # Marks it recently used for disk eviction
+        return table_to_frame(table)
+
+    def _evict_disk(self):
+        """Removes the least recently used files until the directory is within its budget."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".feather"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries)[:-1]: # Never the newest, which was just written
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path) # Frames mapped from it stay readable until released
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._frames), "bytes": self.memory_bytes, "max_bytes": self.max_memory_bytes,
+                    "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+@st.cache_resource
+def get_upload_cache():
+    """The process-wide upload cache."""
+    return UploadCache()
@@ -0,0 +1,281 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from binning import AGE_EDGES, VALUE_EDGES, centers
+from kde import iso_proportion_levels
+from data_loader import PAIN_TYPES
+from schema import PAIN_TITLES
+from thresholds import with_thresholds
+
+# --- Browser-side rendering ---
+# Vega-Lite counterparts of the four matplotlib charts, drawn by the browser. Every layer is
+# built from binned data (KDE grids, occupied grid cells with their counts, per-age means), so
+# the spec size is bounded by the grids rather than the row count. Pan/zoom and the scatter
+# alpha are handled client-side: point opacity is computed in the spec from each cell's count.
+# Filled KDE contours become rectangles shaded by iso-proportion band.
+MAX_VALUE_BINS = 160 # Value axes with more bins than this (Cholesterol) are coarsened
+AGE_DOMAIN = [25, 85]
+
+
+def scatter_alpha_param(value):
+    """A browser-side scatter alpha slider shared by every panel of a chart."""
+    return alt.param(name="scatter_alpha", value=value,
+                     bind=alt.binding_range(min=0.05, max=1.0, step=0.05, name="Scatter alpha "))
+
+
+def _coarsen(grid, edges, max_bins=MAX_VALUE_BINS, reduce=np.sum):
+    """Merges adjacent value bins (axis 1) until there are at most ``max_bins``."""
+    factor = -(-(len(edges) - 1) // max_bins)
+    if factor == 1:
+        return grid, edges
+    n = (len(edges) - 1) // factor * factor
+    merged = reduce(grid[:, :n].reshape(grid.shape[0], -1, factor), axis=2)
+    return merged, edges[:n + 1:factor]
+
+
+def density_1d_frame(kde, bw_adjust, scale=1.0, series=""):
+    """A 1-D KDE on the age grid as (Age, density, series) rows; None when there is nothing to draw."""
+    density = kde.density(bw_adjust)
+    if density is None:
+        return None
+    return pd.DataFrame({"Age": centers(kde.edges[0]), "density": density * scale, "series": series})
+
+
+def age_density_layer(frames, colors, fill=True):
+    """Age density curves (one per series), filled like the matplotlib KDEs when ``fill``."""
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return None
+    data = pd.concat(frames, ignore_index=True)
+    color = alt.Color("series:N", scale=alt.Scale(domain=list(colors), range=list(colors.values())), legend=None)
+    x = alt.X("Age:Q", scale=alt.Scale(domain=AGE_DOMAIN), axis=None)
+    y = alt.Y("density:Q", axis=None)
+    line = alt.Chart(data).mark_line(strokeWidth=1).encode(x=x, y=y, color=color)
+    if not fill:
+        return line
+    return alt.Chart(data).mark_area(opacity=0.25).encode(x=x, y=y, color=color) + line
+
+
+def density_2d_layer(kde, scheme, column, bw_adjust=1.0, fill=True):
+    """Cells inside the iso-proportion density levels, shaded by level like ``contourf``."""
+    density = kde.density(bw_adjust)
+    if density is None or not density.any():
+        return None
+    levels = iso_proportion_levels(density)
+    if len(levels) < 2:
+        return None
+    band = np.searchsorted(levels, density, side="right")
+    band, value_edges = _coarsen(band, VALUE_EDGES[column], reduce=np.max)
+    ix, iy = np.nonzero(band)
+    data = pd.DataFrame({"x": AGE_EDGES[ix], "x2": AGE_EDGES[ix + 1], "y": value_edges[iy], "y2": value_edges[iy + 1],
+                         "level": band[ix, iy]})
+    return alt.Chart(data).mark_rect(opacity=1.0 if fill else 0.35).encode(
+        x=alt.X("x:Q"), x2="x2", y=alt.Y("y:Q"), y2="y2",
+        color=alt.Color("level:O", scale=alt.Scale(scheme=scheme), legend=None),
+    )
+
+
+def scatter_cells_layer(counts, column, color, alpha=None, size=20):
+    """One point per occupied grid cell; its opacity is what ``count`` overlapping points of ``alpha`` give.
+
+    ``alpha`` may be a number or the browser-side scatter_alpha parameter.
+    """
+    counts, value_edges = _coarsen(counts, VALUE_EDGES[column])
+    ix, iy = np.nonzero(counts)
+    if len(ix) == 0:
+        return None
+    data = pd.DataFrame({"Age": centers(AGE_EDGES)[ix], column: centers(value_edges)[iy], "count": counts[ix, iy]})
+    alpha_expr = "scatter_alpha" if isinstance(alpha, alt.Parameter) else str(1.0 if alpha is None else alpha)
+    return alt.Chart(data).mark_circle(size=size, color=color).transform_calculate(
+        opacity=f"1 - pow(1 - {alpha_expr}, datum.count)"
+    ).encode(
+        x=alt.X("Age:Q"),
+        y=alt.Y(f"{column}:Q"),
+        opacity=alt.Opacity("opacity:Q", scale=None),
+        tooltip=["Age:Q", f"{column}:Q", "count:Q"],
+    )
+
+
+def rule_layer(values, label=None, label_y=None):
+    """Dashed horizontal reference lines, with an optional label left of the plot."""
+    rules = alt.Chart(pd.DataFrame({"y": values})).mark_rule(strokeDash=[4, 4], color="black", opacity=0.3).encode(
+        y=alt.Y("y:Q"))
+    if label is None:
+        return rules
+    text = alt.Chart(pd.DataFrame({"y": [label_y], "text": [label]})).mark_text(
+        align="left", x=4, dy=-6, fontSize=10, lineBreak="\n").encode(y=alt.Y("y:Q"), text="text:N")
+    return rules + text
+
+
+def _set_axes(chart, y_domain, y_title):
+    # Panels mix field names (x/Age, y/RestingBP, ...), so the shared scales and titles are set on every layer
+    if isinstance(chart, alt.LayerChart):
+        for layer in chart.layer:
+            _set_axes(layer, y_domain, y_title)
+        return
+    for channel, domain, title in (("x", AGE_DOMAIN, "Age"), ("y", y_domain, y_title)):
+        encoding = getattr(chart.encoding, channel)
+        if encoding is not alt.Undefined: # Rules and labels only position along one axis
+            encoding.scale = alt.Scale(domain=domain)
+            encoding.title = title
+
+
+def panel(layers, title, y_domain, y_title="", width=380, height=300):
+    """Layers the non-empty layers into one titled, pan/zoomable plot on shared axes."""
+    layers = [layer for layer in layers if layer is not None] # Freshly built, so set in place
+    for layer in layers:
+        _set_axes(layer, y_domain, y_title)
+    if not layers:
+        return alt.Chart(pd.DataFrame({"x": []})).mark_point().properties(title=title, width=width, height=height)
+    return alt.layer(*layers).resolve_scale(color="independent").properties(
+        title=title, width=width, height=height).interactive()
+
+
+def age_panel(layer, title, width=380):
+    """A small axis-less age density plot."""
+    if layer is None:
+        return alt.Chart(pd.DataFrame({"x": []})).mark_point().properties(title=title, width=width, height=70)
+    return layer.properties(title=title, width=width, height=70)
+
+
+# --- Charts ---
+def build_bp_chart(cohorts, kde_bw_adjust=2.0, scatter_alpha=0.5, kde_shade=True, thresholds=None):
+    """Vega-Lite Blood Pressure vs. Age chart."""
+    cohorts = with_thresholds(cohorts, thresholds)
+    bp_min, bp_max = cohorts.thresholds["bp_low"], cohorts.thresholds["bp_high"]
+    alpha = scatter_alpha_param(scatter_alpha)
+    top, bottom = [], []
+    for group, colors, scheme in [("healthy", ("#0000FF", "#ADD8E6"), "blues"), ("diseased", ("#FF0000", "#FFA07A"), "reds")]:
+        strong, light = colors
+        density = density_1d_frame(cohorts.kde(group), kde_bw_adjust, series=group)
+        top.append(age_panel(age_density_layer([density], {group: strong}, kde_shade),
+                             f"Age Distribution ({group.title()})"))
+        bottom.append(panel([
+            density_2d_layer(cohorts.kde(f"normal_bp_{group}", "RestingBP"), scheme, "RestingBP", bw_adjust=.5, fill=kde_shade),
+            scatter_cells_layer(cohorts.hist2d(f"abnormal_bp_{group}", "RestingBP"), "RestingBP", light, alpha),
+            scatter_cells_layer(cohorts.hist2d(f"normal_bp_{group}", "RestingBP"), "RestingBP", strong),
+            rule_layer([bp_min - 0.5, bp_max + 0.5], f"Normal BP\n({bp_min}-{bp_max} mmHg)", bp_max),
+        ], f"{group.title()}: Age vs Resting BP", [80, 210], "Resting BP"))
+    return alt.vconcat(alt.hconcat(*top), alt.hconcat(*bottom)).add_params(alpha)
+
+
+def build_cholesterol_chart(cohorts, kde_bw_adjust=2.0, scatter_alpha=0.3, kde_shade=True, thresholds=None):
+    """Vega-Lite Cholesterol vs. Age chart."""
+    cohorts = with_thresholds(cohorts, thresholds)
+    threshold = cohorts.thresholds["cholesterol_high"]
+    alpha = scatter_alpha_param(scatter_alpha)
+    top, bottom = [], []
+    groups = [("healthy", ("#0000FF", "#FFC0CB"), ("#0000FF", "#ADD8E6"), "blues"),
+              ("diseased", ("#FF0000", "#FFA07A"), ("#FF0000", "#FFA07A"), "reds")]
+    for group, sex_colors, colors, scheme in groups:
+        kdes = [cohorts.kde(group, sex="M"), cohorts.kde(group, sex="F")]
+        total = sum(kde.n for kde in kdes)
+        frames = [density_1d_frame(kde, kde_bw_adjust, scale=kde.n / total, series=f"{group}-{sex}")
+                  for kde, sex in zip(kdes, "MF")] if total else []
+        male, female = (cohorts.sex_pct(f"abnormal_cls_{group}", sex) for sex in "MF")
+        top.append(age_panel(age_density_layer(frames, dict(zip([f"{group}-M", f"{group}-F"], sex_colors)), kde_shade),
+                             f"Age Distribution by Sex ({group.title()}): high cholesterol {male:.1f}% M / {female:.1f}% F"))
+        strong, light = colors
+        bottom.append(panel([
+            density_2d_layer(cohorts.kde(f"abnormal_cls_{group}", "Cholesterol"), scheme, "Cholesterol", bw_adjust=.5,
+                             fill=kde_shade),
+            scatter_cells_layer(cohorts.hist2d(f"abnormal_cls_{group}", "Cholesterol"), "Cholesterol", strong),
+            scatter_cells_layer(cohorts.hist2d(f"normal_cls_{group}", "Cholesterol"), "Cholesterol", light, alpha),
+            rule_layer([threshold], f"High cholesterol > {threshold} mg/dL", threshold),
+        ], f"{group.title()}: Age vs Cholesterol", [-5, 650], "Cholesterol"))
+    return alt.vconcat(alt.hconcat(*top), alt.hconcat(*bottom)).add_params(alpha)
+
+
+def build_ecg_chart(cohorts, kde_bw_adjust=2.0, scatter_alpha=0.5, kde_shade=True, thresholds=None):
+    """Vega-Lite Resting ECG vs. BP chart for diseased patients (None if there are none)."""
+    if cohorts is None or cohorts.empty("diseased"):
+        return None
+    cohorts = with_thresholds(cohorts, thresholds)
+    bp_min, bp_max = cohorts.thresholds["bp_low"], cohorts.thresholds["bp_high"]
+    alpha = scatter_alpha_param(scatter_alpha)
+    top, bottom = [], []
+    for ecg, label in [("normal", "ECG Normal"), ("st", "ECG ST"), ("lvh", "ECG LVH")]:
+        name = f"resting_ecg_{ecg}_bp_dis"
+        frames = []
+        if not cohorts.empty(name):
+            kdes = [cohorts.kde(name, sex="M"), cohorts.kde(name, sex="F")]
+            total = sum(kde.n for kde in kdes)
+            frames = [density_1d_frame(kde, kde_bw_adjust, scale=kde.n / total, series=f"{ecg}-{sex}")
+                      for kde, sex in zip(kdes, "MF")]
+        male, female = cohorts.sex_pct(name, "M"), cohorts.sex_pct(name, "F")
+        top.append(age_panel(age_density_layer(frames, {f"{ecg}-M": "#FF0000", f"{ecg}-F": "#FFA07A"}, kde_shade),
+                             f"Age Dist by Sex ({label}): {male:.1f}% M / {female:.1f}% F", width=260))
+        layers = [rule_layer([bp_min - 0.5, bp_max + 0.5], f"Normal BP\n({bp_min}-{bp_max} mmHg)", bp_max)]
+        if not cohorts.empty(name):
+            layers = [density_2d_layer(cohorts.kde(name, "RestingBP"), "reds", "RestingBP", bw_adjust=0.5, fill=kde_shade),
+                      scatter_cells_layer(cohorts.hist2d(name, "RestingBP"), "RestingBP", "#FF0000", alpha)] + layers
+        bottom.append(panel(layers, f"{label}: Age vs Resting BP", [80, 210], "Resting BP", width=260))
+    return alt.vconcat(alt.hconcat(*top), alt.hconcat(*bottom)).add_params(alpha)
+
+
+def build_angina_chart(cohorts, interpolation_kind='cubic', confidence_bands=False):
+    """Vega-Lite Exercise Angina vs Max HR chart for diseased patients (None if there are none).
+
+    ``confidence_bands`` shades bootstrap confidence bands around the mean lines.
+    """
+    if cohorts is None or cohorts.empty("diseased"):
+        return None
+    from angina_visualization import interpolate_means # Loads the matplotlib chart module only for this chart
+
+    def mean_by_age(name):
+        return None if cohorts.empty(name) else cohorts.mean_maxhr_by_age(name)
+
+    def line_layer(means, color, kind=None, **mark):
+        if kind is not None:
+            ages, maxhr = interpolate_means(means, kind)
+            if ages is None:
+                return None
+            means = pd.DataFrame({"MaxHR": np.asarray(maxhr)}, index=pd.Index(np.asarray(ages), name="Age"))
+        if means is None:
+            return None
+        return alt.Chart(means.reset_index()).mark_line(color=color, **mark).encode(x=alt.X("Age:Q"), y=alt.Y("MaxHR:Q"))
+
+    def band_layer(name, color, kind=None, opacity=0.15):
+        band = cohorts.maxhr_band(name, kind) if confidence_bands else None
+        if band is None:
+            return None
+        ages, lower, upper = band
+        data = pd.DataFrame({"Age": np.asarray(ages, dtype=float), "lower": lower, "upper": upper})
+        return alt.Chart(data).mark_area(color=color, opacity=opacity).encode(
+            x=alt.X("Age:Q"), y=alt.Y("lower:Q"), y2="upper:Q")
+
+    def average_layer(line, color):
+        if line is None:
+            return None
+        average = line.data["MaxHR"].mean()
+        data = pd.DataFrame({"y": [average], "text": [f"Avg {average:.1f}"]})
+        return (alt.Chart(data).mark_rule(strokeDash=[4, 4], color=color, opacity=0.7).encode(y=alt.Y("y:Q"))
+                + alt.Chart(data).mark_text(align="right", x="width", dy=-6, color=color, fontWeight=600)
+                .encode(y=alt.Y("y:Q"), text="text:N"))
+
+    induced = line_layer(mean_by_age("angina_induced_dis"), "#FF0000", interpolation_kind)
+    main = panel([
+        band_layer("angina_induced_dis", "#FF0000", interpolation_kind),
+        band_layer("angina_not_induced_dis", "#A9A9A9", interpolation_kind, opacity=0.2),
+        scatter_cells_layer(cohorts.hist2d("angina_induced_dis", "MaxHR"), "MaxHR", "#FFA07A", alpha=0.1, size=10),
+        scatter_cells_layer(cohorts.hist2d("angina_not_induced_dis", "MaxHR"), "MaxHR", "#D3D3D3", alpha=0.1, size=10),
+        induced,
+        average_layer(induced, "#FF0000"),
+        line_layer(mean_by_age("angina_not_induced_dis"), "#A9A9A9", interpolation_kind, opacity=0.7),
+    ], "Diseased Patients: Max HR vs Age by Exercise Angina (red: induced, gray: not induced)", [80, 210],
+        "Max Heart Rate", width=520, height=420)
+
+    small = []
+    for pain in PAIN_TYPES:
+        pain_induced = line_layer(mean_by_age(f"angina_induced_{pain.lower()}_dis"), "#FF0000", point=True, strokeWidth=1)
+        small.append(panel([
+            band_layer(f"angina_induced_{pain.lower()}_dis", "#FF0000"),
+            band_layer(f"angina_not_induced_{pain.lower()}_dis", "#A9A9A9", opacity=0.2),
+            pain_induced,
+            average_layer(pain_induced, "#FF0000"),
+            line_layer(mean_by_age(f"angina_not_induced_{pain.lower()}_dis"), "#A9A9A9", point=True, strokeWidth=1,
+                       strokeDash=[2, 2], opacity=0.7),
+        ], f"Pain Type: {pain} ({PAIN_TITLES[pain]})", [80, 210], "Max HR", width=220,
+            height=170))
+    return alt.hconcat(main, alt.vconcat(alt.hconcat(*small[:2]), alt.hconcat(*small[2:])))
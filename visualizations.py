@@ -0,0 +1,116 @@
+import streamlit as st
+import importlib
+import threading
+
+# --- Visualization registry ---
+# Each dashboard chart is registered with the dotted paths of its builders and the controls it
+# takes, so the app, the background renderer and the export CLI share one list of charts. Chart
+# modules (and matplotlib, scipy or altair behind them) are imported the first time a chart is
+# built rather than at startup, so a new session paints without loading charts it never shows;
+# warm_up() imports them ahead of time.
+
+# Controls shared by the KDE/scatter charts
+SHARED_PARAMS = ("kde_bw_adjust", "scatter_alpha", "kde_shade")
+
+
+def resolve(path):
+    """Imports ``"module:attribute"`` and returns the attribute."""
+    module, attribute = path.split(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+class Visualization:
+    """A registered chart: its figure (matplotlib) and chart (Vega-Lite) builders and its controls.
+
+    ``params`` name the dashboard controls passed to the builders as keyword arguments and
+    ``thresholds`` the clinical thresholds passed as ``thresholds``; ``description`` is a
+    format string over the thresholds. ``densities`` ({panel title: (cohort, column)}) are the
+    Age x value densities the chart draws, compared across datasets by difference maps.
+    """
+    __slots__ = ("label", "figure_builder", "chart_builder", "params", "thresholds", "description", "densities")
+
+    def __init__(self, label, figure_builder, chart_builder=None, params=(), thresholds=(), description="",
+                 densities=None):
+        self.label = label
+        self.figure_builder = figure_builder
+        self.chart_builder = chart_builder
+        self.params = tuple(params)
+        self.thresholds = tuple(thresholds)
+        self.description = description
+        self.densities = dict(densities or {})
+
+    def build_figure(self, cohorts, **params):
+        return resolve(self.figure_builder)(cohorts, **params)
+
+    def build_chart(self, cohorts, **params):
+        return resolve(self.chart_builder)(cohorts, **params)
+
+    def chart_params(self, controls):
+        """The builder keyword arguments out of every control's current value (``controls``)."""
+        params = {name: controls[name] for name in self.params}
+        if self.thresholds:
+            params["thresholds"] = {key: controls["thresholds"][key] for key in self.thresholds}
+        return params
+
+    def describe(self, thresholds):
+        return self.description.format(**thresholds)
+
+    def modules(self, browser=False):
+        builders = [self.figure_builder] + ([self.chart_builder] if browser and self.chart_builder else [])
+        return [builder.split(":")[0] for builder in builders]
+
+
+VISUALIZATIONS = {}
+
+
+def register(label, figure_builder, chart_builder=None, **options):
+    """Adds a chart to the dashboard (in registration order); see Visualization for the options."""
+    VISUALIZATIONS[label] = Visualization(label, figure_builder, chart_builder, **options)
+    return VISUALIZATIONS[label]
+
+
+def warm_up(labels=None, browser=False):
+    """Imports the modules of the given charts (all by default), so building them does not have to."""
+    for label in labels or VISUALIZATIONS:
+        for module in VISUALIZATIONS[label].modules(browser):
+            importlib.import_module(module)
+
+
+@st.cache_resource
+def start_warm_up(browser=False):
+    """Warms up every chart in a background thread, once per process."""
+    thread = threading.Thread(target=warm_up, kwargs=dict(browser=browser), name="chart-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Charts ---
+register(
+    "Blood Pressure vs Age", "bp_visualization:build_bp_figure", "vega_charts:build_bp_chart",
+    params=SHARED_PARAMS, thresholds=("bp_low", "bp_high"),
+    densities={"Normal BP, healthy": ("normal_bp_healthy", "RestingBP"),
+               "Normal BP, diseased": ("normal_bp_diseased", "RestingBP")},
+    description="Comparing Resting Blood Pressure against Age for Healthy and Diseased individuals. The dashed lines indicate a 'normal' BP range ({bp_low}-{bp_high} mmHg).",
+)
+register(
+    "Cholesterol vs Age", "cholesterol_visualization:build_cholesterol_figure", "vega_charts:build_cholesterol_chart",
+    params=SHARED_PARAMS, thresholds=("cholesterol_high",),
+    densities={"High cholesterol, healthy": ("abnormal_cls_healthy", "Cholesterol"),
+               "High cholesterol, diseased": ("abnormal_cls_diseased", "Cholesterol")},
+    description="Comparing Cholesterol levels against Age for Healthy and Diseased individuals, broken down by sex in the top plots. The dashed line indicates the threshold for 'high' cholesterol (> {cholesterol_high} mg/dL). Note: Cholesterol values of 0 are plotted but excluded from KDE calculations.",
+)
+register(
+    "Angina vs Max HR", "angina_visualization:build_angina_figure", "vega_charts:build_angina_chart",
+    params=("interpolation_kind", "confidence_bands"),
+    densities={"Exercise-induced angina": ("angina_induced_dis", "MaxHR"),
+               "No exercise-induced angina": ("angina_not_induced_dis", "MaxHR")},
+    description="Analyzing the relationship between Maximum Heart Rate (MaxHR) and Age for Diseased patients, comparing those with and without Exercise-Induced Angina. Smaller plots show trends broken down by Chest Pain Type (TA, ATA, NAP, ASY).",
+)
+register(
+    "Resting ECG vs BP", "ecg_visualization:build_ecg_figure", "vega_charts:build_ecg_chart",
+    params=SHARED_PARAMS, thresholds=("bp_low", "bp_high"),
+    densities={"Normal ECG": ("resting_ecg_normal_bp_dis", "RestingBP"),
+               "ST-T wave abnormality": ("resting_ecg_st_bp_dis", "RestingBP"),
+               "Left ventricular hypertrophy": ("resting_ecg_lvh_bp_dis", "RestingBP")},
+    description="Comparing Resting Blood Pressure against Age for Diseased individuals, categorized by their Resting ECG results (Normal, ST, LVH). Top plots show age distribution by sex for each ECG category.",
+)